@@ -0,0 +1,123 @@
+"""
+arc_pruning.py
+Poda de arcos antes de construir el modelo (vrp_advanced_soft.py y derivados).
+Se calcula una máscara NxN de arcos posibles con aritmética vectorizada:
+- Ventanas: i -> j se descarta si saliendo de i lo antes posible (inicio de ventana + servicio)
+  se llega a j después del fin de su ventana. En soft las ventanas son blandas: la tolerancia
+  se aplica en ambos extremos (llegar antes a i y llegar tarde a j)
+- Capacidad: desde un pickup, la carga sigue a bordo en el próximo nodo de otro pedido;
+  si la suma kg/m3 de ambos pedidos supera a todos los vehículos (refrigerados si alguno lo exige), se descarta
+- Precedencia: depot -> drop, pickup -> depot y drop -> su propio pickup nunca son válidos
+Los arcos descartados se quitan del dominio de NextVar, así la búsqueda local no los evalúa.
+
+Uso (desde vrp_advanced_soft.py):
+  python vrp_advanced_soft.py --prune_arcs 1 --prune_window_tol 60
+"""
+import numpy as np
+
+def _max_capacity(vehicles, refrig_only):
+    v = vehicles
+    if refrig_only:
+        ref = v['refrigerated'].astype(int) == 1
+        if ref.any():
+            v = v[ref]
+    return float(v['capacity_kg'].max()), float(v['capacity_m3'].max())
+
+def feasibility_mask(data, window_tol_min=60, check_windows=True):
+    """Máscara booleana NxN (True = arco posible) + estadísticas de lo podado por cada regla."""
+    nodes, vehicles, travel = data['nodes'], data['vehicles'], data['travel_min']
+    N = len(nodes)
+    tw_s = np.array([n['tw_start'] for n in nodes], dtype=np.int64)
+    tw_e = np.array([n['tw_end'] for n in nodes], dtype=np.int64)
+    svc = np.array([n['service_min'] for n in nodes], dtype=np.int64)
+    kg = np.abs(np.array([n['demand_kg'] for n in nodes], dtype=float))
+    m3 = np.abs(np.array([n['demand_m3'] for n in nodes], dtype=float))
+    ref = np.array([n['refrig_req'] for n in nodes], dtype=int) == 1
+    is_pick = np.array([n['type'] == 'pickup' for n in nodes])
+    is_drop = np.array([n['type'] == 'drop' for n in nodes])
+    # Etiqueta de pedido por nodo; con nodos consolidados (un nodo en varios pares) los pares ligados
+    # comparten etiqueta, así su carga no se cuenta dos veces en la regla de capacidad
+    pair = np.full(N, -1)
+    for k, (p, d) in enumerate(data['pd_pairs']):
+        labels = {int(pair[i]) for i in (p, d) if pair[i] >= 0}
+        pair[p] = pair[d] = k
+        for old in labels:
+            pair[pair == old] = k
+    off_diag = ~np.eye(N, dtype=bool)
+
+    # Ventanas (el depot no se poda por ventana: su llegada al final es libre)
+    window_bad = np.zeros((N, N), dtype=bool)
+    if check_windows:
+        earliest = np.maximum(tw_s - int(window_tol_min), 0)[:, None] + svc[:, None] + travel.astype(np.int64)
+        window_bad = earliest > (tw_e[None, :] + int(window_tol_min))
+        window_bad[0, :] = False
+        window_bad[:, 0] = False
+
+    # Capacidad: pickup i -> nodo de otro pedido j (ambos a bordo)
+    cap_kg, cap_m3 = _max_capacity(vehicles, refrig_only=False)
+    if ref.any() and not data.get('ignore_refrig', False):
+        rcap_kg, rcap_m3 = _max_capacity(vehicles, refrig_only=True)
+        any_ref = ref[:, None] | ref[None, :]
+        lim_kg = np.where(any_ref, rcap_kg, cap_kg)
+        lim_m3 = np.where(any_ref, rcap_m3, cap_m3)
+    else:
+        lim_kg, lim_m3 = cap_kg, cap_m3
+    both = is_pick[:, None] & (is_pick | is_drop)[None, :] & (pair[:, None] != pair[None, :])
+    over = ((kg[:, None] + kg[None, :]) > lim_kg) | ((m3[:, None] + m3[None, :]) > lim_m3 + 1e-9)
+    cap_bad = both & over
+
+    # Precedencia
+    prec_bad = np.zeros((N, N), dtype=bool)
+    prec_bad[0, is_drop] = True
+    prec_bad[is_pick, 0] = True
+    for p, d in data['pd_pairs']:
+        prec_bad[d, p] = True
+
+    bad = (window_bad | cap_bad | prec_bad) & off_diag
+    # Seguridad: un nodo sin ningún arco de entrada o salida volvería infactible el modelo
+    for i in range(1, N):
+        if not (~bad[i] & off_diag[i]).any():
+            bad[i] = prec_bad[i] & off_diag[i]
+        if not (~bad[:, i] & off_diag[:, i]).any():
+            bad[:, i] = prec_bad[:, i] & off_diag[:, i]
+
+    total = N * (N - 1)
+    stats = {
+        'arcs': total,
+        'pruned': int(bad.sum()),
+        'windows': int((window_bad & off_diag).sum()),
+        'capacity': int((cap_bad & off_diag).sum()),
+        'precedence': int((prec_bad & off_diag).sum()),
+    }
+    stats['pruned_pct'] = round(100.0 * stats['pruned'] / max(1, total), 2)
+    return ~bad, stats
+
+def prune(data, window_tol_min=60, check_windows=True):
+    """Calcula la máscara, la guarda en data['allowed_arcs'] e informa cuánto se podó."""
+    allowed, stats = feasibility_mask(data, window_tol_min, check_windows)
+    data['allowed_arcs'] = allowed
+    pct = lambda k: 100.0 * stats[k] / max(1, stats['arcs'])
+    print(f"[PRUNE] {stats['pruned']}/{stats['arcs']} arcos descartados ({stats['pruned_pct']}%): "
+          f"ventanas {pct('windows'):.1f}%, capacidad {pct('capacity'):.1f}%, precedencia {pct('precedence'):.1f}%")
+    return stats
+
+def apply_mask(manager, routing, allowed):
+    """Quita del dominio de NextVar los arcos no permitidos (el depot se mapea a starts/ends de cada vehículo)."""
+    N = allowed.shape[0]
+    n_veh = routing.vehicles()
+    ends = [routing.End(v) for v in range(n_veh)]
+    for i in range(N):
+        banned = np.flatnonzero(~allowed[i])
+        if banned.size == 0:
+            continue
+        values = []
+        for j in banned:
+            if j == 0:
+                values.extend(ends)
+            elif j != i:
+                values.append(manager.NodeToIndex(int(j)))
+        if not values:
+            continue
+        sources = [routing.Start(v) for v in range(n_veh)] if i == 0 else [manager.NodeToIndex(i)]
+        for s in sources:
+            routing.NextVar(s).RemoveValues(values)
@@ -1,33 +1,102 @@
-
 """
 compute_distances_sucursales.py
-Calcula distancias Haversine (km) entre todas las sucursales y exporta distancias_sucursales.csv.
+Calcula distancias Haversine (km) entre todas las sucursales y exporta distancias_sucursales.*
+- Se calcula por bloques de filas (vectorizado) y cada bloque se escribe a disco al momento:
+  la memoria queda acotada a block_rows x N, no a N x N filas de texto
+- Las distancias se leen del caché persistente (matrix_cache.py); solo se calculan sucursales nuevas
+- Formatos:
+    csv      largo origen,destino,km (compatible con la versión anterior)
+    npy      matriz cuadrada float32 (distancias_sucursales.npy) + índice distancias_sucursales_ids.csv
+    parquet  largo origen_id,destino_id,km (int32/float32) + índice (requiere pyarrow)
 
 Uso:
-  python compute_distances_sucursales.py
+  python compute_distances_sucursales.py [--format csv|npy|parquet] [--block_rows 256] [--matrix_cache .matrix_cache]
+
+Lectura del formato npy:
+  dist = np.load("distancias_sucursales.npy", mmap_mode="r")
+  ids  = pd.read_csv("distancias_sucursales_ids.csv")
 """
+import argparse
+import numpy as np
 import pandas as pd
-import math
+from matrix_cache import MatrixCache
+from distance_matrix import iter_distance_blocks
+
+OUT_BASE = "distancias_sucursales"
+
+def iter_blocks(suc, block_rows, matrix_cache):
+    """(inicio, fin, bloque km) por filas, desde el caché o calculando al vuelo."""
+    if matrix_cache:
+        cache = MatrixCache(matrix_cache, method="haversine")
+        idx = cache.indices(suc['lat'], suc['lon'])
+        print(f"[CACHE] {cache.computed_rows} sucursales nuevas calculadas")
+        for s in range(0, len(idx), block_rows):
+            e = min(len(idx), s + block_rows)
+            yield s, e, cache.block(idx[s:e], idx)
+    else:
+        yield from iter_distance_blocks(suc['lat'], suc['lon'], block_rows=block_rows)
 
-def haversine_km(lat1, lon1, lat2, lon2):
-    R = 6371.0
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1))*math.cos(math.radians(lat2))*math.sin(dlon/2)**2
-    c = 2*math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R*c
+def write_ids(suc):
+    path = f"{OUT_BASE}_ids.csv"
+    ids = pd.DataFrame({"id": np.arange(len(suc), dtype=np.int32), "sucursal": suc['sucursal'],
+                        "lat": suc['lat'], "lon": suc['lon']})
+    ids.to_csv(path, index=False)
+    return path
 
-def main():
+def long_block(s, e, block, n):
+    """Filas (origen, destino, km) de un bloque, sin la diagonal."""
+    rows = np.repeat(np.arange(s, e, dtype=np.int32), n)
+    cols = np.tile(np.arange(n, dtype=np.int32), e - s)
+    km = np.asarray(block, dtype=np.float32).ravel()
+    keep = rows != cols
+    return rows[keep], cols[keep], km[keep]
+
+def main(fmt="csv", block_rows=256, matrix_cache=".matrix_cache"):
     suc = pd.read_csv("sucursales.csv")
-    rows = []
-    for i, a in suc.iterrows():
-        for j, b in suc.iterrows():
-            if i == j: continue
-            km = haversine_km(a['lat'], a['lon'], b['lat'], b['lon'])
-            rows.append({"origen": a['sucursal'], "destino": b['sucursal'], "km": round(km, 3)})
-    out = pd.DataFrame(rows)
-    out.to_csv("distancias_sucursales.csv", index=False)
-    print(f"OK -> distancias_sucursales.csv ({len(out)} filas)")
+    n = len(suc)
+    blocks = iter_blocks(suc, block_rows, matrix_cache)
+
+    if fmt == "npy":
+        path = f"{OUT_BASE}.npy"
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n, n))
+        for s, e, block in blocks:
+            out[s:e] = block
+        out.flush()
+        del out
+        print(f"OK -> {path} ({n}x{n} float32) + {write_ids(suc)}")
+        return
+
+    if fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("El formato parquet requiere pyarrow (pip install pyarrow).")
+        path = f"{OUT_BASE}.parquet"
+        schema = pa.schema([("origen_id", pa.int32()), ("destino_id", pa.int32()), ("km", pa.float32())])
+        total = 0
+        with pq.ParquetWriter(path, schema) as writer:
+            for s, e, block in blocks:
+                r, c, km = long_block(s, e, block, n)
+                writer.write_table(pa.table({"origen_id": r, "destino_id": c, "km": np.round(km, 3)}, schema=schema))
+                total += len(r)
+        print(f"OK -> {path} ({total} filas) + {write_ids(suc)}")
+        return
+
+    path = f"{OUT_BASE}.csv"
+    names = suc['sucursal'].to_numpy()
+    total = 0
+    for s, e, block in blocks:
+        r, c, km = long_block(s, e, block, n)
+        pd.DataFrame({"origen": names[r], "destino": names[c], "km": np.round(km.astype(float), 3)}).to_csv(
+            path, index=False, mode="w" if s == 0 else "a", header=(s == 0))
+        total += len(r)
+    print(f"OK -> {path} ({total} filas)")
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--format", choices=["csv", "npy", "parquet"], default="csv")
+    ap.add_argument("--block_rows", type=int, default=256)
+    ap.add_argument("--matrix_cache", type=str, default=".matrix_cache", help="directorio del caché ('' = desactivar)")
+    args = ap.parse_args()
+    main(args.format, args.block_rows, args.matrix_cache)
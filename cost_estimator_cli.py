@@ -4,19 +4,31 @@ Cost Estimator (CLI) – acepta --routes
 Uso:
   pip install pandas
   python cost_estimator_cli.py --routes routes_plan_advanced.csv
+  python cost_estimator_cli.py --routes routes_plan_advanced.csv --profile 1   # trace JSON en traces/
 Si no se pasa --routes, intenta routes_plan.csv
 """
 import argparse, json, os
 import pandas as pd
+from profiling import span
+import profiling
 
 def main(routes_file=None):
     if routes_file is None:
         routes_file = "routes_plan.csv" if os.path.exists("routes_plan.csv") else "routes_plan_advanced.csv"
-    routes = pd.read_csv(routes_file)
-    veh = pd.read_csv("vehicles.csv")
-    with open("costs.json","r",encoding="utf-8") as f:
-        costs = json.load(f)
+    with span("load_inputs"):
+        routes = pd.read_csv(routes_file)
+        veh = pd.read_csv("vehicles.csv")
+        with open("costs.json","r",encoding="utf-8") as f:
+            costs = json.load(f)
 
+    with span("compute_costs", routes=len(routes)):
+        df = compute_costs(routes, veh, costs)
+    with span("export"):
+        write_outputs(df)
+
+    print(f"OK -> route_costs.csv y kpis_resumen.txt generados desde {routes_file}.")
+
+def compute_costs(routes, veh, costs):
     df = routes.merge(veh, on='vehicle_id', how='left', suffixes=('_route','_veh'))
     if 'vehicle_type' not in df.columns:
         if 'type_route' in df.columns: df.rename(columns={'type_route':'vehicle_type'}, inplace=True)
@@ -47,6 +59,10 @@ def main(routes_file=None):
     parts = ['combustible_ars','mantenimiento_ars','variable_km_ars','peajes_ars','fijo_diario_ars']
     df['costo_total_ars'] = df[parts].sum(axis=1)
 
+    return df
+
+def write_outputs(df):
+    parts = ['combustible_ars','mantenimiento_ars','variable_km_ars','peajes_ars','fijo_diario_ars']
     cols_out = ['vehicle_id','vehicle_type','route_sequence','km','total_load_kg'] + parts + ['costo_total_ars']
     for c in cols_out:
         if c not in df.columns:
@@ -65,10 +81,10 @@ def main(routes_file=None):
         for k,v in kpis.items():
             f.write(f"{k}: {v}\n")
 
-    print(f"OK -> route_costs.csv y kpis_resumen.txt generados desde {routes_file}.")
-
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--routes", type=str, default=None, help="Archivo de rutas (routes_plan_advanced.csv o routes_plan.csv)")
+    ap.add_argument("--profile", type=int, default=0, help="1 = trace JSON por etapa (o VRP_PROFILE=1)")
     args = ap.parse_args()
+    profiling.setup(args.profile, "cost_estimator_cli")
     main(args.routes)
@@ -7,20 +7,32 @@ Cost Estimator (fixed)
 Ejecutar:
     pip install pandas
     python cost_estimator_fixed.py
+    python cost_estimator_fixed.py --profile 1   # trace JSON por etapa en traces/ (o VRP_PROFILE=1)
 """
-import json
+import argparse, json
 import pandas as pd
+from profiling import span
+import profiling
 
 ROUTES = "routes_plan.csv"
 VEH = "vehicles.csv"
 COSTS = "costs.json"
 
 def main():
-    routes = pd.read_csv(ROUTES)
-    veh = pd.read_csv(VEH)
-    with open(COSTS, "r", encoding="utf-8") as f:
-        costs = json.load(f)
+    with span("load_inputs"):
+        routes = pd.read_csv(ROUTES)
+        veh = pd.read_csv(VEH)
+        with open(COSTS, "r", encoding="utf-8") as f:
+            costs = json.load(f)
 
+    with span("compute_costs", routes=len(routes)):
+        df, used = compute_costs(routes, veh, costs)
+    with span("export"):
+        write_outputs(df, used)
+
+    print("OK -> route_costs.csv y kpis_resumen.txt generados (fixed).")
+
+def compute_costs(routes, veh, costs):
     # Normalizar nombres en 'routes'
     # En vrp_or_tools_demo.py exportamos 'vehicle_type' (no 'type')
     if 'vehicle_type' not in routes.columns and 'type' in routes.columns:
@@ -63,6 +75,10 @@ def main():
     parts = ['combustible_ars','mantenimiento_ars','variable_km_ars','peajes_ars','fijo_diario_ars']
     df['costo_total_ars'] = df[parts].sum(axis=1)
 
+    return df, used
+
+def write_outputs(df, used):
+    parts = ['combustible_ars','mantenimiento_ars','variable_km_ars','peajes_ars','fijo_diario_ars']
     cols_out = ['vehicle_id','vehicle_type','route_sequence','km','total_load_kg'] + parts + ['costo_total_ars']
     for c in cols_out:
         if c not in df.columns:
@@ -81,7 +97,9 @@ def main():
         for k,v in kpis.items():
             f.write(f"{k}: {v}\n")
 
-    print("OK -> route_costs.csv y kpis_resumen.txt generados (fixed).")
-
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profile", type=int, default=0, help="1 = trace JSON por etapa (o VRP_PROFILE=1)")
+    args = ap.parse_args()
+    profiling.setup(args.profile, "cost_estimator_fixed")
     main()
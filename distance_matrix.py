@@ -0,0 +1,110 @@
+"""
+distance_matrix.py
+Matrices de distancia y tiempo vectorizadas (NumPy) compartidas por los solvers VRP.
+- Haversine (esfera R=6371 km) o aproximación elipsoidal WGS84 (fórmula de Lambert, error ~10 m)
+- Se calcula por bloques de filas con broadcasting para acotar la memoria temporal
+- Devuelve km en float32 y minutos de viaje en int32 (matrices compactas)
+
+Uso:
+  from distance_matrix import build_matrices
+  dist_km, travel_min = build_matrices(lats, lons, speed_kmh=50)
+"""
+import numpy as np
+
+R_KM = 6371.0
+WGS84_A_KM = 6378.137
+WGS84_F = 1 / 298.257223563
+BLOCK_ROWS = 512
+METHODS = ("haversine", "ellipsoidal")
+
+def _as_radians(values):
+    return np.radians(np.asarray(values, dtype=np.float64).ravel())
+
+def _haversine_block(lat1, lon1, lat2, lon2):
+    """lat1/lon1 (filas, 1) contra lat2/lon2 (1, columnas), en radianes. Devuelve km."""
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat/2.0)**2 + np.cos(lat1)*np.cos(lat2)*np.sin(dlon/2.0)**2
+    return 2.0 * R_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def _lambert_block(lat1, lon1, lat2, lon2):
+    """Aproximación de Lambert sobre el elipsoide WGS84 (latitudes reducidas). Devuelve km."""
+    b1 = np.arctan((1 - WGS84_F) * np.tan(lat1))
+    b2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+    dlat = b2 - b1
+    dlon = lon2 - lon1
+    a = np.sin(dlat/2.0)**2 + np.cos(b1)*np.cos(b2)*np.sin(dlon/2.0)**2
+    sigma = 2.0 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    p = (b1 + b2) / 2.0
+    q = (b2 - b1) / 2.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = (sigma - np.sin(sigma)) * np.sin(p)**2 * np.cos(q)**2 / np.cos(sigma/2.0)**2
+        y = (sigma + np.sin(sigma)) * np.cos(p)**2 * np.sin(q)**2 / np.sin(sigma/2.0)**2
+        d = WGS84_A_KM * (sigma - WGS84_F / 2.0 * (x + y))
+    # sigma == 0 -> mismo punto (0/0)
+    return np.where(sigma > 0, d, 0.0)
+
+_KERNELS = {"haversine": _haversine_block, "ellipsoidal": _lambert_block}
+
+def iter_distance_blocks(lat, lon, lat2=None, lon2=None, method="haversine", block_rows=BLOCK_ROWS):
+    """Genera (fila_inicio, fila_fin, bloque_km float64) recorriendo las filas por bloques.
+    Si no se pasan lat2/lon2, las columnas son los mismos puntos (matriz cuadrada)."""
+    if method not in _KERNELS:
+        raise ValueError(f"Método de distancia desconocido: {method} (usar {', '.join(METHODS)})")
+    kernel = _KERNELS[method]
+    rlat, rlon = _as_radians(lat), _as_radians(lon)
+    if lat2 is None:
+        clat, clon = rlat, rlon
+    else:
+        clat, clon = _as_radians(lat2), _as_radians(lon2)
+    clat, clon = clat[None, :], clon[None, :]
+    n = len(rlat)
+    step = max(1, int(block_rows))
+    for start in range(0, n, step):
+        stop = min(n, start + step)
+        yield start, stop, kernel(rlat[start:stop, None], rlon[start:stop, None], clat, clon)
+
+def minutes_from_km(km, speed_kmh):
+    """Minutos de viaje redondeados hacia arriba, como int32."""
+    return np.ceil(np.asarray(km) / max(1e-6, float(speed_kmh)) * 60.0).astype(np.int32)
+
+def distance_km(lat, lon, lat2=None, lon2=None, method="haversine", block_rows=BLOCK_ROWS):
+    """Matriz de distancias en km (float32) entre todos los pares de puntos."""
+    n_cols = len(np.ravel(lon if lon2 is None else lon2))
+    out = np.empty((len(np.ravel(lat)), n_cols), dtype=np.float32)
+    for start, stop, block in iter_distance_blocks(lat, lon, lat2, lon2, method, block_rows):
+        out[start:stop] = block
+    return out
+
+def pair_km(lat1, lon1, lat2, lon2, method="haversine"):
+    """Distancia en km (float64) elemento a elemento entre dos listas de puntos del mismo largo."""
+    if method not in _KERNELS:
+        raise ValueError(f"Método de distancia desconocido: {method} (usar {', '.join(METHODS)})")
+    return _KERNELS[method](_as_radians(lat1), _as_radians(lon1), _as_radians(lat2), _as_radians(lon2))
+
+def build_matrices(lat, lon, speed_kmh, method="haversine", block_rows=BLOCK_ROWS):
+    """Devuelve (dist_km float32, travel_min int32) para todos los pares de nodos.
+    Los minutos se derivan del bloque en float64 antes de compactar a float32."""
+    n = len(np.ravel(lat))
+    dist = np.empty((n, n), dtype=np.float32)
+    mins = np.empty((n, n), dtype=np.int32)
+    for start, stop, block in iter_distance_blocks(lat, lon, None, None, method, block_rows):
+        dist[start:stop] = block
+        mins[start:stop] = minutes_from_km(block, speed_kmh)
+    return dist, mins
+
+def meters_matrix(lat, lon, method="haversine", block_rows=BLOCK_ROWS):
+    """Matriz de distancias en metros (int32, truncado como el demo original)."""
+    n = len(np.ravel(lat))
+    out = np.empty((n, n), dtype=np.int32)
+    for start, stop, block in iter_distance_blocks(lat, lon, None, None, method, block_rows):
+        out[start:stop] = (block * 1000.0).astype(np.int32)
+    return out
+
+if __name__ == "__main__":
+    # Chequeo rápido: Buenos Aires, La Plata, Córdoba
+    lat = np.array([-34.6037, -34.9214, -31.4201])
+    lon = np.array([-58.3816, -57.9545, -64.1888])
+    for m in METHODS:
+        print(m, np.round(distance_km(lat, lon, method=m), 2).tolist())
+    print("travel_min @50km/h", build_matrices(lat, lon, 50)[1].tolist())
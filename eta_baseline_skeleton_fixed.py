@@ -1,44 +1,44 @@
-
 """
 ETA baseline (fixed) con rutas históricas.
-- Lee routes_history.csv
+- Lee routes_history.csv por chunks (eta_features.py: agregados por viaje con memoria acotada);
+  --chunksize 0 vuelve a la carga completa en memoria
 - Calcula duración por viaje
 - Calcula distancia con Haversine vectorizado (NumPy)
 - Entrena un modelo simple (RandomForest) para predecir duración
+- Guarda el modelo entrenado (joblib) para la inferencia por lotes de eta_inference.py
 Requisitos:
     pip install pandas numpy scikit-learn
 Ejecución:
     python eta_baseline_skeleton_fixed.py
+    python eta_baseline_skeleton_fixed.py --profile 1   # trace JSON por etapa en traces/ (o VRP_PROFILE=1)
+    python eta_baseline_skeleton_fixed.py --model_out eta_model.joblib
+    python eta_baseline_skeleton_fixed.py --history history_parquet/ --chunksize 1000000 --sorted_trips 1
 """
+import argparse
+from datetime import datetime
+import joblib
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error
 from sklearn.ensemble import RandomForestRegressor
+from profiling import span
+import profiling
 
 RTE_PATH = "routes_history.csv"
+TRAINING_PATH = "eta_training_data.csv"
+MODEL_PATH = "eta_model.joblib"
+FEATURES = ['distance_km', 'hour', 'dow']
 
-# 1) Cargar datos
-df = pd.read_csv(RTE_PATH, parse_dates=['timestamp'])
-
-# Limpieza básica
-df = df.dropna(subset=['trip_id','lat','lon','timestamp']).copy()
-df['hour'] = df['timestamp'].dt.hour
-df['dow'] = df['timestamp'].dt.dayofweek
+def load_history(path=RTE_PATH):
+    # 1) Cargar datos
+    df = pd.read_csv(path, parse_dates=['timestamp'])
 
-# 2) Duración por viaje (en minutos)
-durations = df.groupby('trip_id', as_index=False).agg(
-    start=('timestamp','min'),
-    end=('timestamp','max')
-)
-durations['duration_min'] = (durations['end'] - durations['start']).dt.total_seconds() / 60.0
-
-# 3) Geometría por viaje (primera y última posición)
-trip_geo = df.groupby('trip_id', as_index=False).agg(
-    lat_first=('lat','first'), lon_first=('lon','first'),
-    lat_last=('lat','last'),   lon_last=('lon','last'),
-    hour=('hour','median'),    dow=('dow','median')
-)
+    # Limpieza básica
+    df = df.dropna(subset=['trip_id','lat','lon','timestamp']).copy()
+    df['hour'] = df['timestamp'].dt.hour
+    df['dow'] = df['timestamp'].dt.dayofweek
+    return df
 
 # 4) Haversine vectorizado (en km)
 def haversine_km_vec(lat1, lon1, lat2, lon2):
@@ -53,35 +53,93 @@ def haversine_km_vec(lat1, lon1, lat2, lon2):
     R = 6371.0
     return R * c
 
-trip_geo['distance_km'] = haversine_km_vec(
-    trip_geo['lat_first'], trip_geo['lon_first'],
-    trip_geo['lat_last'],  trip_geo['lon_last']
-)
-
-# 5) Merge y filtrado
-data = trip_geo.merge(durations[['trip_id','duration_min']], on='trip_id', how='inner')
-# Filtrar viajes demasiado cortos o sin duración (ruido de GPS)
-data = data.replace([np.inf, -np.inf], np.nan).dropna(subset=['distance_km','duration_min','hour','dow'])
-data = data[(data['distance_km'] > 0.05) & (data['duration_min'] > 2)]  # >50m y >2 min
-
-if len(data) < 3:
-    raise SystemExit(f"Hay muy pocos viajes válidos ({len(data)}) para entrenar. Agregá más histórico.")
-
-X = data[['distance_km','hour','dow']].astype(float)
-y = data['duration_min'].astype(float)
-
-Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.3, random_state=42)
-mdl = RandomForestRegressor(n_estimators=300, random_state=42)
-mdl.fit(Xtr, ytr)
-pred = mdl.predict(Xte)
-mae = mean_absolute_error(yte, pred)
-print(f"MAE ETA (minutos): {mae:.2f} con {len(X)} viajes")
-
-# 6) Ejemplo de uso
-example = np.array([[12.3, 11, 2]], dtype=float)  # 12.3 km, 11hs, miércoles (2)
-eta_min = mdl.predict(example)[0]
-print(f"ETA estimada para 12.3 km @ 11hs dow=2: {eta_min:.1f} minutos")
-
-# 7) Export mini-metricas
-data[['trip_id','distance_km','duration_min','hour','dow']].to_csv('eta_training_data.csv', index=False)
-print("Se exportó eta_training_data.csv con las features/targets usadas.")
+def trip_features(df):
+    """Una fila por viaje: distance_km, hour, dow y duration_min (target)."""
+    # 2) Duración por viaje (en minutos)
+    durations = df.groupby('trip_id', as_index=False).agg(
+        start=('timestamp','min'),
+        end=('timestamp','max')
+    )
+    durations['duration_min'] = (durations['end'] - durations['start']).dt.total_seconds() / 60.0
+
+    # 3) Geometría por viaje (primera y última posición)
+    trip_geo = df.groupby('trip_id', as_index=False).agg(
+        lat_first=('lat','first'), lon_first=('lon','first'),
+        lat_last=('lat','last'),   lon_last=('lon','last'),
+        hour=('hour','median'),    dow=('dow','median')
+    )
+
+    trip_geo['distance_km'] = haversine_km_vec(
+        trip_geo['lat_first'], trip_geo['lon_first'],
+        trip_geo['lat_last'],  trip_geo['lon_last']
+    )
+
+    # 5) Merge y filtrado
+    data = trip_geo.merge(durations[['trip_id','duration_min']], on='trip_id', how='inner')
+    # Filtrar viajes demasiado cortos o sin duración (ruido de GPS)
+    data = data.replace([np.inf, -np.inf], np.nan).dropna(subset=['distance_km','duration_min','hour','dow'])
+    data = data[(data['distance_km'] > 0.05) & (data['duration_min'] > 2)]  # >50m y >2 min
+    return data
+
+def train(data):
+    """Entrena el RandomForest. Devuelve (modelo, MAE en minutos)."""
+    X = data[FEATURES].astype(float)
+    y = data['duration_min'].astype(float)
+
+    Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.3, random_state=42)
+    mdl = RandomForestRegressor(n_estimators=300, random_state=42)
+    mdl.fit(Xtr, ytr)
+    pred = mdl.predict(Xte)
+    return mdl, mean_absolute_error(yte, pred)
+
+def save_model(mdl, mae, n_trips, path=MODEL_PATH):
+    """Modelo + metadatos (features en orden, MAE, viajes) en un solo archivo joblib."""
+    joblib.dump({'model': mdl, 'features': FEATURES, 'mae_min': float(mae), 'trips': int(n_trips),
+                 'trained': datetime.now().isoformat(timespec="seconds")}, path)
+
+def main(model_out=MODEL_PATH, history=RTE_PATH, chunksize=500_000, sorted_trips=False):
+    if chunksize > 0:
+        # Streaming: eta_training_data.csv se escribe durante la lectura y se entrena desde ahí
+        from eta_features import stream_features
+        with span("stream_features", chunksize=chunksize):
+            trips, pings = stream_features(history, TRAINING_PATH, chunksize, sorted_trips)
+        print(f"Se exportó {TRAINING_PATH} ({trips} viajes de {pings} pings, chunks de {chunksize}).")
+        data = pd.read_csv(TRAINING_PATH)
+    else:
+        with span("load_history"):
+            df = load_history(history)
+        with span("trip_features", rows=len(df)):
+            data = trip_features(df)
+
+    if len(data) < 3:
+        raise SystemExit(f"Hay muy pocos viajes válidos ({len(data)}) para entrenar. Agregá más histórico.")
+
+    with span("train", trips=len(data)):
+        mdl, mae = train(data)
+    print(f"MAE ETA (minutos): {mae:.2f} con {len(data)} viajes")
+    if model_out:
+        with span("save_model"):
+            save_model(mdl, mae, len(data), model_out)
+        print(f"Modelo guardado en {model_out}")
+
+    # 6) Ejemplo de uso
+    example = pd.DataFrame([[12.3, 11, 2]], columns=FEATURES, dtype=float)  # 12.3 km, 11hs, miércoles (2)
+    eta_min = mdl.predict(example)[0]
+    print(f"ETA estimada para 12.3 km @ 11hs dow=2: {eta_min:.1f} minutos")
+
+    # 7) Export mini-metricas
+    if chunksize <= 0:
+        with span("export"):
+            data[['trip_id','distance_km','duration_min','hour','dow']].to_csv(TRAINING_PATH, index=False)
+        print(f"Se exportó {TRAINING_PATH} con las features/targets usadas.")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profile", type=int, default=0, help="1 = trace JSON por etapa (o VRP_PROFILE=1)")
+    ap.add_argument("--model_out", type=str, default=MODEL_PATH, help="archivo joblib del modelo ('' = no guardar)")
+    ap.add_argument("--history", type=str, default=RTE_PATH, help="CSV o directorio/archivo parquet del histórico GPS")
+    ap.add_argument("--chunksize", type=int, default=500_000, help="filas por chunk (0 = cargar todo en memoria)")
+    ap.add_argument("--sorted_trips", type=int, default=0, help="1 = histórico agrupado por trip_id")
+    args = ap.parse_args()
+    profiling.setup(args.profile, "eta_baseline_skeleton_fixed")
+    main(args.model_out, args.history, args.chunksize, bool(args.sorted_trips))
@@ -0,0 +1,138 @@
+"""
+eta_features.py
+Extracción de features de viaje de routes_history.csv por streaming (memoria acotada) para el ETA.
+- Lee el histórico por chunks de filas (CSV) o por lotes de archivos columnares particionados (directorio o
+  .parquet, requiere pyarrow); nunca carga todos los pings
+- Mantiene por viaje agregados acumulados entre chunks: primer/último punto, timestamp mín/máx, largo del
+  recorrido (suma de tramos entre pings consecutivos, incluido el tramo que cruza el borde del chunk),
+  cantidad de pings y conteos por hora (24) y día de semana (7) para sacar la mediana exacta
+- Mismo resultado que eta_baseline_skeleton_fixed.trip_features (distancia primer->último punto, duración,
+  mediana de hora y día, mismos filtros) + path_km
+- Con --sorted_trips 1 (histórico agrupado por trip_id) los viajes se emiten apenas cierran: la memoria queda
+  acotada por el chunk; si no, por la cantidad de viajes (no de pings)
+
+Los pings de cada viaje se asumen en orden cronológico dentro del archivo (para el largo del recorrido).
+
+Uso:
+  python eta_features.py --history routes_history.csv --out eta_training_data.csv --chunksize 500000
+  python eta_features.py --history history_parquet/ --sorted_trips 1
+"""
+import os
+import numpy as np
+import pandas as pd
+from distance_matrix import pair_km
+
+COLUMNS = ['trip_id', 'lat', 'lon', 'timestamp']
+OUT_COLUMNS = ['trip_id', 'distance_km', 'duration_min', 'hour', 'dow', 'path_km']
+HOURS = [f"h{h}" for h in range(24)]
+DOWS = [f"d{d}" for d in range(7)]
+CHUNKSIZE = 500_000
+
+def iter_chunks(path, chunksize=CHUNKSIZE):
+    """DataFrames de a lo sumo chunksize filas con las columnas del histórico."""
+    if os.path.isdir(path) or str(path).lower().endswith(".parquet"):
+        import pyarrow.dataset as ds
+        for batch in ds.dataset(path, format="parquet").to_batches(columns=COLUMNS, batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=COLUMNS, chunksize=chunksize)
+
+def chunk_aggregate(df):
+    """Agregados por viaje de un chunk (índice trip_id, en orden de aparición)."""
+    df = df.dropna(subset=COLUMNS)
+    ts = pd.to_datetime(df['timestamp'])
+    trip = df['trip_id'].to_numpy()
+    lat, lon = df['lat'].to_numpy(float), df['lon'].to_numpy(float)
+    seg = np.zeros(len(df))
+    if len(df) > 1:
+        same = trip[1:] == trip[:-1]
+        seg[1:] = np.where(same, pair_km(lat[:-1], lon[:-1], lat[1:], lon[1:]), 0.0)
+    frame = pd.DataFrame({'trip_id': trip, 'lat': lat, 'lon': lon, 'ts': ts.to_numpy(), 'seg': seg})
+    g = frame.groupby('trip_id', sort=False)
+    agg = g.agg(lat_first=('lat', 'first'), lon_first=('lon', 'first'),
+                lat_last=('lat', 'last'), lon_last=('lon', 'last'),
+                t_min=('ts', 'min'), t_max=('ts', 'max'), path_km=('seg', 'sum'), pings=('lat', 'size'))
+    codes, n = g.ngroup().to_numpy(), len(agg)
+    hours = np.bincount(codes * 24 + ts.dt.hour.to_numpy(), minlength=n * 24).reshape(n, 24)
+    dows = np.bincount(codes * 7 + ts.dt.dayofweek.to_numpy(), minlength=n * 7).reshape(n, 7)
+    counts = pd.DataFrame(np.hstack([hours, dows]).astype(np.int32), index=agg.index, columns=HOURS + DOWS)
+    return pd.concat([agg, counts], axis=1)
+
+def merge_state(state, agg):
+    """Suma un chunk al estado por viaje. Los viajes que siguen de un chunk anterior suman el tramo entre su
+    último punto conocido y el primero del chunk."""
+    if state is None or state.empty:
+        return agg
+    seen = agg.index.isin(state.index)
+    if seen.any():
+        a, s = agg[seen], state.loc[agg.index[seen]]
+        bridge = pair_km(s['lat_last'].to_numpy(), s['lon_last'].to_numpy(),
+                         a['lat_first'].to_numpy(), a['lon_first'].to_numpy())
+        upd = s.copy()
+        upd[['lat_last', 'lon_last']] = a[['lat_last', 'lon_last']].to_numpy()
+        upd['t_min'] = np.minimum(s['t_min'].to_numpy(), a['t_min'].to_numpy())
+        upd['t_max'] = np.maximum(s['t_max'].to_numpy(), a['t_max'].to_numpy())
+        upd['path_km'] = s['path_km'].to_numpy() + a['path_km'].to_numpy() + bridge
+        upd['pings'] = s['pings'].to_numpy() + a['pings'].to_numpy()
+        upd[HOURS + DOWS] = s[HOURS + DOWS].to_numpy() + a[HOURS + DOWS].to_numpy()
+        state.loc[upd.index] = upd
+    return pd.concat([state, agg[~seen]]) if (~seen).any() else state
+
+def _median_from_counts(counts):
+    """Mediana (como pandas: promedio de los dos centrales si la cantidad es par) desde conteos por valor."""
+    n = counts.sum(axis=1)
+    cs = counts.cumsum(axis=1)
+    lower = (cs > ((n - 1) // 2)[:, None]).argmax(axis=1)
+    upper = (cs > (n // 2)[:, None]).argmax(axis=1)
+    return (lower + upper) / 2.0
+
+def finalize(state):
+    """Una fila por viaje con las features de entrenamiento (filtrado como trip_features)."""
+    out = pd.DataFrame({
+        'trip_id': state.index,
+        'distance_km': pair_km(state['lat_first'].to_numpy(), state['lon_first'].to_numpy(),
+                               state['lat_last'].to_numpy(), state['lon_last'].to_numpy()),
+        'duration_min': (state['t_max'] - state['t_min']).dt.total_seconds().to_numpy() / 60.0,
+        'hour': _median_from_counts(state[HOURS].to_numpy()),
+        'dow': _median_from_counts(state[DOWS].to_numpy()),
+        'path_km': state['path_km'].to_numpy(),
+    })
+    out = out.replace([np.inf, -np.inf], np.nan).dropna(subset=['distance_km', 'duration_min', 'hour', 'dow'])
+    return out[(out['distance_km'] > 0.05) & (out['duration_min'] > 2)]  # >50m y >2 min
+
+def stream_features(history_path, out_path="eta_training_data.csv", chunksize=CHUNKSIZE, sorted_trips=False):
+    """Escribe out_path a medida que avanza. Devuelve (viajes escritos, pings leídos)."""
+    state, written, pings = None, 0, 0
+    tmp = out_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        pd.DataFrame(columns=OUT_COLUMNS).to_csv(f, index=False)
+        for chunk in iter_chunks(history_path, chunksize):
+            pings += len(chunk)
+            agg = chunk_aggregate(chunk)
+            if agg.empty:
+                continue
+            state = merge_state(state, agg)
+            if sorted_trips:
+                # Con viajes contiguos, todos menos el último del chunk ya cerraron
+                done = state.index != agg.index[-1]
+                rows = finalize(state[done])
+                rows.to_csv(f, index=False, header=False)
+                written += len(rows)
+                state = state[~done]
+        if state is not None and not state.empty:
+            rows = finalize(state)
+            rows.to_csv(f, index=False, header=False)
+            written += len(rows)
+    os.replace(tmp, out_path)
+    return written, pings
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Features de viaje para el ETA por streaming")
+    ap.add_argument("--history", default="routes_history.csv", help="CSV o directorio/archivo parquet")
+    ap.add_argument("--out", default="eta_training_data.csv")
+    ap.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    ap.add_argument("--sorted_trips", type=int, default=0, help="1 = histórico agrupado por trip_id (emite al cerrar cada viaje)")
+    args = ap.parse_args()
+    n, pings = stream_features(args.history, args.out, args.chunksize, bool(args.sorted_trips))
+    print(f"OK -> {args.out} generado ({n} viajes de {pings} pings)")
@@ -0,0 +1,130 @@
+"""
+eta_inference.py
+Inferencia por lotes del modelo ETA (eta_baseline_skeleton_fixed.py) para armar matrices de minutos del solver.
+- El modelo joblib se carga una sola vez por proceso (se recarga solo si cambia el archivo)
+- Matriz NxN de duración para una hora de salida y día de semana: las distancias se recorren por bloques de
+  filas (distance_matrix.iter_distance_blocks) y la predicción se hace sobre las distancias únicas del bloque,
+  cuantizadas a --km_step (las features son distancia, hora y día: pares con igual distancia dan igual ETA),
+  en lotes de a lo sumo batch_size filas -> memoria acotada y pocas llamadas a predict
+- Resultado en minutos int32 (techo; 0 en la diagonal y entre puntos iguales), cacheado en disco por
+  (modelo, coordenadas, hora, día, km_step) en .eta_cache/<clave>/ con tope LRU (matrix_cache.evict_lru)
+
+Uso:
+  from eta_inference import eta_matrix
+  travel_min = eta_matrix(lats, lons, hour=8, dow=2, model_path="eta_model.joblib")
+CLI (nodos con columnas lat, lon -> .npy):
+  python eta_inference.py --nodes nodos.csv --hour 8 --dow 2 --out eta_8h.npy
+Desde vrp_advanced_soft.py:
+  python vrp_advanced_soft.py --eta_model eta_model.joblib [--eta_hour 8 --eta_dow 2]
+"""
+import hashlib, os
+import numpy as np
+import pandas as pd
+from distance_matrix import BLOCK_ROWS, iter_distance_blocks
+from matrix_cache import coord_keys, evict_lru, touch
+
+MODEL_PATH = "eta_model.joblib"
+DEFAULT_DIR = ".eta_cache"
+DEFAULT_MAX_MB = 256
+BATCH_SIZE = 100_000
+KM_STEP = 0.05
+
+_MODELS = {}  # ruta -> (mtime, bundle)
+_DIGESTS = {}  # ruta -> ((tamaño, mtime_ns), sha256 del archivo)
+
+def load_model(path=MODEL_PATH):
+    """Bundle {'model', 'features', 'mae_min', ...} del entrenamiento, cacheado por proceso."""
+    mtime = os.path.getmtime(path)
+    hit = _MODELS.get(path)
+    if hit is None or hit[0] != mtime:
+        import joblib
+        bundle = joblib.load(path)
+        if not isinstance(bundle, dict):  # modelo suelto (sin metadatos)
+            bundle = {'model': bundle, 'features': ['distance_km', 'hour', 'dow']}
+        hit = _MODELS[path] = (mtime, bundle)
+    return hit[1]
+
+def predict_minutes(bundle, km, hour, dow, batch_size=BATCH_SIZE):
+    """ETA en minutos (float) para un vector de distancias, en lotes de batch_size filas."""
+    const = {'hour': float(hour), 'dow': float(dow)}
+    out = np.empty(len(km), dtype=np.float64)
+    for s in range(0, len(km), batch_size):
+        chunk = km[s:s+batch_size]
+        X = pd.DataFrame({f: (chunk if f == 'distance_km' else np.full(len(chunk), const[f]))
+                          for f in bundle['features']})
+        out[s:s+batch_size] = bundle['model'].predict(X)
+    return out
+
+def compute_matrix(bundle, lat, lon, hour, dow, km_step=KM_STEP, block_rows=BLOCK_ROWS, batch_size=BATCH_SIZE):
+    """Matriz NxN int32 de minutos predichos."""
+    n = len(np.ravel(lat))
+    out = np.empty((n, n), dtype=np.int32)
+    known = {}  # distancia cuantizada -> minutos (se reutiliza entre bloques)
+    for s, e, block in iter_distance_blocks(lat, lon, block_rows=block_rows):
+        q = np.rint(block / km_step).astype(np.int64)
+        uniq, inverse = np.unique(q, return_inverse=True)
+        missing = np.array([u for u in uniq.tolist() if u not in known], dtype=np.int64)
+        if len(missing):
+            pred = predict_minutes(bundle, missing * km_step, hour, dow, batch_size)
+            known.update(zip(missing.tolist(), np.ceil(np.maximum(pred, 0.0)).astype(np.int64).tolist()))
+        mins = np.fromiter((known[u] for u in uniq.tolist()), dtype=np.int32, count=len(uniq))[inverse]
+        out[s:e] = np.where(q == 0, 0, mins.reshape(block.shape))
+    return out
+
+def model_digest(path):
+    """sha256 del archivo del modelo, recalculado solo si cambian su tamaño o mtime."""
+    st = os.stat(path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    hit = _DIGESTS.get(path)
+    if hit is None or hit[0] != stamp:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        hit = _DIGESTS[path] = (stamp, h.hexdigest())
+    return hit[1]
+
+def cache_key(model_path, lat, lon, hour, dow, km_step):
+    h = hashlib.sha256(model_digest(model_path).encode())
+    h.update(coord_keys(lat, lon).tobytes())
+    h.update(f"{int(hour)}|{int(dow)}|{float(km_step)}".encode())
+    return h.hexdigest()[:32]
+
+def eta_matrix(lat, lon, hour, dow=0, model_path=MODEL_PATH, cache_dir=DEFAULT_DIR, max_mb=DEFAULT_MAX_MB,
+               km_step=KM_STEP, batch_size=BATCH_SIZE):
+    """Matriz de minutos del modelo ETA para los nodos, con caché en disco (cache_dir '' = sin caché)."""
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    entry = None
+    if cache_dir:
+        entry = os.path.join(cache_dir, cache_key(model_path, lat, lon, hour, dow, km_step))
+        path = os.path.join(entry, "travel_min.npy")
+        if os.path.exists(path):
+            touch(entry)
+            print(f"[ETA] Matriz {len(lat)}x{len(lat)} @ {int(hour)}h dow={int(dow)} desde caché ({entry}).")
+            return np.load(path)
+    mins = compute_matrix(load_model(model_path), lat, lon, hour, dow, km_step, batch_size=batch_size)
+    print(f"[ETA] Matriz {len(lat)}x{len(lat)} @ {int(hour)}h dow={int(dow)} predicha con {model_path}.")
+    if entry is not None:
+        os.makedirs(entry, exist_ok=True)
+        tmp = os.path.join(entry, "travel_min.tmp.npy")
+        np.save(tmp, mins)
+        os.replace(tmp, path)
+        touch(entry)
+        evict_lru(cache_dir, int(max_mb * 1024 * 1024), keep=[entry])
+    return mins
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Matriz NxN de minutos con el modelo ETA")
+    ap.add_argument("--nodes", required=True, help="CSV con columnas lat, lon")
+    ap.add_argument("--hour", type=int, required=True)
+    ap.add_argument("--dow", type=int, default=0, help="día de semana (0 = lunes)")
+    ap.add_argument("--model", default=MODEL_PATH)
+    ap.add_argument("--out", default="eta_matrix.npy")
+    ap.add_argument("--km_step", type=float, default=KM_STEP)
+    ap.add_argument("--eta_cache", default=DEFAULT_DIR, help="directorio del caché ('' = desactivar)")
+    args = ap.parse_args()
+    nodes = pd.read_csv(args.nodes)
+    mins = eta_matrix(nodes['lat'], nodes['lon'], args.hour, args.dow, args.model, args.eta_cache, km_step=args.km_step)
+    np.save(args.out, mins)
+    print(f"OK -> {args.out} ({mins.shape[0]}x{mins.shape[1]}, {mins.nbytes/1e6:.1f} MB)")
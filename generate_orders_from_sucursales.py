@@ -4,7 +4,9 @@ generate_orders_from_sucursales.py
 Genera pedidos sintéticos (orders.csv) a partir de sucursales.csv (sucursal, lat, lon).
 
 Uso:
-  python generate_orders_from_sucursales.py --n 30 --start "08:00" --end "20:00"
+  python generate_orders_from_sucursales.py --n 30 --start "08:00" --end "20:00" [--max_km 15]
+
+--max_km limita el dropoff a sucursales a menos de X km del pickup (usa spatial_index.py).
 """
 import argparse, random
 from datetime import datetime, timedelta
@@ -15,10 +17,24 @@ def today_iso(h, m=0):
     t = datetime.now().replace(hour=h, minute=m, second=0, microsecond=0)
     return t.isoformat()
 
-def main(n, start_str, end_str, out):
+def pick_pair(suc, max_km=None, index=None):
+    """Índices (pickup, dropoff). Con max_km, el dropoff sale de las sucursales cercanas al pickup."""
+    if max_km is None:
+        return random.sample(range(len(suc)), 2)
+    a = random.randrange(len(suc))
+    near = [int(j) for j in index.within(suc.iloc[a]['lat'], suc.iloc[a]['lon'], max_km)['idx'] if j != a]
+    if not near:
+        return random.sample(range(len(suc)), 2)
+    return a, random.choice(near)
+
+def main(n, start_str, end_str, out, max_km=None):
     suc = pd.read_csv("sucursales.csv")
     if len(suc) < 2:
         raise SystemExit("Necesito al menos 2 sucursales para crear pickups y dropoffs.")
+    index = None
+    if max_km is not None:
+        from spatial_index import load_or_build
+        index = load_or_build("sucursales.csv")
 
     # Ventana global base
     h_s, m_s = map(int, start_str.split(":"))
@@ -28,7 +44,7 @@ def main(n, start_str, end_str, out):
 
     orders = []
     for i in range(n):
-        a, b = random.sample(range(len(suc)), 2)
+        a, b = pick_pair(suc, max_km, index)
         p = suc.iloc[a]; d = suc.iloc[b]
         # Subventanas aleatorias dentro del rango base
         w_start = base_start + timedelta(minutes=random.randint(0, 240))  # hasta +4h
@@ -58,5 +74,6 @@ if __name__ == "__main__":
     ap.add_argument("--start", type=str, default="08:00")
     ap.add_argument("--end", type=str, default="20:00")
     ap.add_argument("--out", type=str, default="orders.csv")
+    ap.add_argument("--max_km", type=float, default=None, help="distancia máxima pickup->dropoff (km)")
     args = ap.parse_args()
-    main(args.n, args.start, args.end, args.out)
+    main(args.n, args.start, args.end, args.out, args.max_km)
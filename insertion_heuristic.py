@@ -0,0 +1,242 @@
+"""
+insertion_heuristic.py
+Heurística constructiva (inserción con regret-2) para Pickup & Delivery, en NumPy.
+- Para cada par pickup/drop sin asignar evalúa de una vez todas las posiciones (i, j) de inserción en
+  una ruta: capacidad kg/m³ sobre el tramo i..j, frío (mismo criterio que vrp_advanced_soft) y ventanas
+  con el corrimiento que provoca en las paradas siguientes (esperas absorben el atraso)
+- Rutas largas: el drop se combina solo con las PICKUP_POSITIONS posiciones de pickup de menor desvío
+- Inserta primero el par con mayor regret (diferencia entre su mejor y segunda mejor ruta) y solo
+  re-evalúa la ruta que cambió
+- Ventanas en etapas: primero estrictas; los pares que no entran se reintentan tolerando atraso
+  (WINDOW_TOLERANCES minutos) y al final solo por capacidad. El atraso lo termina de corregir el
+  modelo soft si se usa como solución inicial
+- Mismos datos que vrp_advanced_soft.prepare_data (matriz travel_min + servicio por nodo)
+
+Uso:
+  python insertion_heuristic.py --speed_kmh 50                    # plan directo (mismo esquema CSV)
+  python vrp_advanced_soft.py --construct 1 --search_seconds 30    # como asignación inicial
+Desde código:
+  from insertion_heuristic import construct_routes
+  routes, info = construct_routes(data)      # rutas por vehículo (sin depot), para soft.solve(initial_routes=...)
+"""
+import argparse, time
+import numpy as np
+
+WINDOW_TOLERANCES = (0, 30, 120, None)  # None = solo capacidad
+PICKUP_POSITIONS = 8                    # posiciones de pickup (menor desvío) que se combinan con cada drop
+HORIZON = 72 * 60
+INF = np.iinfo(np.int64).max // 4
+
+def node_arrays(data):
+    nodes = data['nodes']
+    tws = np.array([max(0, int(n['tw_start'])) for n in nodes], dtype=np.int64)
+    twe = np.array([min(HORIZON, int(n['tw_end'])) if n['tw_end'] > 0 else HORIZON for n in nodes], dtype=np.int64)
+    return {
+        'T': np.asarray(data['travel_min'], dtype=np.int64),
+        'S': np.array([int(n['service_min']) for n in nodes], dtype=np.int64),
+        'tws': tws, 'twe': np.maximum(twe, tws),
+        'kg': np.array([n['demand_kg'] for n in nodes], dtype=np.float64),
+        'm3': np.array([n['demand_m3'] for n in nodes], dtype=np.float64),
+    }
+
+def allowed_vehicles(data):
+    """Matriz (pares x vehículos) de asignaciones permitidas por frío."""
+    nodes, vehicles = data['nodes'], data['vehicles']
+    refrig = vehicles['refrigerated'].to_numpy(int) == 1
+    allowed = np.ones((len(data['pd_pairs']), len(vehicles)), dtype=bool)
+    if not data['ignore_refrig'] and refrig.any():
+        for k, (p, _) in enumerate(data['pd_pairs']):
+            if nodes[p]['refrig_req'] == 1:
+                allowed[k] = refrig
+    return allowed
+
+def route_state(seq, A, twe):
+    """Inicio de servicio, latest start, esperas acumuladas y carga por posición (depot al inicio y al final)."""
+    T, S, tws = A['T'], A['S'], A['tws']
+    s = np.asarray(seq, dtype=np.int64)
+    n = len(s)
+    b = np.zeros(n, dtype=np.int64)
+    wait = np.zeros(n, dtype=np.int64)
+    for k in range(1, n):
+        a = b[k-1] + S[s[k-1]] + T[s[k-1], s[k]]
+        b[k] = max(a, tws[s[k]])
+        wait[k] = b[k] - a
+    lst = np.empty(n, dtype=np.int64)
+    lst[-1] = HORIZON
+    for k in range(n - 2, -1, -1):
+        lst[k] = min(twe[s[k]], lst[k+1] - S[s[k]] - T[s[k], s[k+1]])
+    return {'s': s, 'b': b, 'W': np.cumsum(wait), 'lst': lst,
+            'kg': np.cumsum(A['kg'][s]), 'm3': np.cumsum(A['m3'][s])}
+
+def insertion_costs(st, P, D, A, twe, cap_kg, cap_m3):
+    """Mejor costo de inserción (minutos de viaje agregados) y posiciones (i, j) para cada par (P[k], D[k]).
+    p va entre s[i] y s[i+1]; d entre s[j] y s[j+1] (j == i: p y d seguidos). INF = no entra."""
+    T, S, tws = A['T'], A['S'], A['tws']
+    s, b, W, lst = st['s'], st['b'], st['W'], st['lst']
+    L1 = len(s) - 1                          # posiciones de inserción 0..L
+    head, nxt = s[:-1], s[1:]
+    dep = b[:-1] + S[head]                   # salida de s[i]
+    base = T[head, nxt]
+    K = len(P)
+
+    tp_in, tp_out = T[head][:, P].T, T[P][:, nxt]          # (K, L1)
+    td_in, td_out = T[head][:, D].T, T[D][:, nxt]
+    t_pd = T[P, D][:, None]
+    load_kg, load_m3 = A['kg'][P][:, None], A['m3'][P][:, None]
+    kg_at, m3_at = st['kg'][:-1], st['m3'][:-1]             # carga al salir de s[i]
+
+    # Pickup después de s[i]
+    bp = np.maximum(dep[None, :] + tp_in, tws[P][:, None])
+    ok_p = ((bp <= twe[P][:, None]) & (kg_at[None, :] + load_kg <= cap_kg + 1e-9)
+            & (m3_at[None, :] + load_m3 <= cap_m3 + 1e-9))
+    dep_p = bp + S[P][:, None]
+
+    # Caso j == i: p y d consecutivos
+    bd0 = np.maximum(dep_p + t_pd, tws[D][:, None])
+    nxt_b0 = np.maximum(bd0 + S[D][:, None] + td_out, tws[nxt][None, :])
+    ok0 = ok_p & (bd0 <= twe[D][:, None]) & (nxt_b0 <= lst[1:][None, :])
+    c0 = np.where(ok0, tp_in + t_pd + td_out - base[None, :], INF)
+    i0 = c0.argmin(axis=1)
+    best_cost, best_i = c0[np.arange(K), i0], i0
+    best_j = i0.copy()
+
+    # Caso j > i: solo filas (k, i) donde el pickup entra y el corrimiento en s[i+1] es admisible
+    b1 = np.maximum(dep_p + tp_out, tws[nxt][None, :])
+    delta = np.maximum(0, b1 - b[1:][None, :])
+    pos = np.arange(L1)[None, :]
+    cand = ok_p & (b1 <= lst[1:][None, :]) & (pos < L1 - 1)
+    if L1 - 1 > PICKUP_POSITIONS:
+        # Vecindario granular: solo las posiciones de pickup con menor desvío se combinan con cada j
+        detour = np.where(cand, tp_in + tp_out - base[None, :], INF)
+        top = np.argpartition(detour, PICKUP_POSITIONS, axis=1)[:, :PICKUP_POSITIONS]
+        keep = np.zeros_like(cand)
+        np.put_along_axis(keep, top, True, axis=1)
+        cand &= keep
+    kk, ii = np.nonzero(cand)
+    if len(kk):
+        d_ki, w1 = delta[kk, ii], W[ii + 1]
+        after = pos > ii[:, None]
+        # Corrimiento en s[j] (las esperas lo absorben) y paradas i+1..j dentro de su latest start:
+        # delta + W[i+1] <= min_{i<k<=j} (lst_k - b_k + W_k)
+        shift = np.maximum(0, d_ki[:, None] - (W[:L1][None, :] - w1[:, None]))
+        slack = (lst - b + W)[:L1].astype(np.float64)
+        run_min = np.minimum.accumulate(np.where(after, slack[None, :], np.inf), axis=1)
+        Dk = D[kk]
+        bd = np.maximum(b[:L1][None, :] + shift + S[head][None, :] + td_in[kk], tws[Dk][:, None])
+        nxt_b = np.maximum(bd + S[Dk][:, None] + td_out[kk], tws[nxt][None, :])
+        # Capacidad: carga máxima en s[i+1..j] + la del pedido
+        run_kg = np.maximum.accumulate(np.where(after, kg_at[None, :], -np.inf), axis=1)
+        run_m3 = np.maximum.accumulate(np.where(after, m3_at[None, :], -np.inf), axis=1)
+        ok = (after & ((d_ki + w1)[:, None] <= run_min)
+              & (bd <= twe[Dk][:, None]) & (nxt_b <= lst[1:][None, :])
+              & (run_kg + load_kg[kk] <= cap_kg + 1e-9) & (run_m3 + load_m3[kk] <= cap_m3 + 1e-9))
+        cost = (tp_in + tp_out - base[None, :])[kk, ii][:, None] + (td_in + td_out - base[None, :])[kk]
+        c = np.where(ok, cost, INF)
+        jj = c.argmin(axis=1)
+        cj = c[np.arange(len(kk)), jj]
+        # Mejor fila por par
+        order = np.lexsort((cj, kk))
+        first = order[np.r_[True, kk[order][1:] != kk[order][:-1]]]
+        better = cj[first] < best_cost[kk[first]]
+        k_up = kk[first][better]
+        best_cost[k_up], best_i[k_up], best_j[k_up] = cj[first][better], ii[first][better], jj[first][better]
+    return best_cost, best_i, best_j
+
+def _insert(seq, p, d, i, j):
+    """seq incluye depots; p después de seq[i], d después de seq[j] (índices de la secuencia original)."""
+    return seq[:i+1] + [p] + seq[i+1:j+1] + [d] + seq[j+1:]
+
+def construct_routes(data, tolerances=WINDOW_TOLERANCES, verbose=True):
+    """Rutas por vehículo (listas de nodos sin depot) + info (asignados, sin asignar, segundos)."""
+    t0 = time.perf_counter()
+    A = node_arrays(data)
+    vehicles = data['vehicles']
+    caps_kg = vehicles['capacity_kg'].to_numpy(float)
+    caps_m3 = vehicles['capacity_m3'].to_numpy(float)
+    allowed = allowed_vehicles(data)
+    pairs = np.array(data['pd_pairs'], dtype=np.int64).reshape(-1, 2)
+    V = len(vehicles)
+    seqs = [[0, 0] for _ in range(V)]
+    pending = np.arange(len(pairs))
+    for tol in tolerances:
+        if len(pending) == 0:
+            break
+        twe = A['twe'] + tol if tol is not None else np.full_like(A['twe'], HORIZON)
+        twe[0] = HORIZON
+        states = [route_state(s, A, twe) for s in seqs]
+        cost = np.full((len(pending), V), INF, dtype=np.int64)
+        pos_i = np.zeros((len(pending), V), dtype=np.int64)
+        pos_j = np.zeros((len(pending), V), dtype=np.int64)
+        def evaluate(v, rows):
+            ks = rows[allowed[pending[rows], v]]
+            cost[rows, v] = INF
+            if len(ks):
+                P, D = pairs[pending[ks], 0], pairs[pending[ks], 1]
+                cost[ks, v], pos_i[ks, v], pos_j[ks, v] = insertion_costs(states[v], P, D, A, twe, caps_kg[v], caps_m3[v])
+        alive = np.ones(len(pending), dtype=bool)
+        rows_all = np.arange(len(pending))
+        for v in range(V):
+            evaluate(v, rows_all)
+        while alive.any():
+            c = np.where(alive[:, None], cost, INF)
+            feasible = c < INF
+            n_ok = feasible.sum(axis=1)
+            candidates = alive & (n_ok > 0)
+            if not candidates.any():
+                break
+            part = np.partition(c, 1, axis=1) if V > 1 else c
+            best = part[:, 0]
+            second = part[:, 1] if V > 1 else np.full(len(c), INF)
+            # Regret-2: un par con una sola ruta posible va primero
+            regret = np.where(n_ok == 1, INF, second - best)
+            score = np.where(candidates, regret, -1)
+            top = np.flatnonzero(score == score.max())
+            k = top[np.argmin(best[top])]
+            v = int(np.argmin(c[k]))
+            p, d = pairs[pending[k]]
+            seqs[v] = _insert(seqs[v], int(p), int(d), int(pos_i[k, v]), int(pos_j[k, v]))
+            states[v] = route_state(seqs[v], A, twe)
+            alive[k] = False
+            evaluate(v, np.flatnonzero(alive))
+        pending = pending[alive]
+    routes = [s[1:-1] for s in seqs]
+    info = {'assigned': len(pairs) - len(pending), 'unassigned': [int(pairs[k, 0]) for k in pending],
+            'seconds': round(time.perf_counter() - t0, 3)}
+    if verbose:
+        print(f"[CONSTRUCT] {info['assigned']}/{len(pairs)} pedidos asignados en {info['seconds']:.2f}s "
+              f"({sum(1 for r in routes if r)} vehículos usados).")
+    return routes, info
+
+def routes_result(data, routes, late_penalty=6):
+    """Mismo dict que vrp_advanced_soft.extract_solution (objetivo estimado: viaje + servicio + atraso)."""
+    A = node_arrays(data)
+    full, arrive, objective = [], [], 0
+    for r in routes:
+        seq = [0] + list(r) + [0]
+        st = route_state(seq, A, A['twe'])
+        full.append(seq)
+        arrive.append([int(x) for x in st['b']])
+        s = st['s']
+        objective += int((A['T'][s[:-1], s[1:]] + A['S'][s[:-1]]).sum())
+        objective += int(late_penalty * np.maximum(0, st['b'] - A['twe'][s]).sum())
+    served = {i for r in routes for i in r}
+    return {'objective': objective, 'routes': full, 'arrive_min': arrive,
+            'unserved': [p for p, _ in data['pd_pairs'] if p not in served]}
+
+if __name__ == "__main__":
+    import vrp_advanced_soft as soft
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--speed_kmh", type=float, default=50.0)
+    ap.add_argument("--late_penalty", type=float, default=6.0)
+    ap.add_argument("--ignore_refrigerated", type=int, default=0)
+    ap.add_argument("--distance_method", choices=["haversine", "ellipsoidal"], default="haversine")
+    ap.add_argument("--matrix_cache", type=str, default=".matrix_cache", help="directorio del caché de distancias ('' = desactivar)")
+    args = ap.parse_args()
+    orders, vehicles = soft.load_inputs()
+    data = soft.prepare_data(orders, vehicles, args.speed_kmh, bool(args.ignore_refrigerated),
+                             args.distance_method, args.matrix_cache)
+    routes, info = construct_routes(data)
+    result = routes_result(data, routes, args.late_penalty)
+    soft.export_plan(data, result, unserved_path="unserved_orders.csv")
+    print(f"OK -> routes_plan_advanced.csv, stops_plan_advanced.csv y unserved_orders.csv generados "
+          f"(inserción, objetivo estimado {result['objective']}, {len(result['unserved'])} sin asignar).")
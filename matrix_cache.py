@@ -0,0 +1,249 @@
+"""
+matrix_cache.py
+Caché persistente (en disco, memory-mapped) de distancias km entre coordenadas.
+- Cada coordenada se identifica con una clave estable: lat/lon redondeados a 1e-6 y empaquetados en int64
+- Un "store" por método de distancia: keys.npy (orden de alta) + dist_km.f64 (matriz cuadrada float64 con capacidad);
+  se guarda en float64 para derivar los minutos igual que distance_matrix.build_matrices (antes de compactar).
+  Un store float32 de una versión anterior se descarta y se vuelve a calcular
+- Solo se calculan filas/columnas de coordenadas nunca vistas; el resto se lee del memmap
+- Con varios stores en el mismo directorio se expulsan los de uso menos reciente (LRU) al superar max_mb
+
+Uso:
+  from matrix_cache import cached_matrices
+  dist_km, travel_min = cached_matrices(lats, lons, speed_kmh=50, cache_dir=".matrix_cache")
+"""
+import json, os, shutil
+from contextlib import contextmanager
+import numpy as np
+from distance_matrix import BLOCK_ROWS, build_matrices, iter_distance_blocks, minutes_from_km
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos
+    fcntl = None
+
+DEFAULT_DIR = ".matrix_cache"
+DEFAULT_MAX_MB = 1024
+LAST_USED = "last_used"
+DIST_FILE = "dist_km.f64"
+DIST_DTYPE = "float64"
+ITEM_BYTES = 8
+_LON_SPAN = 360_000_001
+
+def coord_keys(lat, lon):
+    """Clave int64 estable por coordenada (micro-grados, sin colisiones)."""
+    lat_e6 = np.rint(np.asarray(lat, dtype=np.float64).ravel() * 1e6).astype(np.int64) + 90_000_000
+    lon_e6 = np.rint(np.asarray(lon, dtype=np.float64).ravel() * 1e6).astype(np.int64) + 180_000_000
+    return lat_e6 * _LON_SPAN + lon_e6
+
+def keys_to_coords(keys):
+    keys = np.asarray(keys, dtype=np.int64)
+    lat = (keys // _LON_SPAN - 90_000_000) / 1e6
+    lon = (keys % _LON_SPAN - 180_000_000) / 1e6
+    return lat, lon
+
+def dir_size(path):
+    total = 0
+    for base, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(base, f))
+            except OSError:
+                pass
+    return total
+
+def touch(path):
+    """Marca un directorio de caché como usado ahora (para LRU)."""
+    marker = os.path.join(path, LAST_USED)
+    with open(marker, "a"):
+        pass
+    os.utime(marker, None)
+
+def evict_lru(root, max_bytes, keep=()):
+    """Borra subdirectorios de root (menos recientes primero) hasta quedar bajo max_bytes."""
+    if not os.path.isdir(root):
+        return []
+    entries = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path):
+            continue
+        marker = os.path.join(path, LAST_USED)
+        used = os.path.getmtime(marker) if os.path.exists(marker) else os.path.getmtime(path)
+        entries.append((used, path, dir_size(path)))
+    total = sum(e[2] for e in entries)
+    keep = {os.path.abspath(k) for k in keep}
+    removed = []
+    for used, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed.append(path)
+    return removed
+
+class MatrixCache:
+    """Store de distancias km para un método ('haversine' / 'ellipsoidal')."""
+
+    def __init__(self, root=DEFAULT_DIR, method="haversine", max_mb=DEFAULT_MAX_MB, block_rows=BLOCK_ROWS):
+        self.root = root
+        self.method = method
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.block_rows = block_rows
+        self.path = os.path.join(root, method)
+        self.computed_rows = 0  # filas calculadas en la última llamada (0 = todo desde disco)
+
+    # --- archivos del store ---
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            keys = np.load(self._file("keys.npy"))
+            if len(keys) != meta["n"]:
+                raise ValueError("keys/meta inconsistentes")
+            return meta, keys
+        except (OSError, ValueError, KeyError):
+            return {"n": 0, "capacity": 0}, np.empty(0, dtype=np.int64)
+
+    def _write_meta(self, meta, keys):
+        np.save(self._file("keys.npy"), keys)
+        with open(self._file("meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def _memmap(self, capacity, mode="r+"):
+        return np.memmap(self._file(DIST_FILE), dtype=DIST_DTYPE, mode=mode, shape=(capacity, capacity))
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file(".lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _grow(self, meta, needed):
+        """Reserva una matriz más grande y copia la parte usada (por bloques)."""
+        old_cap, n = meta["capacity"], meta["n"]
+        new_cap = max(256, needed, 2 * old_cap)
+        if new_cap * new_cap * ITEM_BYTES > self.max_bytes:
+            new_cap = max(needed, int((self.max_bytes // ITEM_BYTES) ** 0.5))
+        tmp = self._file(DIST_FILE + ".tmp")
+        new = np.memmap(tmp, dtype=DIST_DTYPE, mode="w+", shape=(new_cap, new_cap))
+        if n > 0:
+            old = self._memmap(old_cap, "r")
+            for s in range(0, n, self.block_rows):
+                e = min(n, s + self.block_rows)
+                new[s:e, :n] = old[s:e, :n]
+            del old
+        new.flush()
+        del new
+        os.replace(tmp, self._file(DIST_FILE))
+        meta["capacity"] = new_cap
+
+    def _reset(self):
+        for name in ("dist_km.f32", DIST_FILE, "keys.npy", "meta.json"):
+            try:
+                os.remove(self._file(name))
+            except OSError:
+                pass
+        return {"n": 0, "capacity": 0}, np.empty(0, dtype=np.int64)
+
+    # --- API ---
+    def indices(self, lat, lon):
+        """Índices del store para cada coordenada; agrega y calcula las que falten."""
+        req = coord_keys(lat, lon)
+        with self._locked():
+            meta, keys = self._read_meta()
+            if meta["n"] and meta.get("dtype") != DIST_DTYPE:
+                meta, keys = self._reset()  # store float32 de una versión anterior
+            pos = {int(k): i for i, k in enumerate(keys)}
+            new_keys = [k for k in dict.fromkeys(req.tolist()) if k not in pos]
+            self.computed_rows = len(new_keys)
+            if new_keys:
+                n_old = meta["n"]
+                needed = n_old + len(new_keys)
+                if needed * needed * ITEM_BYTES > self.max_bytes:
+                    # El store no entra en el tope: se reinicia solo con lo pedido
+                    meta, keys = self._reset()
+                    pos = {}
+                    new_keys = list(dict.fromkeys(req.tolist()))
+                    self.computed_rows = len(new_keys)
+                    n_old, needed = 0, len(new_keys)
+                if needed > meta["capacity"]:
+                    self._grow(meta, needed)
+                keys = np.concatenate([keys, np.asarray(new_keys, dtype=np.int64)])
+                mm = self._memmap(meta["capacity"])
+                all_lat, all_lon = keys_to_coords(keys)
+                new_lat, new_lon = all_lat[n_old:], all_lon[n_old:]
+                # Filas nuevas contra todas las columnas (y simétrico)
+                for s, e, block in iter_distance_blocks(new_lat, new_lon, all_lat, all_lon,
+                                                        self.method, self.block_rows):
+                    mm[n_old+s:n_old+e, :needed] = block
+                    mm[:needed, n_old+s:n_old+e] = block.T
+                mm.flush()
+                del mm
+                for i, k in enumerate(new_keys):
+                    pos[k] = n_old + i
+                meta["n"] = needed
+                meta["dtype"] = DIST_DTYPE
+                self._write_meta(meta, keys)
+            touch(self.path)
+        evict_lru(self.root, self.max_bytes, keep=[self.path])
+        return np.fromiter((pos[int(k)] for k in req), dtype=np.int64, count=len(req))
+
+    def block(self, rows, cols):
+        """Sub-matriz km float64 (copia en memoria) para índices de store dados."""
+        meta, _ = self._read_meta()
+        mm = self._memmap(meta["capacity"], "r")
+        return np.asarray(mm[np.ix_(np.asarray(rows), np.asarray(cols))], dtype=np.float64)
+
+    def matrix(self, lat, lon):
+        """Matriz km float64 entre todos los puntos pedidos (en el orden recibido)."""
+        idx = self.indices(lat, lon)
+        return self.block(idx, idx)
+
+def cached_matrices(lat, lon, speed_kmh, method="haversine", cache_dir=DEFAULT_DIR, max_mb=DEFAULT_MAX_MB):
+    """Como distance_matrix.build_matrices, pero leyendo/llenando el caché en disco.
+    cache_dir vacío o None desactiva el caché."""
+    if not cache_dir:
+        return build_matrices(lat, lon, speed_kmh, method=method)
+    cache = MatrixCache(cache_dir, method=method, max_mb=max_mb)
+    idx = cache.indices(lat, lon)
+    dist = np.empty((len(idx), len(idx)), dtype=np.float32)
+    mins = np.empty(dist.shape, dtype=np.int32)
+    for s in range(0, len(idx), BLOCK_ROWS):
+        # Minutos desde el bloque float64, antes de compactar (como build_matrices)
+        block = cache.block(idx[s:s+BLOCK_ROWS], idx)
+        dist[s:s+BLOCK_ROWS] = block
+        mins[s:s+BLOCK_ROWS] = minutes_from_km(block, speed_kmh)
+    print(f"[CACHE] Matriz {len(dist)}x{len(dist)}: {cache.computed_rows} coordenadas nuevas calculadas ({cache_dir}/{method}).")
+    return dist, mins
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Estado / limpieza del caché de matrices")
+    ap.add_argument("--cache_dir", default=DEFAULT_DIR)
+    ap.add_argument("--max_mb", type=float, default=DEFAULT_MAX_MB)
+    ap.add_argument("--clear", type=int, default=0)
+    args = ap.parse_args()
+    if args.clear:
+        shutil.rmtree(args.cache_dir, ignore_errors=True)
+        print(f"OK -> {args.cache_dir} eliminado")
+    else:
+        removed = evict_lru(args.cache_dir, int(args.max_mb * 1024 * 1024))
+        for name in sorted(os.listdir(args.cache_dir)) if os.path.isdir(args.cache_dir) else []:
+            path = os.path.join(args.cache_dir, name)
+            meta_p = os.path.join(path, "meta.json")
+            n = json.load(open(meta_p, encoding="utf-8"))["n"] if os.path.exists(meta_p) else 0
+            print(f"{name}: {n} coordenadas, {dir_size(path)/1e6:.1f} MB")
+        if removed:
+            print(f"Expulsados (LRU): {removed}")
@@ -0,0 +1,294 @@
+"""
+order_stream.py
+Ingesta continua de pedidos con re-optimización por micro-lotes sobre el plan vigente.
+- Entran pedidos nuevos (mismo esquema que orders.csv; un order_id repetido reemplaza al anterior) y cancelaciones
+- Se acumulan en un micro-lote que se procesa cada --batch_seconds segundos o al llegar a --batch_size eventos
+- Por lote: el plan vigente se mapea a los pedidos actuales (warm_start), se quitan los cancelados y los nuevos
+  se insertan en la ruta más barata; solo los vehículos cuya ruta cambió se re-resuelven (vrp_advanced_soft,
+  arrancando desde esa asignación y con pedidos descartables). El resto de la flota queda igual.
+- El plan vigente siempre se puede leer: GET /plan devuelve la última versión completa y los CSV
+  (routes_plan_advanced.csv / stops_plan_advanced.csv / unserved_orders.csv) se reemplazan de forma atómica
+- Si un lote falla, el plan anterior sigue vigente y sus altas/cancelaciones vuelven a la cola para el próximo lote
+
+Depot y base temporal (day0) se fijan con el primer lote, así los minutos de llegada del plan no se corren.
+
+Requisitos:
+    pip install fastapi uvicorn ortools pandas
+Ejecutar (lee vehicles.csv y, si existen, orders.csv + routes/stops_plan_advanced.csv como estado inicial):
+    STREAM_BATCH_SECONDS=30 STREAM_BATCH_SIZE=20 uvicorn order_stream:app --port 8002
+Ejemplo:
+    curl -X POST localhost:8002/orders -H 'Content-Type: application/json' -d '[{"order_id": "ORD-1", ...}]'
+    curl -X POST localhost:8002/cancel -H 'Content-Type: application/json' -d '{"order_ids": ["ORD-1"]}'
+    curl localhost:8002/plan
+"""
+import os, threading, time
+from typing import List
+import pandas as pd
+from fastapi import FastAPI
+from pydantic import BaseModel
+import vrp_advanced_soft as soft
+from warm_start import complete_routes, routes_from_stops_plan
+
+ROUTES_PATH, STOPS_PATH, UNSERVED_PATH = "routes_plan_advanced.csv", "stops_plan_advanced.csv", "unserved_orders.csv"
+
+def apply_events(orders, new_rows, cancelled):
+    """Pedidos vigentes tras aplicar altas (reemplazan por order_id) y cancelaciones."""
+    drop = set(cancelled) | {r['order_id'] for r in new_rows}
+    out = orders[~orders['order_id'].isin(drop)] if len(orders) else orders
+    if new_rows:
+        out = pd.concat([out, pd.DataFrame(new_rows)], ignore_index=True)
+    return out.reset_index(drop=True)
+
+def affected_routes(data, stops):
+    """Rutas candidatas (plan vigente mapeado + pedidos sin ruta insertados) y vehículos cuya ruta cambió."""
+    nodes = data['nodes']
+    routes, _ = routes_from_stops_plan(data, stops)
+    routes, _ = complete_routes(data, routes)
+    old = {vid: [n for n in g['stop_node'] if n != 'DEPOT'] for vid, g in stops.groupby('vehicle_id', sort=False)}
+    changed = [v for v, vid in enumerate(data['vehicles']['vehicle_id'])
+               if [nodes[i]['node_id'] for i in routes[v]] != old.get(vid, [])]
+    return routes, changed
+
+def reoptimize(orders, vehicles, plan, depot, day0, speed_kmh=50.0, search_seconds=10, unserved_penalty=100_000,
+               ignore_refrig=False, matrix_cache=".matrix_cache"):
+    """Nuevo plan (routes, stops, unserved) re-resolviendo solo los vehículos afectados.
+    plan: dict con 'routes'/'stops' vigentes o None (primer lote: se resuelve toda la flota)."""
+    vehicles = vehicles.reset_index(drop=True)
+    data = soft.prepare_data(orders, vehicles, speed_kmh, ignore_refrig, matrix_cache=matrix_cache,
+                             depot=depot, day0=day0)
+    nodes = data['nodes']
+    if plan is None:
+        routes, changed = [[] for _ in range(len(vehicles))], list(range(len(vehicles)))
+        initial = None
+    else:
+        routes, changed = affected_routes(data, plan['stops'])
+        initial = True
+    if not changed:
+        # Ninguna ruta cambió, pero los pedidos que no entraron en ningún vehículo (capacidad, frío) tienen
+        # que figurar en el plan: quedan como no atendidos
+        served = {i for r in routes for i in r}
+        missing = [p for p, _ in data['pd_pairs'] if p not in served]
+        unserved = soft.unserved_frame(data, {'unserved': missing}, unserved_penalty)
+        return plan['routes'], plan['stops'], unserved, []
+
+    # Sub-problema: pedidos de las rutas afectadas + los que no entraron en ninguna ruta
+    assigned = {nodes[i]['order_id'] for r in routes for i in r}
+    keep = {nodes[i]['order_id'] for v in changed for i in routes[v]}
+    sub_orders = orders[orders['order_id'].isin(keep) | ~orders['order_id'].isin(assigned)]
+    sub_vehicles = vehicles.iloc[changed].reset_index(drop=True)
+    sub = soft.prepare_data(sub_orders, sub_vehicles, speed_kmh, ignore_refrig, matrix_cache=matrix_cache,
+                            depot=depot, day0=day0)
+    if initial:
+        pos = {n['node_id']: i for i, n in enumerate(sub['nodes'])}
+        initial = [[pos[nodes[i]['node_id']] for i in routes[v]] for v in changed]
+    result = soft.solve(sub, search_seconds=search_seconds, initial_routes=initial, unserved_penalty=unserved_penalty)
+    if result is None:
+        raise RuntimeError("No se encontró solución para las rutas afectadas.")
+    sub_routes, sub_stops = soft.plan_frames(sub, result)
+    unserved = soft.unserved_frame(sub, result, unserved_penalty)
+    if plan is None:
+        return sub_routes, sub_stops, unserved, changed
+
+    # Unir: vehículos no afectados tal cual, afectados con el resultado nuevo (orden de la flota)
+    ids = list(vehicles['vehicle_id'])
+    changed_ids = {ids[v] for v in changed}
+    def merge(old, new):
+        both = pd.concat([old[~old['vehicle_id'].isin(changed_ids)], new], ignore_index=True)
+        rank = both['vehicle_id'].map({vid: k for k, vid in enumerate(ids)})
+        return both.iloc[rank.argsort(kind="stable")].reset_index(drop=True)
+    return merge(plan['routes'], sub_routes), merge(plan['stops'], sub_stops), unserved, changed
+
+def write_plan(plan, out_dir="."):
+    """Escribe los CSV del plan reemplazándolos de forma atómica (lectores nunca ven un archivo a medias)."""
+    for key, name in (('routes', ROUTES_PATH), ('stops', STOPS_PATH), ('unserved', UNSERVED_PATH)):
+        path = os.path.join(out_dir, name)
+        plan[key].to_csv(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+class OrderStream:
+    """Acumula eventos y re-optimiza en un hilo propio; self.plan siempre apunta a un plan completo."""
+
+    def __init__(self, vehicles, orders=None, routes=None, stops=None, batch_seconds=30.0, batch_size=20,
+                 speed_kmh=50.0, search_seconds=10, unserved_penalty=100_000, ignore_refrig=False,
+                 matrix_cache=".matrix_cache", out_dir="."):
+        self.vehicles = vehicles.reset_index(drop=True)
+        self.orders = orders.reset_index(drop=True) if orders is not None else pd.DataFrame()
+        self.batch_seconds, self.batch_size = float(batch_seconds), int(batch_size)
+        self.options = dict(speed_kmh=speed_kmh, search_seconds=search_seconds, unserved_penalty=unserved_penalty,
+                            ignore_refrig=ignore_refrig, matrix_cache=matrix_cache)
+        self.out_dir = out_dir
+        self.depot = self.day0 = None
+        self.plan = None
+        if routes is not None and stops is not None and len(self.orders):
+            # Plan ya calculado para estos pedidos: es la versión 0
+            self._fix_base(self.orders)
+            self.plan = {'version': 0, 'updated': time.time(), 'orders': len(self.orders), 'routes': routes,
+                         'stops': stops, 'unserved': pd.DataFrame(), 'changed_vehicles': []}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # serializa lotes (hilo de fondo y flush() manual)
+        self._new, self._cancel = {}, set()
+        self._since = time.monotonic() if len(self.orders) and self.plan is None else None
+        self._thread = None
+        self._running = False
+        self.last_error = None
+
+    def _fix_base(self, orders):
+        if self.depot is None and len(orders):
+            self.depot = (float(orders['pickup_lat'].mean()), float(orders['pickup_lon'].mean()))
+            _, self.day0 = soft.iso_to_minutes_since_start(orders['window_start'].iloc[0])
+
+    # --- eventos ---
+    def add_orders(self, rows):
+        with self._cond:
+            for r in rows:
+                self._new[r['order_id']] = dict(r)
+                self._cancel.discard(r['order_id'])
+            self._mark()
+
+    def cancel(self, order_ids):
+        with self._cond:
+            for oid in order_ids:
+                if self._new.pop(oid, None) is None:
+                    self._cancel.add(oid)
+            self._mark()
+
+    def pending(self):
+        with self._cond:
+            return len(self._new) + len(self._cancel)
+
+    def _mark(self):
+        if self._since is None:
+            self._since = time.monotonic()
+        self._cond.notify()
+
+    def _due(self):
+        if self._since is None:
+            return False
+        n = len(self._new) + len(self._cancel)
+        return n >= self.batch_size or time.monotonic() - self._since >= self.batch_seconds
+
+    # --- lotes ---
+    def flush(self):
+        """Procesa ya los eventos pendientes (se llama desde el hilo o a mano). Devuelve el plan vigente.
+        Un solo lote a la vez; si la re-optimización falla, los eventos vuelven a la cola y se re-lanza el error."""
+        with self._flush_lock:
+            with self._cond:
+                new, cancelled = list(self._new.values()), set(self._cancel)
+                self._new, self._cancel, self._since = {}, set(), None
+            try:
+                return self._commit(new, cancelled)
+            except Exception:
+                self._requeue(new, cancelled)
+                raise
+
+    def _commit(self, new, cancelled):
+        orders = apply_events(self.orders, new, cancelled)
+        if not len(orders):
+            return self.plan
+        self._fix_base(orders)
+        t0 = time.perf_counter()
+        routes, stops, unserved, changed = reoptimize(orders, self.vehicles, self.plan, self.depot, self.day0,
+                                                      **self.options)
+        version = (self.plan['version'] if self.plan else 0) + 1
+        plan = {'version': version, 'updated': time.time(), 'orders': len(orders), 'routes': routes,
+                'stops': stops, 'unserved': unserved,
+                'changed_vehicles': [self.vehicles['vehicle_id'].iloc[v] for v in changed]}
+        write_plan(plan, self.out_dir)
+        self.orders, self.plan = orders, plan
+        print(f"[STREAM] Lote v{version}: +{len(new)} / -{len(cancelled)} pedidos, "
+              f"{len(changed)}/{len(self.vehicles)} vehículos re-resueltos en {time.perf_counter() - t0:.1f}s.")
+        return plan
+
+    def _requeue(self, new, cancelled):
+        # Eventos del lote fallido de vuelta a la cola; los que llegaron mientras tanto son más nuevos y ganan
+        with self._cond:
+            for r in new:
+                oid = r['order_id']
+                if oid not in self._new and oid not in self._cancel:
+                    self._new[oid] = r
+            for oid in cancelled:
+                if oid not in self._new:
+                    self._cancel.add(oid)
+            if self._since is None:
+                self._since = time.monotonic()  # reintento en el próximo ciclo (batch_seconds), no en seguida
+
+    def _loop(self):
+        while self._running:
+            with self._cond:
+                if not self._due():
+                    self._cond.wait(timeout=min(1.0, self.batch_seconds))
+                    continue
+            try:
+                self.flush()
+                self.last_error = None
+            except Exception as e:  # el plan anterior sigue vigente
+                self.last_error = str(e)
+                print(f"[WARN] Lote descartado: {e}")
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="order-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+# --- Servicio HTTP ---
+app = FastAPI(title="Order Stream")
+_stream = None
+
+class Cancel(BaseModel):
+    order_ids: List[str]
+
+def _records(df):
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+@app.on_event("startup")
+def start_stream():
+    global _stream
+    orders = pd.read_csv("orders.csv") if os.path.exists("orders.csv") else None
+    routes = stops = None
+    if orders is not None and os.path.exists(ROUTES_PATH) and os.path.exists(STOPS_PATH):
+        routes, stops = pd.read_csv(ROUTES_PATH), pd.read_csv(STOPS_PATH)
+    _stream = OrderStream(
+        pd.read_csv("vehicles.csv"), orders, routes, stops,
+        batch_seconds=float(os.environ.get("STREAM_BATCH_SECONDS", 30)),
+        batch_size=int(os.environ.get("STREAM_BATCH_SIZE", 20)),
+        speed_kmh=float(os.environ.get("STREAM_SPEED_KMH", 50)),
+        search_seconds=int(os.environ.get("STREAM_SEARCH_SECONDS", 10)),
+    ).start()
+
+@app.on_event("shutdown")
+def stop_stream():
+    if _stream is not None:
+        _stream.stop()
+
+@app.get("/health")
+def health():
+    plan = _stream.plan
+    return {"status": "ok", "pending": _stream.pending(), "plan_version": plan['version'] if plan else None,
+            "last_error": _stream.last_error}
+
+@app.post("/orders", status_code=202)
+def add_orders(rows: List[dict]):
+    _stream.add_orders(rows)
+    return {"accepted": len(rows), "pending": _stream.pending()}
+
+@app.post("/cancel", status_code=202)
+def cancel(payload: Cancel):
+    _stream.cancel(payload.order_ids)
+    return {"accepted": len(payload.order_ids), "pending": _stream.pending()}
+
+@app.get("/plan")
+def plan():
+    plan = _stream.plan
+    if plan is None:
+        return {"version": 0, "routes": [], "stops": [], "unserved": []}
+    return {"version": plan['version'], "updated": plan['updated'], "orders": plan['orders'],
+            "changed_vehicles": plan['changed_vehicles'], "routes": _records(plan['routes']),
+            "stops": _records(plan['stops']), "unserved": _records(plan['unserved'])}
@@ -0,0 +1,218 @@
+"""
+Servicio de planificación (FastAPI) con cola de trabajos y pool de procesos
+- POST /jobs recibe pedidos + flota + parámetros (mismo esquema que orders.csv / vehicles.csv) y encola
+- Los planes corren en un pool acotado de procesos que ya tienen importados pandas/OR-Tools y
+  comparten el caché de matrices en disco (.matrix_cache): no se paga el arranque en frío por plan
+- GET /jobs/{job_id} estado (queued / running / done / failed), GET /jobs/{job_id}/result rutas y paradas
+- Trabajos idénticos (misma clave de solve_cache) reutilizan el resultado ya calculado
+- Si un worker muere (OOM, segfault en OR-Tools) el pool queda roto: sus trabajos se marcan failed y el
+  pool se recrea y se vuelve a calentar, así los trabajos siguientes no fallan con BrokenProcessPool
+Requisitos:
+    pip install fastapi uvicorn
+Ejecutar:
+    uvicorn planning_service:app --port 8001
+    PLANNER_WORKERS=4 PLANNER_MAX_QUEUE=200 uvicorn planning_service:app --port 8001
+Ejemplo:
+    curl -X POST localhost:8001/jobs -H 'Content-Type: application/json' \\
+         -d '{"orders": [...], "vehicles": [...], "search_seconds": 30}'
+"""
+import json, os, threading, time, uuid
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+WORKERS = int(os.environ.get("PLANNER_WORKERS", os.cpu_count() or 1))
+MAX_QUEUE = int(os.environ.get("PLANNER_MAX_QUEUE", 100))
+MATRIX_CACHE = os.environ.get("PLANNER_MATRIX_CACHE", ".matrix_cache")
+MAX_JOBS_KEPT = 1000
+
+app = FastAPI(title="Planning Service")
+
+class PlanJob(BaseModel):
+    orders: List[dict]
+    vehicles: List[dict]
+    speed_kmh: float = 50.0
+    late_penalty: float = 6.0
+    early_penalty: float = 1.0
+    ignore_refrigerated: bool = False
+    search_seconds: int = 30
+    allow_unserved: bool = False
+    unserved_penalty: int = 100_000
+
+# --- Lado worker (proceso del pool) ---
+def _warm_worker():
+    """Inicializador del pool: imports pesados una sola vez por proceso."""
+    import pandas, ortools.constraint_solver.pywrapcp  # noqa: F401
+    import vrp_advanced_soft  # noqa: F401
+
+def _frame_records(df):
+    return json.loads(df.to_json(orient="records"))
+
+def run_job(params):
+    """Resuelve un plan (soft) en el proceso worker. Devuelve un dict JSON-serializable."""
+    import pandas as pd
+    import vrp_advanced_soft as soft
+    orders, vehicles = pd.DataFrame(params['orders']), pd.DataFrame(params['vehicles'])
+    data = soft.prepare_data(orders, vehicles, params['speed_kmh'], params['ignore_refrigerated'],
+                             matrix_cache=MATRIX_CACHE)
+    penalty = params['unserved_penalty'] if params['allow_unserved'] else 0
+    result = soft.solve(data, params['late_penalty'], params['early_penalty'], params['search_seconds'],
+                        unserved_penalty=penalty)
+    if result is None:
+        raise RuntimeError("No se encontró solución (soft). Revisa capacidades extremas o coordenadas.")
+    routes_df, stops_df = soft.plan_frames(data, result)
+    return {
+        'objective': result['objective'],
+        'routes': _frame_records(routes_df),
+        'stops': _frame_records(stops_df),
+        'unserved': _frame_records(soft.unserved_frame(data, result, penalty)),
+    }
+
+# --- Lado servidor ---
+_lock = threading.Lock()
+_jobs = {}      # job_id -> dict de estado
+_by_key = {}    # clave de solve_cache -> job_id
+_pool = None
+_restarts = 0
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: no heredar hilos del servidor en los workers
+        _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=mp.get_context("spawn"),
+                                    initializer=_warm_worker)
+    return _pool
+
+def _warm(pool):
+    """Levanta los workers (y sus imports) sin esperar a que terminen."""
+    return [pool.submit(time.sleep, 0) for _ in range(WORKERS)]
+
+def _replace_pool(broken):
+    """Recrea y calienta el pool si sigue siendo el roto (idempotente). Se llama con _lock tomado."""
+    global _pool, _restarts
+    if _pool is not broken:
+        return _get_pool()
+    print("[WARN] Un worker del pool murió (BrokenProcessPool): se recrea el pool.")
+    broken.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+    _restarts += 1
+    pool = _get_pool()
+    _warm(pool)
+    return pool
+
+def _job_key(params):
+    import pandas as pd
+    import distance_matrix, matrix_cache
+    import vrp_advanced_soft as soft
+    from solve_cache import cache_key, solver_version
+    rest = {k: v for k, v in params.items() if k not in ('orders', 'vehicles')}
+    return cache_key(pd.DataFrame(params['orders']), pd.DataFrame(params['vehicles']),
+                     dict(rest, solver="planning_service"), solver_version(soft, distance_matrix, matrix_cache))
+
+def _pending():
+    return sum(1 for j in _jobs.values() if j['status'] in ("queued", "running"))
+
+def _forget_old():
+    """Acota la memoria: descarta los trabajos terminados más viejos."""
+    done = [jid for jid, j in _jobs.items() if j['status'] in ("done", "failed")]
+    for jid in done[:max(0, len(_jobs) - MAX_JOBS_KEPT)]:
+        job = _jobs.pop(jid)
+        if _by_key.get(job['key']) == jid:
+            del _by_key[job['key']]
+
+def _on_done(job_id, future):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return
+        job['finished'] = time.time()
+        exc = future.exception()
+        if exc is None:
+            job.update(status="done", result=future.result())
+        else:
+            if isinstance(exc, BrokenProcessPool):
+                exc = f"worker caído durante el plan ({exc})"
+                _replace_pool(job['pool'])
+            job.update(status="failed", error=str(exc))
+            if _by_key.get(job['key']) == job_id:
+                del _by_key[job['key']]
+        job['future'] = job['pool'] = None
+
+def _status(job_id, job):
+    status = job['status']
+    if status == "queued" and job['future'] is not None and job['future'].running():
+        status = "running"
+    out = {'job_id': job_id, 'status': status, 'submitted': job['submitted'],
+           'finished': job['finished'], 'orders': job['orders']}
+    if job['error']:
+        out['error'] = job['error']
+    return out
+
+@app.on_event("startup")
+def warm_up():
+    # Levanta los workers (y sus imports) antes del primer pedido
+    for f in _warm(_get_pool()):
+        f.result()
+
+@app.on_event("shutdown")
+def stop_pool():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+@app.get("/health")
+def health():
+    with _lock:
+        return {"status": "ok", "workers": WORKERS, "pending": _pending(), "jobs": len(_jobs),
+                "pool_restarts": _restarts}
+
+@app.post("/jobs", status_code=202)
+def submit(payload: PlanJob):
+    params = payload.model_dump()
+    if not params['orders'] or not params['vehicles']:
+        raise HTTPException(status_code=422, detail="orders y vehicles no pueden estar vacíos")
+    key = _job_key(params)
+    with _lock:
+        prev = _by_key.get(key)
+        if prev is not None and prev in _jobs:
+            # Mismo contenido: se reutiliza el trabajo (terminado o en curso)
+            return _status(prev, _jobs[prev])
+        if _pending() >= MAX_QUEUE:
+            raise HTTPException(status_code=429, detail=f"Cola llena ({MAX_QUEUE} trabajos pendientes)")
+        job_id = uuid.uuid4().hex[:12]
+        job = {'status': "queued", 'submitted': time.time(), 'finished': None, 'orders': len(params['orders']),
+               'key': key, 'result': None, 'error': None, 'future': None, 'pool': None}
+        _jobs[job_id] = job
+        _by_key[key] = job_id
+        _forget_old()
+        pool = _get_pool()
+        try:
+            future = pool.submit(run_job, params)
+        except BrokenProcessPool:
+            pool = _replace_pool(pool)
+            future = pool.submit(run_job, params)
+        job['future'], job['pool'] = future, pool
+    job['future'].add_done_callback(lambda f: _on_done(job_id, f))
+    return _status(job_id, job)
+
+@app.get("/jobs/{job_id}")
+def status(job_id: str):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Trabajo inexistente")
+        return _status(job_id, job)
+
+@app.get("/jobs/{job_id}/result")
+def result(job_id: str):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Trabajo inexistente")
+        if job['status'] == "failed":
+            raise HTTPException(status_code=500, detail=job['error'])
+        if job['status'] != "done":
+            raise HTTPException(status_code=409, detail=f"Trabajo todavía {_status(job_id, job)['status']}")
+        return dict(_status(job_id, job), **job['result'])
@@ -0,0 +1,109 @@
+"""
+profiling.py
+Instrumentación liviana por etapas para los scripts de planificación.
+- span("nombre") como context manager: tiempo de reloj, tiempo de CPU y pico de memoria (tracemalloc)
+  de la etapa; los spans se anidan (build_vrp > prepare_data > matrix ...)
+- Desactivado por defecto: sin costo más allá de una llamada a función por span
+- Se activa con la variable de entorno VRP_PROFILE=1 o con --profile 1 en los CLI
+- Al terminar el proceso escribe un trace JSON por corrida en traces/<script>_<fecha>.json
+  (directorio configurable con VRP_PROFILE_DIR)
+
+tracemalloc solo ve memoria asignada desde Python/NumPy: lo que reserva OR-Tools en C++ no aparece.
+
+Uso:
+  VRP_PROFILE=1 python vrp_advanced_soft.py --search_seconds 30
+  python vrp_pipeline.py --profile 1
+Desde código:
+  from profiling import span
+  with span("matrix", nodes=len(nodes)):
+      ...
+"""
+import atexit, json, os, sys, time, tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+ENV_VAR = "VRP_PROFILE"
+DIR_ENV_VAR = "VRP_PROFILE_DIR"
+DEFAULT_DIR = "traces"
+
+_state = {'enabled': False, 'run': None, 'spans': [], 'stack': [], 'started': None, 'path': None}
+
+def enabled():
+    return _state['enabled']
+
+def enable(run_name=None, trace_dir=None):
+    """Activa la instrumentación para este proceso (idempotente) y programa el trace al salir."""
+    if _state['enabled']:
+        return
+    _state.update(enabled=True, run=run_name or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0],
+                  started=time.perf_counter(), spans=[], stack=[])
+    trace_dir = trace_dir or os.environ.get(DIR_ENV_VAR, DEFAULT_DIR)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    _state['path'] = os.path.join(trace_dir, f"{_state['run']}_{stamp}_{os.getpid()}.json")
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    atexit.register(write_trace)
+
+def setup(flag=0, run_name=None):
+    """Activa si --profile 1 o si VRP_PROFILE está definida (y no es 0)."""
+    if flag or os.environ.get(ENV_VAR, "0") not in ("", "0"):
+        enable(run_name)
+
+@contextmanager
+def span(name, **attrs):
+    if not _state['enabled']:
+        yield
+        return
+    stack = _state['stack']
+    current, peak = tracemalloc.get_traced_memory()
+    # El pico acumulado hasta acá pertenece al span padre
+    if stack:
+        stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+    tracemalloc.reset_peak()
+    frame = {'name': name, 'mem0': current, 'peak': current,
+             'wall0': time.perf_counter(), 'cpu0': time.process_time()}
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        stack.pop()
+        frame['peak'] = max(frame['peak'], peak)
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], frame['peak'])
+        tracemalloc.reset_peak()
+        _state['spans'].append({
+            'name': name,
+            'path': "/".join([f['name'] for f in stack] + [name]),
+            'depth': len(stack),
+            'start_s': round(frame['wall0'] - _state['started'], 4),
+            'wall_s': round(time.perf_counter() - frame['wall0'], 4),
+            'cpu_s': round(time.process_time() - frame['cpu0'], 4),
+            'peak_alloc_mb': round((frame['peak'] - frame['mem0']) / 2**20, 2),
+            'attrs': attrs,
+        })
+
+def trace():
+    """Trace actual como dict (spans ordenados por inicio)."""
+    return {
+        'run': _state['run'],
+        'argv': sys.argv,
+        'pid': os.getpid(),
+        'created': datetime.now().isoformat(timespec="seconds"),
+        'total_wall_s': round(time.perf_counter() - _state['started'], 4) if _state['started'] else 0.0,
+        'peak_traced_mb': round(tracemalloc.get_traced_memory()[1] / 2**20, 2) if tracemalloc.is_tracing() else None,
+        'spans': sorted(_state['spans'], key=lambda s: (s['start_s'], s['depth'])),
+    }
+
+def write_trace(path=None):
+    if not _state['enabled'] or not _state['spans']:
+        return None
+    path = path or _state['path']
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(trace(), f, indent=2, ensure_ascii=False, default=str)
+    top = [s for s in _state['spans'] if s['depth'] == 0]
+    summary = ", ".join(f"{s['name']} {s['wall_s']:.2f}s" for s in sorted(top, key=lambda s: s['start_s']))
+    print(f"[PROFILE] {summary} -> {path}")
+    _state['spans'] = []
+    return path
@@ -0,0 +1,411 @@
+"""
+route_postopt.py
+Post-optimización de un plan existente sin volver a resolver: 2-opt, or-opt y relocate (intra e inter ruta)
++ 2-opt* (intercambio de colas entre rutas).
+- Lee routes_plan.csv (VRP simple de vrp_or_tools_demo.py: solo drops, capacidad kg, costo en metros)
+  o un plan P&D (stops_plan_advanced.csv / routes_plan_advanced.csv: pickup antes que drop en el mismo
+  vehículo, capacidad kg/m³, frío y ventanas; costo = minutos de viaje + servicio + atraso x --late_penalty
+  + adelanto x --early_penalty, el mismo objetivo que vrp_advanced_soft: los horarios de cada ruta son los
+  de menor penalización, con esperas de hasta SLACK_MAX minutos como la dimensión de tiempo del soft)
+- Los deltas de cada tipo de movimiento se calculan en bloque con NumPy sobre la matriz del caché
+  (.matrix_cache); los mejores candidatos se verifican exactos (precedencia, capacidad, ventanas) y
+  se aplica el primero que mejora. Se repite hasta que ningún movimiento mejora o se acaba el tiempo
+- Escribe el plan mejorado con el mismo esquema (por defecto pisa los archivos de entrada)
+
+Uso:
+  python route_postopt.py --plan routes_plan.csv
+  python route_postopt.py --plan stops_plan_advanced.csv --speed_kmh 50 --seconds 20
+"""
+import argparse, heapq, sys, time
+import numpy as np
+import pandas as pd
+from matrix_cache import cached_matrices
+from insertion_heuristic import HORIZON, INF, insertion_costs, node_arrays, route_state, routes_result
+
+MAX_CHECKS = 64   # candidatos por tipo de movimiento que se verifican exactos
+OR_OPT_LENGTHS = (1, 2, 3)
+SLACK_MAX = 600   # espera máxima por nodo (igual que la dimensión de tiempo de vrp_advanced_soft)
+_PINNED = 10**18  # peso "infinito": el inicio de la ruta queda fijo en 0
+
+def window_penalty(s, A, late_penalty, early_penalty, slack_max=SLACK_MAX):
+    """Penalización mínima por ventanas suaves de la ruta s (depot al inicio): min sobre horarios b con
+    b[k] - b[k-1] - (servicio + viaje) en [0, slack_max] de sum early x (tws - b)+ + late x (b - twe)+.
+    Slope trick: la función costo(b[k]) es convexa lineal a trozos; L/R guardan sus quiebres con peso."""
+    T, S, tws, twe = A['T'], A['S'], A['tws'], A['twe']
+    L, R = [(0, _PINNED)], [(0, _PINNED)]   # L: max-heap (valores negados), R: min-heap; crudos + offset
+    off_l = off_r = best = 0
+    for k in range(1, len(s)):
+        d = int(S[s[k-1]] + T[s[k-1], s[k]])
+        off_l += d
+        off_r += d + slack_max
+        # + early x (tws - b)+: los quiebres de R a la izquierda de tws pasan a L
+        a, w = int(tws[s[k]]), int(early_penalty)
+        while w > 0:
+            p, c = R[0][0] + off_r, R[0][1]
+            if a <= p:
+                heapq.heappush(L, (-(a - off_l), w))
+                break
+            t = min(c, w)
+            best += t * (a - p)
+            if c > t:
+                heapq.heapreplace(R, (R[0][0], c - t))
+            else:
+                heapq.heappop(R)
+            heapq.heappush(L, (-(p - off_l), t))
+            heapq.heappush(R, (a - off_r, t))
+            w -= t
+        # + late x (b - twe)+: simétrico, de L a R
+        a, w = int(twe[s[k]]), int(late_penalty)
+        while w > 0:
+            q, c = -L[0][0] + off_l, L[0][1]
+            if a >= q:
+                heapq.heappush(R, (a - off_r, w))
+                break
+            t = min(c, w)
+            best += t * (q - a)
+            if c > t:
+                heapq.heapreplace(L, (L[0][0], c - t))
+            else:
+                heapq.heappop(L)
+            heapq.heappush(R, (q - off_r, t))
+            heapq.heappush(L, (-(a - off_l), t))
+            w -= t
+    return best
+
+# --- Problemas: costo exacto y factibilidad por ruta ---
+class CvrpProblem:
+    """VRP simple (routes_plan.csv): nodos = depot + drops, capacidad kg, costo en metros."""
+    pd_mode = False
+
+    def __init__(self, nodes, dist_m, vehicles, routes):
+        self.nodes, self.vehicles, self.routes = nodes, vehicles, routes
+        self.vehicle_ids = list(vehicles['vehicle_id'])
+        self.C = np.asarray(dist_m, dtype=np.int64)
+        self.q = np.array([n['demand'] for n in nodes], dtype=np.float64)
+        self.cap = vehicles['capacity_kg'].to_numpy(float)
+
+    def cost(self, v, seq):
+        if self.q[seq].sum() > self.cap[v] + 1e-9:
+            return None
+        full = np.asarray([0] + list(seq) + [0])
+        return int(self.C[full[:-1], full[1:]].sum())
+
+class PdProblem:
+    """Pickup & Delivery (planes de vrp_advanced_soft): precedencia, capacidad kg/m³, frío y atraso."""
+    pd_mode = True
+
+    def __init__(self, data, routes, late_penalty=6, early_penalty=1):
+        self.data, self.routes = data, routes
+        self.late_penalty, self.early_penalty = late_penalty, early_penalty
+        self.A = node_arrays(data)
+        self.C = self.A['T']
+        vehicles = data['vehicles']
+        self.vehicle_ids = list(vehicles['vehicle_id'])
+        self.cap_kg = vehicles['capacity_kg'].to_numpy(float)
+        self.cap_m3 = vehicles['capacity_m3'].to_numpy(float)
+        self.partner = np.zeros(len(data['nodes']), dtype=np.int64)
+        self.is_pickup = np.zeros(len(data['nodes']), dtype=bool)
+        for p, d in data['pd_pairs']:
+            self.partner[p], self.partner[d] = d, p
+            self.is_pickup[p] = True
+        refrig = vehicles['refrigerated'].to_numpy(int) == 1
+        self.refrig_ok = np.ones((len(data['nodes']), len(vehicles)), dtype=bool)
+        if not data['ignore_refrig'] and refrig.any():
+            for i, n in enumerate(data['nodes']):
+                if n['refrig_req'] == 1:
+                    self.refrig_ok[i] = refrig
+        self.no_windows = np.full_like(self.A['twe'], HORIZON)
+
+    def cost(self, v, seq):
+        seq = np.asarray(seq, dtype=np.int64)
+        if len(seq):
+            if not self.refrig_ok[seq, v].all():
+                return None
+            pos = np.empty(len(self.partner), dtype=np.int64)
+            pos[seq] = np.arange(len(seq))
+            pick = seq[self.is_pickup[seq]]
+            if (pos[pick] >= pos[self.partner[pick]]).any() or not np.isin(self.partner[seq], seq).all():
+                return None
+            if (np.cumsum(self.A['kg'][seq]) > self.cap_kg[v] + 1e-9).any():
+                return None
+            if (np.cumsum(self.A['m3'][seq]) > self.cap_m3[v] + 1e-9).any():
+                return None
+        s = np.r_[0, seq, 0]
+        penalty = window_penalty(s, self.A, self.late_penalty, self.early_penalty)
+        return int((self.C[s[:-1], s[1:]] + self.A['S'][s[:-1]]).sum() + penalty)
+
+# --- Generadores de movimientos: (deltas, decodificador) con deltas vectorizados ---
+def _full(seq):
+    return np.r_[0, np.asarray(seq, dtype=np.int64), 0]
+
+def two_opt(pb, v):
+    """Invertir el tramo a[i..j] de la ruta v."""
+    a = _full(pb.routes[v])
+    n = len(a)
+    if n < 4:
+        return None
+    C = pb.C
+    F = np.r_[0, np.cumsum(C[a[:-1], a[1:]])]      # F[k] = costo de arcos hasta a[k]
+    B = np.r_[0, np.cumsum(C[a[1:], a[:-1]])]
+    i = np.arange(1, n - 1)[:, None]
+    j = np.arange(1, n - 1)[None, :]
+    delta = (C[a[i-1], a[j]] + C[a[i], a[j+1]] - C[a[i-1], a[i]] - C[a[j], a[j+1]]
+             + (B[j] - B[i]) - (F[j] - F[i])).astype(np.float64)
+    delta[j <= i] = np.inf
+    def decode(k):
+        ii, jj = np.unravel_index(k, delta.shape)
+        ii, jj = ii + 1, jj + 1
+        seq = list(a[1:-1])
+        return [(v, seq[:ii-1] + seq[ii-1:jj][::-1] + seq[jj:])]
+    return delta.ravel(), decode
+
+def or_opt(pb, v, k):
+    """Mover el tramo a[i..i+k-1] a otra posición de la misma ruta (entre a[q] y a[q+1])."""
+    a = _full(pb.routes[v])
+    n = len(a)
+    if n - 2 < k + 1:
+        return None
+    C = pb.C
+    i = np.arange(1, n - k)[:, None]                 # inicio del tramo
+    q = np.arange(0, n - 1)[None, :]                 # arco (a[q], a[q+1]) donde se inserta
+    e = i + k - 1
+    delta = (C[a[i-1], a[e+1]] - C[a[i-1], a[i]] - C[a[e], a[e+1]]
+             + C[a[q], a[i]] + C[a[e], a[q+1]] - C[a[q], a[q+1]]).astype(np.float64)
+    delta[(q >= i - 1) & (q <= e)] = np.inf
+    def decode(idx):
+        ii, qq = np.unravel_index(idx, delta.shape)
+        ii += 1
+        seq = list(a)
+        seg = seq[ii:ii+k]
+        rest = seq[:ii] + seq[ii+k:]
+        at = qq + 1 if qq < ii else qq + 1 - k
+        new = rest[:at] + seg + rest[at:]
+        return [(v, new[1:-1])]
+    return delta.ravel(), decode
+
+def relocate(pb, v2):
+    """Mover un nodo (VRP simple) o un par pickup/drop (P&D) de otra ruta a la ruta v2."""
+    C, routes = pb.C, pb.routes
+    src = [(v, pos) for v, r in enumerate(routes) if v != v2 for pos in range(len(r))]
+    if not src:
+        return None
+    b = _full(routes[v2])
+    if not pb.pd_mode:
+        vs = np.array([v for v, _ in src]); ps = np.array([p for _, p in src])
+        full = [_full(r) for r in routes]
+        prev = np.array([full[v][p] for v, p in src]); u = np.array([full[v][p+1] for v, p in src])
+        nxt = np.array([full[v][p+2] for v, p in src])
+        gain = C[prev, u] + C[u, nxt] - C[prev, nxt]
+        ins = C[b[:-1][None, :], u[:, None]] + C[u[:, None], b[1:][None, :]] - C[b[:-1], b[1:]][None, :]
+        delta = (ins - gain[:, None]).astype(np.float64)
+        delta[pb.q[b].sum() + pb.q[u] > pb.cap[v2] + 1e-9] = np.inf
+        def decode(idx):
+            r, q = np.unravel_index(idx, delta.shape)
+            v1, p = int(vs[r]), int(ps[r])
+            s1 = list(routes[v1]); node = s1.pop(p)
+            s2 = list(routes[v2]); s2.insert(q, node)
+            return [(v1, s1), (v2, s2)]
+        return delta.ravel(), decode
+    # P&D: pares completos; la inserción se evalúa con insertion_costs (capacidad y precedencia, sin ventanas)
+    pairs = [(v, int(n)) for v, p in src for n in [routes[v][p]] if pb.is_pickup[n]]
+    pairs = [(v, n) for v, n in pairs if pb.refrig_ok[n, v2]]
+    if not pairs:
+        return None
+    P = np.array([n for _, n in pairs]); D = pb.partner[P]
+    gain = np.empty(len(pairs))
+    for r, (v, n) in enumerate(pairs):
+        a = _full(routes[v])
+        ip = int(np.flatnonzero(a == n)[0]); idd = int(np.flatnonzero(a == pb.partner[n])[0])
+        if idd == ip + 1:
+            gain[r] = C[a[ip-1], a[ip]] + C[a[ip], a[idd]] + C[a[idd], a[idd+1]] - C[a[ip-1], a[idd+1]]
+        else:
+            gain[r] = (C[a[ip-1], a[ip]] + C[a[ip], a[ip+1]] - C[a[ip-1], a[ip+1]]
+                       + C[a[idd-1], a[idd]] + C[a[idd], a[idd+1]] - C[a[idd-1], a[idd+1]])
+    st = route_state(b, pb.A, pb.no_windows)
+    ins, pi, pj = insertion_costs(st, P, D, pb.A, pb.no_windows, pb.cap_kg[v2], pb.cap_m3[v2])
+    delta = np.where(ins < INF, ins - gain, np.inf)
+    def decode(r):
+        v1, n = pairs[r]
+        s1 = [x for x in routes[v1] if x != n and x != pb.partner[n]]
+        seq = list(b)
+        i, j = int(pi[r]), int(pj[r])
+        new = seq[:i+1] + [n] + seq[i+1:j+1] + [int(pb.partner[n])] + seq[j+1:]
+        return [(v1, s1), (v2, new[1:-1])]
+    return delta, decode
+
+def two_opt_star(pb, v1, v2):
+    """Intercambiar colas: a[:i+1] + b[j+1:] y b[:j+1] + a[i+1:]. En P&D solo se corta sin pares abiertos."""
+    a, b = _full(pb.routes[v1]), _full(pb.routes[v2])
+    if len(a) + len(b) <= 4:
+        return None
+    C = pb.C
+    i = np.arange(0, len(a) - 1)[:, None]
+    j = np.arange(0, len(b) - 1)[None, :]
+    delta = (C[a[i], b[j+1]] + C[b[j], a[i+1]] - C[a[i], a[i+1]] - C[b[j], b[j+1]]).astype(np.float64)
+    if pb.pd_mode:
+        open_a = np.cumsum(np.where(pb.is_pickup[a], 1, np.where(np.arange(len(a)) > 0, -1, 0)))
+        open_b = np.cumsum(np.where(pb.is_pickup[b], 1, np.where(np.arange(len(b)) > 0, -1, 0)))
+        # depot final no cuenta como drop
+        open_a[-1] = open_a[-2] if len(a) > 1 else 0
+        open_b[-1] = open_b[-2] if len(b) > 1 else 0
+        delta[(open_a[:-1] != 0)[:, None] | (open_b[:-1] != 0)[None, :]] = np.inf
+    else:
+        la, lb = np.cumsum(pb.q[a]), np.cumsum(pb.q[b])
+        new1 = la[:-1][:, None] + (lb[-1] - lb[:-1])[None, :]
+        new2 = lb[:-1][None, :] + (la[-1] - la[:-1])[:, None]
+        delta[(new1 > pb.cap[v1] + 1e-9) | (new2 > pb.cap[v2] + 1e-9)] = np.inf
+    def decode(idx):
+        ii, jj = np.unravel_index(idx, delta.shape)
+        s1 = list(a[:ii+1]) + list(b[jj+1:])
+        s2 = list(b[:jj+1]) + list(a[ii+1:])
+        return [(v1, s1[1:-1]), (v2, s2[1:-1])]
+    return delta.ravel(), decode
+
+def candidate_moves(pb):
+    V = len(pb.routes)
+    for v in range(V):
+        yield "2opt", two_opt(pb, v)
+        for k in OR_OPT_LENGTHS:
+            yield "oropt", or_opt(pb, v, k)
+    for v2 in range(V):
+        yield "relocate", relocate(pb, v2)
+    for v1 in range(V):
+        for v2 in range(v1 + 1, V):
+            if pb.routes[v1] or pb.routes[v2]:
+                yield "2opt*", two_opt_star(pb, v1, v2)
+
+def improve(pb, seconds=20.0, max_checks=MAX_CHECKS, verbose=True):
+    """Aplica movimientos mejoradores hasta óptimo local o límite de tiempo. Devuelve estadísticas."""
+    t0 = time.perf_counter()
+    costs = [pb.cost(v, r) for v, r in enumerate(pb.routes)]
+    if any(c is None for c in costs):
+        bad = [pb.vehicle_ids[v] for v, c in enumerate(costs) if c is None]
+        print(f"[WARN] Rutas de entrada no factibles (se dejan como están): {bad}")
+    start_total = sum(c for c in costs if c is not None)
+    applied = {}
+    improved = True
+    while improved and time.perf_counter() - t0 < seconds:
+        improved = False
+        for name, move in candidate_moves(pb):
+            if move is None:
+                continue
+            delta, decode = move
+            order = np.flatnonzero(delta < 0)
+            if not len(order):
+                continue
+            order = order[np.argsort(delta[order], kind="stable")][:max_checks]
+            for idx in order:
+                changes = decode(int(idx))
+                if any(costs[v] is None for v, _ in changes):
+                    continue
+                new = [pb.cost(v, seq) for v, seq in changes]
+                if any(c is None for c in new):
+                    continue
+                if sum(new) < sum(costs[v] for v, _ in changes):
+                    for (v, seq), c in zip(changes, new):
+                        pb.routes[v] = [int(x) for x in seq]
+                        costs[v] = c
+                    applied[name] = applied.get(name, 0) + 1
+                    improved = True
+                    break
+            if improved or time.perf_counter() - t0 >= seconds:
+                break
+    total = sum(c for c in costs if c is not None)
+    stats = {'before': start_total, 'after': total, 'moves': applied, 'seconds': round(time.perf_counter() - t0, 2)}
+    if verbose:
+        moves = ", ".join(f"{k} {v}" for k, v in applied.items()) or "ninguno"
+        print(f"[POSTOPT] costo {start_total} -> {total} ({moves}) en {stats['seconds']:.1f}s.")
+    return stats
+
+# --- Entrada / salida ---
+def _seq_tokens(route_sequence):
+    return [t.strip() for t in str(route_sequence).split("->") if t.strip() and t.strip() != "DEPOT"]
+
+def plan_kind(df):
+    if 'stop_node' in df.columns:
+        return "pd"
+    if 'route_sequence' in df.columns:
+        tokens = [t for s in df['route_sequence'] for t in _seq_tokens(s)]
+        return "pd" if tokens and all(t[:2] in ("P_", "D_") for t in tokens) else "cvrp"
+    raise ValueError("El plan necesita columna stop_node (stops plan) o route_sequence (routes plan).")
+
+def load_cvrp(plan, orders, vehicles, matrix_cache):
+    import vrp_or_tools_demo as demo
+    nodes = demo.build_nodes(orders)
+    lat, lon = [n['lat'] for n in nodes], [n['lon'] for n in nodes]
+    km, _ = cached_matrices(lat, lon, 1.0, method=demo.DIST_METHOD, cache_dir=matrix_cache)
+    dist_m = (np.asarray(km, dtype=np.float64) * 1000.0).astype(np.int32)
+    idx = {n['id']: i for i, n in enumerate(nodes) if i > 0}
+    vehicles = vehicles.reset_index(drop=True)
+    by_vid = {vid: _seq_tokens(s) for vid, s in zip(plan['vehicle_id'], plan['route_sequence'])}
+    routes = [[idx[t] for t in by_vid.get(vid, []) if t in idx] for vid in vehicles['vehicle_id']]
+    return CvrpProblem(nodes, dist_m, vehicles, routes)
+
+def cvrp_rows(pb):
+    rows = []
+    for v, r in enumerate(pb.routes):
+        veh = pb.vehicles.iloc[v]
+        full = [0] + r + [0]
+        rows.append({
+            'vehicle_id': veh['vehicle_id'],
+            'vehicle_type': veh['type'],
+            'capacity_kg': veh['capacity_kg'],
+            'route_sequence': " -> ".join(pb.nodes[i]['id'] for i in full),
+            'total_distance_km': round(int(pb.C[full[:-1], full[1:]].sum()) / 1000, 2),
+            'total_load_kg': int(pb.q[r].sum()),
+        })
+    return rows
+
+def load_pd(plan, orders, vehicles, speed_kmh, ignore_refrig, matrix_cache, late_penalty, early_penalty):
+    import vrp_advanced_soft as soft
+    from warm_start import routes_from_stops_plan
+    data = soft.prepare_data(orders, vehicles, speed_kmh, ignore_refrig, matrix_cache=matrix_cache)
+    if 'stop_node' not in plan.columns:
+        plan = pd.DataFrame([{'vehicle_id': vid, 'stop_node': t}
+                             for vid, s in zip(plan['vehicle_id'], plan['route_sequence']) for t in _seq_tokens(s)])
+    routes, stats = routes_from_stops_plan(data, plan)
+    if stats['dropped'] or stats['cancelled']:
+        print(f"[WARN] {stats['dropped'] + stats['cancelled']} pedidos del plan no se pudieron mapear y quedan fuera.")
+    return PdProblem(data, routes, late_penalty, early_penalty)
+
+def main(args):
+    plan = pd.read_csv(args.plan)
+    orders, vehicles = pd.read_csv(args.orders), pd.read_csv(args.vehicles)
+    kind = plan_kind(plan)
+    if kind == "cvrp":
+        pb = load_cvrp(plan, orders, vehicles, args.matrix_cache)
+        improve(pb, args.seconds)
+        out = args.out or args.plan
+        pd.DataFrame(cvrp_rows(pb)).to_csv(out, index=False)
+        print(f"OK -> {out} actualizado (VRP simple).")
+        return
+    import vrp_advanced_soft as soft
+    pb = load_pd(plan, orders, vehicles, args.speed_kmh, bool(args.ignore_refrigerated), args.matrix_cache,
+                 args.late_penalty, args.early_penalty)
+    stats = improve(pb, args.seconds)
+    result = routes_result(pb.data, pb.routes, args.late_penalty)
+    result['objective'] = stats['after']  # con adelanto y horarios óptimos (routes_result solo suma atraso)
+    is_stops = 'stop_node' in plan.columns
+    stops_out = args.out or (args.plan if is_stops else "stops_plan_advanced.csv")
+    routes_out = args.routes_out or (args.plan if not is_stops else "routes_plan_advanced.csv")
+    soft.export_plan(pb.data, result, routes_path=routes_out, stops_path=stops_out)
+    print(f"OK -> {routes_out} y {stops_out} actualizados (P&D, objetivo {result['objective']}).")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plan", type=str, default="routes_plan.csv", help="routes_plan.csv, stops_plan_advanced.csv o routes_plan_advanced.csv")
+    ap.add_argument("--orders", type=str, default="orders.csv")
+    ap.add_argument("--vehicles", type=str, default="vehicles.csv")
+    ap.add_argument("--out", type=str, default="", help="salida (default: pisa --plan); en P&D es el stops plan")
+    ap.add_argument("--routes_out", type=str, default="", help="P&D: routes plan de salida (default: routes_plan_advanced.csv)")
+    ap.add_argument("--seconds", type=float, default=20.0, help="tiempo máximo de mejora")
+    ap.add_argument("--speed_kmh", type=float, default=50.0, help="P&D: misma velocidad que la corrida original")
+    ap.add_argument("--late_penalty", type=int, default=6, help="P&D: igual que vrp_advanced_soft")
+    ap.add_argument("--early_penalty", type=int, default=1, help="P&D: igual que vrp_advanced_soft")
+    ap.add_argument("--ignore_refrigerated", type=int, default=0)
+    ap.add_argument("--matrix_cache", type=str, default=".matrix_cache", help="directorio del caché de distancias ('' = desactivar)")
+    args = ap.parse_args()
+    try:
+        main(args)
+    except ValueError as e:
+        sys.exit(str(e))
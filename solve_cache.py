@@ -0,0 +1,131 @@
+"""
+solve_cache.py
+Caché direccionado por contenido de planes ya resueltos.
+- Clave = sha256 de: pedidos y flota normalizados (columnas y filas ordenadas), parámetros del solver
+  (velocidad, penalizaciones, tiempo de búsqueda, ...) y versión del solver (OR-Tools + fuente de los módulos)
+- Cada entrada es un directorio .solve_cache/<clave>/ con los CSV de salida (routes/stops/unserved) y meta.json
+- Un pedido repetido restaura los CSV al instante en lugar de volver a resolver
+- Tope de tamaño con expulsión LRU (misma política que matrix_cache.evict_lru)
+
+Uso:
+  from solve_cache import SolveCache, cache_key, solver_version
+  cache = SolveCache(".solve_cache")
+  key = cache_key(orders, vehicles, {'speed_kmh': 50, ...}, solver_version(soft))
+  meta = cache.restore(key)          # None si no está
+  ...
+  cache.store(key, ["routes_plan_advanced.csv", "stops_plan_advanced.csv"], {'label': 'soft'})
+Estado / limpieza:
+  python solve_cache.py [--clear 1]
+"""
+import hashlib, json, os, shutil
+from datetime import datetime
+from matrix_cache import dir_size, evict_lru, touch
+
+DEFAULT_DIR = ".solve_cache"
+DEFAULT_MAX_MB = 256
+META = "meta.json"
+ID_COLUMNS = ("order_id", "vehicle_id")
+
+def normalize_frame(df):
+    """CSV canónico: nombres de columna sin espacios, columnas en orden alfabético y filas por id."""
+    if df is None:
+        return b""
+    out = df.copy()
+    out.columns = [str(c).strip() for c in out.columns]
+    out = out[sorted(out.columns)]
+    by = [c for c in ID_COLUMNS if c in out.columns] or list(out.columns)
+    out = out.astype(str).sort_values(by, kind="mergesort")
+    return out.to_csv(index=False).encode("utf-8")
+
+def solver_version(*modules):
+    """Versión de OR-Tools + hash del código fuente de los módulos que resuelven (módulos importados o
+    rutas a sus .py, así no hace falta importar los opcionales solo para hashearlos)."""
+    import ortools
+    h = hashlib.sha256(ortools.__version__.encode())
+    for m in modules:
+        with open(m if isinstance(m, str) else m.__file__, "rb") as f:
+            h.update(f.read())
+    return f"ortools-{ortools.__version__}+{h.hexdigest()[:12]}"
+
+def file_digest(path):
+    """Hash del contenido de un archivo de entrada extra (p. ej. --warm_start); '' si no hay."""
+    if not path or not os.path.exists(path):
+        return ""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def cache_key(orders, vehicles, params, version):
+    h = hashlib.sha256()
+    h.update(json.dumps({'params': params, 'version': version}, sort_keys=True, default=str).encode())
+    h.update(b"\0orders\0" + normalize_frame(orders))
+    h.update(b"\0vehicles\0" + normalize_frame(vehicles))
+    return h.hexdigest()[:32]
+
+class SolveCache:
+    def __init__(self, root=DEFAULT_DIR, max_mb=DEFAULT_MAX_MB):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def lookup(self, key):
+        """meta.json de la entrada si existe completa, si no None."""
+        path = self._entry(key)
+        try:
+            with open(os.path.join(path, META), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not all(os.path.exists(os.path.join(path, name)) for name in meta.get('files', [])):
+            return None
+        return meta
+
+    def restore(self, key, dest_dir="."):
+        """Copia los archivos guardados a dest_dir. Devuelve meta o None si no hay entrada."""
+        meta = self.lookup(key)
+        if meta is None:
+            return None
+        path = self._entry(key)
+        for name in meta['files']:
+            shutil.copyfile(os.path.join(path, name), os.path.join(dest_dir, name))
+        touch(path)
+        return meta
+
+    def store(self, key, paths, meta=None):
+        """Guarda los archivos de salida bajo la clave (reemplaza la entrada si existía)."""
+        path = self._entry(key)
+        tmp = path + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for p in paths:
+            shutil.copyfile(p, os.path.join(tmp, os.path.basename(p)))
+        meta = dict(meta or {}, files=[os.path.basename(p) for p in paths],
+                    created=datetime.now().isoformat(timespec="seconds"))
+        with open(os.path.join(tmp, META), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False, default=str)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        touch(path)
+        evict_lru(self.root, self.max_bytes, keep=[path])
+        return path
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Estado / limpieza del caché de planes")
+    ap.add_argument("--cache_dir", default=DEFAULT_DIR)
+    ap.add_argument("--max_mb", type=float, default=DEFAULT_MAX_MB)
+    ap.add_argument("--clear", type=int, default=0)
+    args = ap.parse_args()
+    if args.clear:
+        shutil.rmtree(args.cache_dir, ignore_errors=True)
+        print(f"OK -> {args.cache_dir} eliminado")
+    else:
+        removed = evict_lru(args.cache_dir, int(args.max_mb * 1024 * 1024))
+        cache = SolveCache(args.cache_dir, args.max_mb)
+        for name in sorted(os.listdir(args.cache_dir)) if os.path.isdir(args.cache_dir) else []:
+            meta = cache.lookup(name)
+            if meta is not None:
+                print(f"{name}: {meta.get('label', '')} {meta['created']} ({dir_size(cache._entry(name))/1e3:.0f} KB)")
+        if removed:
+            print(f"Expulsados (LRU): {removed}")
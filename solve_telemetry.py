@@ -0,0 +1,122 @@
+"""
+solve_telemetry.py
+Telemetría de convergencia para la búsqueda de OR-Tools (vrp_advanced_soft.py).
+- En cada solución que mejora el objetivo registra: segundos transcurridos, objetivo,
+  vehículos usados y minutos de atraso (suma sobre nodos del atraso respecto del fin de ventana)
+- Escribe una línea JSON por mejora en un archivo de progreso (se puede seguir en vivo con tail -f);
+  si el mismo monitor se vuelve a enganchar (reintento de vrp_advanced_soft.solve sin grafo kNN) el
+  archivo sigue abierto en modo append y cada línea lleva el número de intento ("attempt")
+- Corte temprano opcional: si en los últimos --stop_window_s segundos el objetivo no mejoró
+  más de --stop_improvement_pct %, se termina la búsqueda y se devuelve la mejor solución
+- watch_solutions: tiempo de armado del modelo y hasta la primera solución (benchmarks; lo usan
+  vrp_or_tools_demo.py, vrp_advanced_fixed.py y vrp_advanced_soft.py)
+
+Uso (desde vrp_advanced_soft.py):
+  python vrp_advanced_soft.py --search_seconds 120 --progress_stream solve_progress.jsonl
+  python vrp_advanced_soft.py --search_seconds 120 --stop_improvement_pct 0.5 --stop_window_s 15
+"""
+import json, time
+
+def watch_solutions(routing, stats, t0):
+    """Registra tiempo de armado del modelo y tiempo hasta la primera solución."""
+    stats['model_s'] = round(time.perf_counter() - t0, 3)
+    stats['solutions'] = 0
+    started = time.perf_counter()
+    def on_solution():
+        stats['solutions'] += 1
+        stats.setdefault('first_solution_s', round(time.perf_counter() - started, 3))
+    routing.AddAtSolutionCallback(on_solution)
+
+class ConvergenceMonitor:
+    def __init__(self, stream_path=None, stop_improvement_pct=0.0, stop_window_s=0.0, check_every_s=0.2):
+        self.stream_path = stream_path
+        self.stop_pct = float(stop_improvement_pct)
+        self.stop_window = float(stop_window_s)
+        self.check_every = float(check_every_s)
+        self.history = []  # (elapsed_s, objective, vehicles_used, lateness_min)
+        self.stopped_early = False
+        self.attempts = 0
+        self._stream = None
+
+    @property
+    def early_stop(self):
+        return self.stop_window > 0
+
+    def attach(self, data, manager, routing, time_dim):
+        """Registra el callback de soluciones (y el límite de convergencia si hay regla de corte).
+        El historial y la regla de corte son por intento; el archivo de progreso se trunca solo la primera vez."""
+        self._routing, self._time_dim = routing, time_dim
+        self._starts = [routing.Start(v) for v in range(routing.vehicles())]
+        self._ends = [routing.End(v) for v in range(routing.vehicles())]
+        nodes = data['nodes']
+        self._tw = [(manager.NodeToIndex(i), int(nodes[i]['tw_end'])) for i in range(1, len(nodes))]
+        self.history = []
+        self.stopped_early = False
+        self._started = time.monotonic()
+        self._next_check = self._started
+        self.attempts += 1
+        if self.stream_path and self._stream is None:
+            self._stream = open(self.stream_path, "w" if self.attempts == 1 else "a", encoding="utf-8")
+        routing.AddAtSolutionCallback(self._on_solution)
+        if self.early_stop:
+            routing.AddSearchMonitor(routing.solver().CustomLimit(self._limit))
+
+    def _on_solution(self):
+        objective = self._routing.CostVar().Value()
+        if self.history and objective >= self.history[-1][1]:
+            return
+        # Atraso: llegada más temprana posible menos fin de ventana (nodos sin atender no cuentan)
+        lateness = 0
+        for index, tw_end in self._tw:
+            if self._routing.NextVar(index).Value() == index:
+                continue
+            late = self._time_dim.CumulVar(index).Min() - tw_end
+            if late > 0:
+                lateness += late
+        used = sum(1 for s, e in zip(self._starts, self._ends) if self._routing.NextVar(s).Value() != e)
+        row = (round(time.monotonic() - self._started, 3), int(objective), used, int(lateness))
+        self.history.append(row)
+        if self._stream is not None:
+            line = dict(zip(("elapsed_s", "objective", "vehicles_used", "lateness_min"), row), attempt=self.attempts)
+            self._stream.write(json.dumps(line) + "\n")
+            self._stream.flush()
+
+    def converged(self, now=None):
+        """True si en la última ventana de tiempo la mejora relativa no superó stop_pct."""
+        if not self.early_stop or not self.history:
+            return False
+        elapsed = (time.monotonic() if now is None else now) - self._started
+        first_t = self.history[0][0]
+        if elapsed - first_t < self.stop_window:
+            return False
+        cutoff = elapsed - self.stop_window
+        # Mejor objetivo conocido al inicio de la ventana
+        before = [obj for t, obj, _, _ in self.history if t <= cutoff]
+        best_then = before[-1] if before else self.history[0][1]
+        best_now = self.history[-1][1]
+        gain_pct = 100.0 * (best_then - best_now) / max(1, abs(best_then))
+        return gain_pct <= self.stop_pct
+
+    def _limit(self):
+        # OR-Tools lo llama muy seguido: se evalúa como mucho cada check_every segundos
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.check_every
+        if self.converged(now):
+            self.stopped_early = True
+            return True
+        return False
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def summary(self):
+        if not self.history:
+            return "[CONV] Sin soluciones."
+        t, obj, used, late = self.history[-1]
+        how = f"corte temprano a los {time.monotonic() - self._started:.1f}s" if self.stopped_early else "límite de tiempo"
+        return (f"[CONV] {len(self.history)} mejoras; última a los {t:.1f}s: objetivo {obj}, "
+                f"{used} vehículos, {late} min de atraso ({how}).")
@@ -0,0 +1,67 @@
+"""
+sparse_arcs.py
+Restricción de vecindario kNN para instancias grandes (vrp_advanced_soft.py).
+- Solo restringe la búsqueda: NO baja la memoria. Las matrices de distancia/tiempo siguen siendo densas
+  (N x N, RegisterTransitMatrix evaluada en C++); lo único O(N·k) es el grafo de vecinos (CSR indptr/indices)
+- Cada nodo conserva arcos a sus k vecinos (spatial_index.SpatialIndex), al depot y a su pareja pickup/drop;
+  el depot conserva arcos a todos los nodos. El dominio de NextVar de cada nodo se reduce a esos vecinos
+  y los operadores de búsqueda local exploran solo el vecindario kNN (ls_operator_neighbors_ratio)
+- Compromiso: la primera solución llega antes, pero con el mismo tiempo de búsqueda los planes suelen
+  ser peores que con todos los arcos (la búsqueda no puede usar arcos fuera del grafo). Por eso está
+  desactivado por defecto (--sparse_k 0) y avisa cuando se activa
+- Con Pickup&Delivery el dominio restringido puede dejar sin solución inicial a las heurísticas:
+  vrp_advanced_soft.solve vuelve a resolver sin restringir arcos si no encuentra solución
+
+Uso (desde vrp_advanced_soft.py):
+  python vrp_advanced_soft.py --sparse_k 30 --sparse_min_nodes 1000
+"""
+import numpy as np
+from spatial_index import SpatialIndex
+
+class SparseArcs:
+    def __init__(self, lat, lon, k=30, partners=None):
+        lat = np.asarray(lat, dtype=np.float64)
+        self.n = len(lat)
+        self.k = int(max(1, min(k, self.n - 1)))
+
+        _, nbr = SpatialIndex(lat, lon).knn_indices(self.k)
+        rows = []
+        for i in range(self.n):
+            cols = set(nbr[i].tolist())
+            cols.add(0)
+            if partners is not None and i in partners:
+                cols.add(partners[i])
+            cols.discard(i)
+            rows.append(np.fromiter(sorted(cols), dtype=np.int32))
+        rows[0] = np.arange(1, self.n, dtype=np.int32)  # depot -> todos
+
+        self.indptr = np.zeros(self.n + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum([len(r) for r in rows])
+        self.indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    def neighbors(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def restrict(self, manager, routing):
+        """Deja en el dominio de NextVar de cada nodo solo sus vecinos del grafo (el depot se mapea a los
+        ends de cada vehículo). El nodo mismo se conserva: es el valor de NextVar de un nodo inactivo."""
+        ends = [routing.End(v) for v in range(routing.vehicles())]
+        for i in range(1, self.n):
+            index = manager.NodeToIndex(i)
+            cols = self.neighbors(i)
+            values = [manager.NodeToIndex(int(j)) for j in cols if j != 0] + [index]
+            if (cols == 0).any():
+                values.extend(ends)
+            routing.NextVar(index).SetValues(values)
+
+def build_sparse(lat, lon, k=30, partners=None):
+    arcs = SparseArcs(lat, lon, k, partners)
+    dense = arcs.n * (arcs.n - 1)
+    print(f"[SPARSE] {arcs.n} nodos, k={arcs.k}: {arcs.nnz} arcos ({100.0 * arcs.nnz / max(1, dense):.1f}% del grafo denso)")
+    print("[WARN] --sparse_k solo restringe el vecindario de búsqueda: las matrices siguen siendo N x N (misma "
+          "memoria) y con igual tiempo de búsqueda el plan puede ser peor que con todos los arcos.")
+    return arcs
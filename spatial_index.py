@@ -0,0 +1,134 @@
+"""
+spatial_index.py
+Índice espacial de sucursales (KD-tree sobre coordenadas en la esfera unitaria).
+- Vecinos más cercanos y búsquedas por radio en km sin recorrer todo sucursales.csv
+- La distancia euclídea (cuerda) en la esfera unitaria es monótona con la distancia de gran círculo
+- Se construye una vez y se persiste (sucursales_index.pkl); se reconstruye si el CSV cambió
+
+Requisitos:
+  pip install pandas numpy scipy   (en requirements.txt)
+Uso:
+  python spatial_index.py build
+  python spatial_index.py nearest --lat -34.60 --lon -58.38 --k 10
+  python spatial_index.py radius  --lat -34.60 --lon -58.38 --km 5
+Desde Python:
+  from spatial_index import load_or_build
+  idx = load_or_build()
+  idx.within(-34.60, -58.38, 5.0)
+"""
+import argparse, os, pickle
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+R_KM = 6371.0
+CSV_PATH = "sucursales.csv"
+INDEX_PATH = "sucursales_index.pkl"
+
+def to_unit_xyz(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=np.float64).ravel())
+    lon = np.radians(np.asarray(lon, dtype=np.float64).ravel())
+    return np.column_stack([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)])
+
+def chord_to_km(chord):
+    return 2.0 * R_KM * np.arcsin(np.clip(np.asarray(chord) / 2.0, 0.0, 1.0))
+
+def km_to_chord(km):
+    return 2.0 * np.sin(min(np.pi, float(km) / R_KM) / 2.0)
+
+class SpatialIndex:
+    def __init__(self, lat, lon, labels=None):
+        self.lat = np.asarray(lat, dtype=np.float64).ravel()
+        self.lon = np.asarray(lon, dtype=np.float64).ravel()
+        self.labels = np.asarray(labels if labels is not None else np.arange(len(self.lat)), dtype=object)
+        self.tree = cKDTree(to_unit_xyz(self.lat, self.lon))
+        self.source_mtime = None
+
+    def __len__(self):
+        return len(self.lat)
+
+    @classmethod
+    def from_csv(cls, path=CSV_PATH, label_col="sucursal"):
+        df = pd.read_csv(path)
+        idx = cls(df['lat'], df['lon'], df[label_col] if label_col in df.columns else None)
+        idx.source_mtime = os.path.getmtime(path)
+        return idx
+
+    def _frame(self, ids, km):
+        return pd.DataFrame({"idx": ids, "sucursal": self.labels[ids], "lat": self.lat[ids],
+                             "lon": self.lon[ids], "km": np.round(km, 3)})
+
+    def query(self, lat, lon, k=1):
+        """Vectorizado: (km, índices) de forma (M, k) para M puntos de consulta."""
+        k = min(int(k), len(self))
+        chord, ids = self.tree.query(to_unit_xyz(lat, lon), k=k)
+        return chord_to_km(chord).reshape(-1, k), np.asarray(ids).reshape(-1, k)
+
+    def nearest(self, lat, lon, k=10):
+        """Las k sucursales más cercanas a un punto (DataFrame ordenado por km)."""
+        km, ids = self.query(lat, lon, k)
+        return self._frame(ids[0], km[0])
+
+    def within(self, lat, lon, radius_km):
+        """Sucursales a menos de radius_km de un punto (DataFrame ordenado por km)."""
+        xyz = to_unit_xyz(lat, lon)
+        ids = np.asarray(self.tree.query_ball_point(xyz[0], km_to_chord(radius_km)), dtype=np.int64)
+        if len(ids) == 0:
+            return self._frame(ids, np.empty(0))
+        km = chord_to_km(np.linalg.norm(self.tree.data[ids] - xyz[0], axis=1))
+        order = np.argsort(km, kind="stable")
+        return self._frame(ids[order], km[order])
+
+    def knn_indices(self, k, include_self=False):
+        """Para cada punto indexado: (km, índices) de sus k vecinos más cercanos."""
+        extra = 0 if include_self else 1
+        km, ids = self.query(self.lat, self.lon, k + extra)
+        return km[:, extra:], ids[:, extra:]
+
+    def save(self, path=INDEX_PATH):
+        with open(path, "wb") as f:
+            pickle.dump({"lat": self.lat, "lon": self.lon, "labels": self.labels, "tree": self.tree,
+                         "source_mtime": self.source_mtime}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        idx = cls.__new__(cls)
+        idx.__dict__.update(state)
+        return idx
+
+def load_or_build(csv_path=CSV_PATH, index_path=INDEX_PATH):
+    """Carga el índice persistido o lo (re)construye si no existe o el CSV es más nuevo."""
+    if os.path.exists(index_path):
+        try:
+            idx = SpatialIndex.load(index_path)
+            if idx.source_mtime == os.path.getmtime(csv_path):
+                return idx
+        except Exception:
+            pass
+    idx = SpatialIndex.from_csv(csv_path)
+    idx.save(index_path)
+    return idx
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["build", "nearest", "radius"])
+    ap.add_argument("--csv", type=str, default=CSV_PATH)
+    ap.add_argument("--index", type=str, default=INDEX_PATH)
+    ap.add_argument("--lat", type=float)
+    ap.add_argument("--lon", type=float)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--km", type=float, default=5.0)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        idx = SpatialIndex.from_csv(args.csv)
+        idx.save(args.index)
+        print(f"OK -> {args.index} ({len(idx)} sucursales)")
+    else:
+        if args.lat is None or args.lon is None:
+            raise SystemExit("Indicá --lat y --lon.")
+        idx = load_or_build(args.csv, args.index)
+        res = idx.nearest(args.lat, args.lon, args.k) if args.cmd == "nearest" else idx.within(args.lat, args.lon, args.km)
+        print(res.to_string(index=False))
@@ -0,0 +1,160 @@
+"""
+speed_profiles.py
+Tiempos de viaje dependientes de la hora para vrp_advanced_soft.py.
+- Perfil de velocidad por franja horaria (bucket_minutes, ciclo de 24 h): aprendido de routes_history.csv
+  (km/h por tramo GPS consecutivo de cada viaje, agrupado por la hora de inicio del tramo) o configurado en JSON
+- TravelStack precalcula una matriz de minutos compacta (int16 si alcanza) por velocidad distinta del perfil;
+  las franjas con la misma velocidad comparten matriz y cada matriz se calcula una sola vez (caché en memoria),
+  así minutes(i, j, t) es una búsqueda O(1)
+- El modelo de OR-Tools necesita un tránsito fijo por arco: gather() arma la matriz NxN tomando cada fila
+  (nodo de salida) de la franja de su hora estimada de salida; el depot usa la hora del nodo destino
+
+Perfil JSON (cualquiera de las dos formas):
+  {"bucket_minutes": 60, "speeds_kmh": [38, 40, ..., 24 valores]}
+  {"default_kmh": 45, "ranges": {"7-10": 22, "17-20": 20}}
+Aprender y guardar:
+  python speed_profiles.py --history routes_history.csv --out speed_profile.json --bucket_minutes 60
+Uso (desde vrp_advanced_soft.py):
+  python vrp_advanced_soft.py --speed_profile speed_profile.json   (o --speed_profile routes_history.csv)
+"""
+import json
+import numpy as np
+import pandas as pd
+from distance_matrix import BLOCK_ROWS, minutes_from_km, pair_km
+
+DAY_MIN = 24 * 60
+MIN_KMH, MAX_KMH = 5.0, 120.0
+MAX_GAP_MIN = 30      # tramos con pings más separados no se usan (GPS cortado)
+MIN_SAMPLE_MIN = 10   # minutos de tramos mínimos para confiar en una franja
+
+class SpeedProfile:
+    def __init__(self, speeds_kmh, bucket_minutes=60):
+        if DAY_MIN % int(bucket_minutes) or len(speeds_kmh) != DAY_MIN // int(bucket_minutes):
+            raise ValueError(f"Se esperan {DAY_MIN // int(bucket_minutes)} velocidades para franjas de {bucket_minutes} min")
+        self.bucket_minutes = int(bucket_minutes)
+        self.speeds_kmh = [round(float(np.clip(s, MIN_KMH, MAX_KMH)), 1) for s in speeds_kmh]
+
+    def bucket(self, minute):
+        """Franja de un minuto (desde la medianoche de day0); vectorizado."""
+        return (np.asarray(minute, dtype=np.int64) // self.bucket_minutes) % len(self.speeds_kmh)
+
+    def to_dict(self):
+        return {'bucket_minutes': self.bucket_minutes, 'speeds_kmh': self.speeds_kmh}
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def __repr__(self):
+        return f"SpeedProfile({self.bucket_minutes} min, {min(self.speeds_kmh)}-{max(self.speeds_kmh)} km/h)"
+
+def from_config(cfg, default_kmh=50.0):
+    """Perfil desde un dict: speeds_kmh explícitas o default_kmh + rangos de horas 'h1-h2' (h2 excluida)."""
+    if 'speeds_kmh' in cfg:
+        return SpeedProfile(cfg['speeds_kmh'], cfg.get('bucket_minutes', 60))
+    speeds = [float(cfg.get('default_kmh', default_kmh))] * 24
+    for span_, kmh in cfg.get('ranges', {}).items():
+        h1, _, h2 = str(span_).partition("-")
+        for h in range(int(h1), int(h2 or int(h1) + 1)):
+            speeds[h % 24] = float(kmh)
+    return SpeedProfile(speeds, 60)
+
+def learn(history_path, bucket_minutes=60, default_kmh=50.0):
+    """Perfil aprendido de routes_history.csv (trip_id, lat, lon, timestamp). Las franjas sin datos
+    suficientes toman la velocidad global del histórico (o default_kmh si no hay datos)."""
+    df = pd.read_csv(history_path, usecols=['trip_id', 'lat', 'lon', 'timestamp'], parse_dates=['timestamp'])
+    df = df.dropna().sort_values(['trip_id', 'timestamp'], kind="mergesort")
+    same = df['trip_id'].to_numpy()[1:] == df['trip_id'].to_numpy()[:-1]
+    lat, lon = df['lat'].to_numpy(float), df['lon'].to_numpy(float)
+    km = pair_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    ts = df['timestamp']
+    dt_min = ts.diff().dt.total_seconds().to_numpy()[1:] / 60.0
+    start = (ts.dt.hour * 60 + ts.dt.minute).to_numpy()[:-1]
+    ok = same & (dt_min > 0) & (dt_min <= MAX_GAP_MIN) & (km / np.maximum(dt_min, 1e-9) * 60.0 <= MAX_KMH * 1.5)
+    n_buckets = DAY_MIN // int(bucket_minutes)
+    b = (start[ok] // int(bucket_minutes)) % n_buckets
+    km_b = np.bincount(b, weights=km[ok], minlength=n_buckets)
+    min_b = np.bincount(b, weights=dt_min[ok], minlength=n_buckets)
+    overall = km_b.sum() / (min_b.sum() / 60.0) if min_b.sum() > 0 else default_kmh
+    speeds = np.where(min_b >= MIN_SAMPLE_MIN, km_b / np.maximum(min_b, 1e-9) * 60.0, overall)
+    return SpeedProfile(speeds.tolist(), bucket_minutes)
+
+def load_profile(path, default_kmh=50.0, bucket_minutes=60):
+    """.json = perfil configurado / guardado; otro archivo = histórico GPS del que se aprende."""
+    if str(path).lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return from_config(json.load(f), default_kmh)
+    return learn(path, bucket_minutes, default_kmh)
+
+class TravelStack:
+    """Minutos de viaje por franja sobre una matriz km fija. stack[slot[b]] es la matriz de la franja b."""
+
+    def __init__(self, dist_km, profile):
+        self.dist_km, self.profile = dist_km, profile
+        self._by_speed = {}
+        speeds = sorted(set(profile.speeds_kmh))
+        # int16 alcanza mientras el arco más largo a la velocidad más baja entre en 32767 min
+        max_km = float(np.max(dist_km)) if np.size(dist_km) else 0.0
+        self.dtype = np.int16 if np.ceil(max_km / speeds[0] * 60.0) < np.iinfo(np.int16).max else np.int32
+        self.stack = np.stack([self.matrix(s) for s in speeds])
+        self.slot = np.array([speeds.index(s) for s in profile.speeds_kmh], dtype=np.int64)
+
+    def matrix(self, speed_kmh):
+        """Matriz de minutos para una velocidad (calculada una vez por velocidad, por bloques de filas)."""
+        if speed_kmh not in self._by_speed:
+            n = len(self.dist_km)
+            out = np.empty((n, n), dtype=self.dtype)
+            for s in range(0, n, BLOCK_ROWS):
+                out[s:s+BLOCK_ROWS] = minutes_from_km(self.dist_km[s:s+BLOCK_ROWS], speed_kmh)
+            self._by_speed[speed_kmh] = out
+        return self._by_speed[speed_kmh]
+
+    @property
+    def nbytes(self):
+        return self.stack.nbytes
+
+    def minutes(self, i, j, minute):
+        """Minutos de i a j saliendo en el minuto dado (O(1))."""
+        return int(self.stack[self.slot[self.profile.bucket(minute)], i, j])
+
+    def gather(self, departure_min):
+        """Matriz NxN int32: fila i con la franja de departure_min[i]; la fila del depot (0) usa la franja
+        de la salida estimada del nodo destino."""
+        slots = self.slot[self.profile.bucket(departure_min)]
+        n = len(slots)
+        out = self.stack[slots, np.arange(n)[:, None], np.arange(n)[None, :]].astype(np.int32)
+        out[0] = self.stack[slots, 0, np.arange(n)]
+        return out
+
+def expected_departures(nodes, pd_pairs, travel_min):
+    """Salida estimada por nodo antes de resolver: drops al abrir su ventana (+ servicio), pickups lo
+    necesario antes de su drop, depot en 0."""
+    dep = np.array([max(0, int(n['tw_start'])) + int(n['service_min']) for n in nodes], dtype=np.int64)
+    dep[0] = 0
+    for p, d in pd_pairs:
+        arrive_p = int(nodes[d]['tw_start']) - int(travel_min[p, d]) - int(nodes[p]['service_min'])
+        dep[p] = max(0, min(arrive_p, int(nodes[p]['tw_end']))) + int(nodes[p]['service_min'])
+    return dep
+
+def solved_departures(data, result, previous):
+    """Salida por nodo según la solución (llegada + servicio); los nodos no visitados conservan previous."""
+    dep = np.array(previous, dtype=np.int64)
+    for seq, arr in zip(result['routes'], result['arrive_min']):
+        for node, t in zip(seq[1:-1], arr[1:-1]):
+            dep[node] = int(t) + int(data['nodes'][node]['service_min'])
+    return dep
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Aprende el perfil de velocidad por franja desde el histórico GPS")
+    ap.add_argument("--history", default="routes_history.csv")
+    ap.add_argument("--out", default="speed_profile.json")
+    ap.add_argument("--bucket_minutes", type=int, default=60)
+    ap.add_argument("--default_kmh", type=float, default=50.0, help="velocidad si el histórico no tiene datos")
+    args = ap.parse_args()
+    profile = learn(args.history, args.bucket_minutes, args.default_kmh)
+    profile.save(args.out)
+    for b, kmh in enumerate(profile.speeds_kmh):
+        h = b * profile.bucket_minutes
+        print(f"{h // 60:02d}:{h % 60:02d}  {kmh:6.1f} km/h")
+    print(f"OK -> {args.out} generado ({profile})")
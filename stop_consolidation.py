@@ -0,0 +1,174 @@
+"""
+stop_consolidation.py
+Consolidación de paradas co-ubicadas para vrp_advanced_soft.py.
+- Los pedidos generados desde sucursales.csv repiten las mismas coordenadas de sucursal como pickup y drop:
+  cada pedido suma dos nodos aunque haya otros en el mismo punto (arcos de distancia 0 que igual cuestan búsqueda)
+- Se agrupan nodos del mismo tipo (pickup / drop), en la misma coordenada (redondeada a 5 decimales, ~1 m) y con igual
+  requisito de frío, si sus ventanas se solapan al menos min_overlap_min minutos
+- El nodo consolidado lleva la intersección de ventanas, demanda kg/m3 sumada y servicio sumado; 'members'
+  guarda los nodos originales para expandir el plan a una fila por pedido (stops_plan_advanced.csv)
+- Los pedidos que comparten un nodo quedan ligados al mismo vehículo: cada grupo ligado se acota a
+  max_group_orders pedidos y a la capacidad del vehículo más chico (refrigerado si el grupo lleva frío), así
+  cualquier vehículo puede llevarlo entero y el modelo no queda con grupos que solo entran en un camión
+- Con nodos en varios pares PATH_CHEAPEST_ARC suele no encontrar solución inicial: initial_routes arma una
+  asignación por grupos (pickups y luego drops de cada grupo, al final de la ruta más barata), siempre
+  factible en capacidad, para arrancar la búsqueda
+
+Uso (desde vrp_advanced_soft.py):
+  python vrp_advanced_soft.py --consolidate 1 --consolidate_overlap 30
+"""
+from collections import defaultdict
+
+HORIZON = 72 * 60
+MAX_WAIT = 600
+
+def _min_capacity(vehicles, refrig_only=False):
+    v = vehicles[vehicles['refrigerated'].astype(int) == 1] if refrig_only else vehicles
+    if v.empty:
+        v = vehicles
+    return float(v['capacity_kg'].min()), float(v['capacity_m3'].min())
+
+def _merged(members):
+    """Nodo multi-pedido a partir de sus miembros (mismo tipo y coordenada)."""
+    first = members[0]
+    return {
+        'node_id': "+".join(m['node_id'] for m in members),
+        'type': first['type'],
+        'order_id': "+".join(str(m['order_id']) for m in members),
+        'lat': first['lat'], 'lon': first['lon'],
+        'tw_start': max(m['tw_start'] for m in members),
+        'tw_end': min(m['tw_end'] for m in members),
+        'service_min': sum(m['service_min'] for m in members),
+        'demand_kg': sum(m['demand_kg'] for m in members),
+        'demand_m3': sum(m['demand_m3'] for m in members),
+        'refrig_req': first['refrig_req'],
+        'priority': first['priority'],
+        'members': members,
+    }
+
+def consolidate(nodes, pd_pairs, vehicles, ignore_refrig=False, min_overlap_min=30, max_group_orders=6, decimals=5):
+    """(nodes, pd_pairs, stats) con las paradas co-ubicadas fusionadas. El depot queda en el índice 0 y los
+    nodos sin compañeros se conservan tal cual. pd_pairs queda con los pares remapeados (sin repetidos):
+    un nodo consolidado puede aparecer en varios pares."""
+    cap_kg, cap_m3 = _min_capacity(vehicles)
+    rcap_kg, rcap_m3 = _min_capacity(vehicles, refrig_only=True)
+
+    # Grupos ligados de pedidos (union-find sobre pares) con su carga total
+    pair_of = {}
+    parent = list(range(len(pd_pairs)))
+    load = []
+    for k, (p, d) in enumerate(pd_pairs):
+        pair_of[p] = pair_of[d] = k
+        cold = nodes[p]['refrig_req'] == 1 and not ignore_refrig
+        load.append([nodes[p]['demand_kg'], nodes[p]['demand_m3'], cold, 1])
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    def fits(a, b):
+        if a == b:
+            return True
+        kg, m3, cold = load[a][0] + load[b][0], load[a][1] + load[b][1], load[a][2] or load[b][2]
+        lim_kg, lim_m3 = (rcap_kg, rcap_m3) if cold else (cap_kg, cap_m3)
+        return kg <= lim_kg and m3 <= lim_m3 + 1e-9 and load[a][3] + load[b][3] <= max_group_orders
+
+    def union(a, b):
+        if a != b:
+            parent[b] = a
+            load[a] = [load[a][0] + load[b][0], load[a][1] + load[b][1], load[a][2] or load[b][2],
+                       load[a][3] + load[b][3]]
+
+    # Candidatos: mismo tipo, coordenada y frío; dentro de cada punto, por fin de ventana
+    by_spot = defaultdict(list)
+    for i in range(1, len(nodes)):
+        n = nodes[i]
+        if i in pair_of:
+            by_spot[(n['type'], round(n['lat'], decimals), round(n['lon'], decimals), n['refrig_req'])].append(i)
+
+    clusters = []   # [members (índices), tw_start, tw_end]
+    for spot in by_spot.values():
+        spot.sort(key=lambda i: (nodes[i]['tw_end'], nodes[i]['tw_start']))
+        open_ = []
+        for i in spot:
+            n = nodes[i]
+            for c in reversed(open_):
+                tws, twe = max(c[1], n['tw_start']), min(c[2], n['tw_end'])
+                a, b = find(pair_of[c[0][0]]), find(pair_of[i])
+                if twe - tws >= min_overlap_min and fits(a, b):
+                    union(a, b)
+                    c[0].append(i)
+                    c[1], c[2] = tws, twe
+                    break
+            else:
+                open_.append([[i], n['tw_start'], n['tw_end']])
+        clusters.extend(open_)
+
+    # Reindexado: depot y luego los grupos en el orden original de sus nodos
+    clusters.sort(key=lambda c: min(c[0]))
+    new_nodes, new_index = [nodes[0]], {0: 0}
+    for members, _, _ in clusters:
+        for i in members:
+            new_index[i] = len(new_nodes)
+        new_nodes.append(nodes[members[0]] if len(members) == 1 else _merged([nodes[i] for i in members]))
+    new_pairs = list(dict.fromkeys((new_index[p], new_index[d]) for p, d in pd_pairs))
+    stats = {
+        'nodes_before': len(nodes), 'nodes_after': len(new_nodes),
+        'merged_nodes': sum(1 for c in clusters if len(c[0]) > 1),
+        'max_orders_per_node': max((len(c[0]) for c in clusters), default=0),
+    }
+    return new_nodes, new_pairs, stats
+
+def linked_groups(pd_pairs):
+    """Pares agrupados por componente (pedidos ligados por nodos compartidos), en orden de aparición."""
+    parent = {}
+    def find(i):
+        while parent.setdefault(i, i) != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for p, d in pd_pairs:
+        parent[find(d)] = find(p)
+    groups = defaultdict(list)
+    for p, d in pd_pairs:
+        groups[find(p)].append((p, d))
+    return list(groups.values())
+
+def initial_routes(data, late_penalty=6):
+    """Rutas iniciales (por vehículo, sin depot) armadas grupo por grupo: cada grupo ligado se agrega al final
+    del vehículo con menor costo (viaje + atraso x late_penalty). Como un grupo se entrega completo antes del
+    siguiente, la carga nunca supera la del grupo."""
+    nodes, T, vehicles = data['nodes'], data['travel_min'], data['vehicles']
+    refrig = vehicles['refrigerated'].astype(int).tolist()
+    routes = [[] for _ in range(len(vehicles))]
+    pos, clock = [0] * len(vehicles), [0] * len(vehicles)
+    groups = linked_groups(data['pd_pairs'])
+    groups.sort(key=lambda g: min(nodes[d]['tw_end'] for _, d in g))
+    for g in groups:
+        seq = sorted(dict.fromkeys(p for p, _ in g), key=lambda i: nodes[i]['tw_end'])
+        seq += sorted(dict.fromkeys(d for _, d in g), key=lambda i: nodes[i]['tw_end'])
+        cold = not data['ignore_refrig'] and any(nodes[i]['refrig_req'] == 1 for i in seq)
+        best = None
+        for v in range(len(vehicles)):
+            if cold and not refrig[v]:
+                continue
+            at, t, cost = pos[v], clock[v], 0
+            for i in seq:
+                t += nodes[at]['service_min'] + int(T[at, i])
+                cost += int(T[at, i])
+                t = max(t, min(nodes[i]['tw_start'], t + MAX_WAIT))
+                cost += late_penalty * max(0, t - nodes[i]['tw_end'])
+                at = i
+            back = t + nodes[at]['service_min'] + int(T[at, 0])
+            if back > HORIZON:
+                cost += 10 ** 9
+            if best is None or cost < best[0]:
+                best = (cost, v, t)
+        if best is None:
+            best = (0, 0, clock[0])
+        _, v, t = best
+        routes[v].extend(seq)
+        pos[v], clock[v] = seq[-1], t
+    return routes
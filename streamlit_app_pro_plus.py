@@ -21,6 +21,12 @@ def load_json(p):
         with open(p,"r",encoding="utf-8") as f: return json.load(f)
     return None
 
+@st.cache_resource
+def sucursales_index(path, mtime):
+    # Una vez por proceso (y de nuevo si cambia el CSV): no se recarga el índice en cada rerun
+    from spatial_index import load_or_build
+    return load_or_build(path)
+
 orders = load_csv("orders.csv")
 routes_adv = load_csv("routes_plan_advanced.csv")
 stops_adv  = load_csv("stops_plan_advanced.csv")
@@ -142,3 +148,13 @@ with tab3:
         st.warning("Subí un plan (avanzado o simple) o sucursales.csv para ver el mapa.")
 
     st_folium(m, height=650, use_container_width=True)
+
+    # Sucursales cercanas a un punto (índice espacial, sin recorrer todo el CSV)
+    if sucursales is not None and len(sucursales) > 0:
+        with st.expander("Sucursales cercanas a un punto"):
+            c1, c2, c3 = st.columns(3)
+            q_lat = c1.number_input("Lat", value=float(lat0), format="%.6f")
+            q_lon = c2.number_input("Lon", value=float(lon0), format="%.6f")
+            q_km  = c3.number_input("Radio (km)", value=5.0, min_value=0.1)
+            idx = sucursales_index("sucursales.csv", os.path.getmtime("sucursales.csv"))
+            st.dataframe(idx.within(q_lat, q_lon, q_km))
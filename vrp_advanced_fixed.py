@@ -6,17 +6,23 @@ Cambios vs versión previa (para evitar CP Solver fail):
 - Ventanas horarias se CLAMP a [0, horizon] y garantizamos twe >= tws (+1 min si hace falta).
 - Horizonte ampliado a 72h para tolerar múltiples días.
 - Mensajes de depuración si se ajustan ventanas.
+- Matriz de distancias/tiempos vectorizada (distance_matrix.py) y cacheada en disco (matrix_cache.py).
 
 Uso:
-  pip install ortools pandas geopy python-dateutil
+  pip install ortools pandas numpy python-dateutil
   python vrp_advanced_fixed.py --speed_kmh 32
+  python vrp_advanced_fixed.py --speed_kmh 32 --profile 1   # trace JSON por etapa en traces/
 """
-import argparse, math, sys
+import argparse, sys, time
+import numpy as np
 import pandas as pd
-from geopy.distance import geodesic
 from dateutil import parser as dtparser
 from datetime import datetime
 from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+from matrix_cache import cached_matrices
+from profiling import span
+from solve_telemetry import watch_solutions
+import profiling
 
 def iso_to_minutes_since_start(ts_str, day0=None):
     ts = dtparser.isoparse(str(ts_str))
@@ -25,14 +31,11 @@ def iso_to_minutes_since_start(ts_str, day0=None):
     delta = ts - day0
     return int(delta.total_seconds() // 60), day0
 
-def build_vrp(speed_kmh=30.0):
-    vehicles = pd.read_csv("vehicles.csv")
-    orders = pd.read_csv("orders.csv")
-
-    # Parámetros
-    pickup_service_min = 5
-    drop_service_min = 5
+def load_inputs(orders_path="orders.csv", vehicles_path="vehicles.csv"):
+    return pd.read_csv(orders_path), pd.read_csv(vehicles_path)
 
+def build_nodes(orders, pickup_service_min=5, drop_service_min=5):
+    """Depot (centroide de pickups) + pickup y drop por pedido."""
     # Base temporal (día 0 = median de window_start)
     day0 = None
 
@@ -76,15 +79,31 @@ def build_vrp(speed_kmh=30.0):
             'refrig_req': int(o.get('refrigerated_required', 0))
         })
         pd_pairs.append((p_idx, d_idx))
+    return nodes, pd_pairs
 
-    N = len(nodes)
+def prepare_data(orders, vehicles, speed_kmh=30.0, distance_method="haversine", matrix_cache=".matrix_cache",
+                 matrices=None):
+    """Nodos + matrices + flota. matrices=(dist_km, travel_min) reutiliza matrices ya calculadas
+    para los mismos nodos (p. ej. al relajar ventanas, que no cambia coordenadas)."""
+    # Parámetros: servicio de 5 min en pickup y drop
+    with span("build_nodes", orders=len(orders)):
+        nodes, pd_pairs = build_nodes(orders, pickup_service_min=5, drop_service_min=5)
 
     # Distancias y tiempos base (sin servicio)
-    def km(i, j):
-        if i == j: return 0.0
-        return geodesic((nodes[i]['lat'], nodes[i]['lon']), (nodes[j]['lat'], nodes[j]['lon'])).km
-    dist_km = [[km(i,j) for j in range(N)] for i in range(N)]
-    travel_min = [[int(math.ceil((dist_km[i][j] / max(1e-6, speed_kmh)) * 60)) for j in range(N)] for i in range(N)]
+    if matrices is None:
+        with span("matrix", nodes=len(nodes)):
+            matrices = cached_matrices([n['lat'] for n in nodes], [n['lon'] for n in nodes],
+                                       speed_kmh, method=distance_method, cache_dir=matrix_cache)
+    dist_km, travel_min = matrices
+    return {'nodes': nodes, 'pd_pairs': pd_pairs, 'dist_km': dist_km, 'travel_min': travel_min,
+            'vehicles': vehicles.reset_index(drop=True)}
+
+def build_model(data):
+    """RoutingModel con ventanas duras. Devuelve (manager, routing, time_dim).
+    Lanza ValueError si el modelo no puede armarse (p. ej. frío sin vehículos refrigerados)."""
+    nodes, pd_pairs, vehicles = data['nodes'], data['pd_pairs'], data['vehicles']
+    travel_min = data['travel_min']
+    N = len(nodes)
 
     # Servicio por nodo
     service_min = [nodes[i]['service_min'] for i in range(N)]
@@ -99,11 +118,9 @@ def build_vrp(speed_kmh=30.0):
     manager = pywrapcp.RoutingIndexManager(N, n_veh, 0)
     routing = pywrapcp.RoutingModel(manager)
 
-    # Tiempo de tránsito = viaje + servicio EN EL ORIGEN del arco
-    def transit_time(from_i, to_i):
-        f = manager.IndexToNode(from_i); t = manager.IndexToNode(to_i)
-        return int(travel_min[f][t] + service_min[f])
-    time_cb = routing.RegisterTransitCallback(transit_time)
+    # Tiempo de tránsito = viaje + servicio EN EL ORIGEN del arco (matriz precalculada, evaluada en C++)
+    transit = travel_min.astype(np.int64) + np.asarray(service_min, dtype=np.int64)[:, None]
+    time_cb = routing.RegisterTransitMatrix(transit.tolist())
     routing.SetArcCostEvaluatorOfAllVehicles(time_cb)
 
     # Dimensión tiempo
@@ -138,15 +155,11 @@ def build_vrp(speed_kmh=30.0):
         print(f"[INFO] Se ajustaron {adjusted} ventanas para que encajen en [0, {horizon}] y twe>=tws.")
 
     # Capacidades kg y m3
-    def demand_kg_cb(index):
-        node = manager.IndexToNode(index)
-        return int(nodes[node]['demand_kg'])
-    def demand_m3_cb(index):
-        node = manager.IndexToNode(index)
-        return int(round(nodes[node]['demand_m3'] * 100))  # centésimas de m3
-
-    kg_idx = routing.RegisterUnaryTransitCallback(demand_kg_cb)
-    m3_idx = routing.RegisterUnaryTransitCallback(demand_m3_cb)
+    # Demandas como vectores por nodo (m3 en centésimas)
+    demand_kg = [int(n['demand_kg']) for n in nodes]
+    demand_m3 = [int(round(n['demand_m3'] * 100)) for n in nodes]
+    kg_idx = routing.RegisterUnaryTransitVector(demand_kg)
+    m3_idx = routing.RegisterUnaryTransitVector(demand_m3)
     routing.AddDimensionWithVehicleCapacity(kg_idx, 0, caps_kg, True, "CapKG")
     routing.AddDimensionWithVehicleCapacity(m3_idx, 0, [int(c*100) for c in caps_m3], True, "CapM3")
 
@@ -162,35 +175,58 @@ def build_vrp(speed_kmh=30.0):
         if nodes[i]['refrig_req'] == 1:
             allowed = [v for v in range(n_veh) if refrig[v] == 1]
             if not allowed:
-                sys.exit("No hay vehículos refrigerados pero existen pedidos refrigerados.")
+                raise ValueError("No hay vehículos refrigerados pero existen pedidos refrigerados.")
             routing.SetAllowedVehiclesForIndex(allowed, manager.NodeToIndex(i))
 
+    return manager, routing, time_dim
+
+def solve(data, search_seconds=60, stats=None):
+    """Devuelve {'objective', 'routes', 'arrive_min'} (listas de nodos por vehículo) o None.
+    stats (dict opcional): se completa con model_s, first_solution_s y solutions (benchmarks)."""
+    t0 = time.perf_counter()
+    with span("build_model", nodes=len(data['nodes'])):
+        manager, routing, time_dim = build_model(data)
+    if stats is not None:
+        watch_solutions(routing, stats, t0)
+
     # Búsqueda
     search = pywrapcp.DefaultRoutingSearchParameters()
     search.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
     search.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
-    search.time_limit.FromSeconds(60)
+    search.time_limit.FromSeconds(int(search_seconds))
 
-    solution = routing.SolveWithParameters(search)
+    with span("search", seconds=int(search_seconds)):
+        solution = routing.SolveWithParameters(search)
     if solution is None:
-        sys.exit("No se encontró solución. Sugerencias: aumentar --speed_kmh, revisar ventanas/capacidades, o quitar refrigerado.")
+        return None
+    routes, arrivals = [], []
+    for v in range(len(data['vehicles'])):
+        idx = routing.Start(v)
+        seq, arr = [], []
+        while True:
+            seq.append(manager.IndexToNode(idx))
+            arr.append(solution.Value(time_dim.CumulVar(idx)))
+            if routing.IsEnd(idx):
+                break
+            idx = solution.Value(routing.NextVar(idx))
+        routes.append(seq)
+        arrivals.append(arr)
+    return {'objective': int(solution.ObjectiveValue()), 'routes': routes, 'arrive_min': arrivals}
 
-    # Export
+def plan_frames(data, result):
+    """(routes_df, stops_df) con el esquema de routes_plan_advanced.csv / stops_plan_advanced.csv."""
+    nodes, vehicles, dist_km = data['nodes'], data['vehicles'], data['dist_km']
     rows_routes, rows_stops = [], []
-    for v in range(n_veh):
-        idx = routing.Start(v)
+    for v, (seq, arr) in enumerate(zip(result['routes'], result['arrive_min'])):
         seq_ids = []
         load_kg = 0
         total_km = 0.0
-        while not routing.IsEnd(idx):
-            node = manager.IndexToNode(idx)
+        for k, (node, tarr) in enumerate(zip(seq, arr)):
             seq_ids.append(nodes[node]['node_id'])
-            if node != 0:
-                load_kg += nodes[node]['demand_kg']
-            nxt = solution.Value(routing.NextVar(idx))
-            node_next = manager.IndexToNode(nxt)
-            total_km += dist_km[node][node_next]
-            tarr = solution.Value(time_dim.CumulVar(idx))
+            if k + 1 < len(seq):
+                if node != 0:
+                    load_kg += nodes[node]['demand_kg']
+                total_km += float(dist_km[node, seq[k+1]])
             tdep = tarr  # el servicio ya se consideró en el tránsito saliente
             rows_stops.append({
                 'vehicle_id': vehicles.iloc[v]['vehicle_id'],
@@ -204,23 +240,6 @@ def build_vrp(speed_kmh=30.0):
                 'lat': nodes[node]['lat'],
                 'lon': nodes[node]['lon']
             })
-            idx = nxt
-        # fin de ruta (depot)
-        node = manager.IndexToNode(idx)
-        tarr = solution.Value(time_dim.CumulVar(idx))
-        rows_stops.append({
-            'vehicle_id': vehicles.iloc[v]['vehicle_id'],
-            'stop_node': nodes[node]['node_id'],
-            'stop_type': nodes[node]['type'],
-            'order_id': nodes[node]['order_id'],
-            'arrive_min': tarr,
-            'depart_min': tarr,
-            'tw_start': nodes[node]['tw_start'],
-            'tw_end': nodes[node]['tw_end'],
-            'lat': nodes[node]['lat'],
-            'lon': nodes[node]['lon']
-        })
-        seq_ids.append(nodes[node]['node_id'])
         rows_routes.append({
             'vehicle_id': vehicles.iloc[v]['vehicle_id'],
             'vehicle_type': vehicles.iloc[v]['type'],
@@ -228,13 +247,36 @@ def build_vrp(speed_kmh=30.0):
             'total_distance_km': round(total_km, 2),
             'total_load_kg': int(max(0, load_kg))
         })
+    return pd.DataFrame(rows_routes), pd.DataFrame(rows_stops)
 
-    pd.DataFrame(rows_routes).to_csv("routes_plan_advanced.csv", index=False)
-    pd.DataFrame(rows_stops).to_csv("stops_plan_advanced.csv", index=False)
+def export_plan(data, result, routes_path="routes_plan_advanced.csv", stops_path="stops_plan_advanced.csv"):
+    with span("export"):
+        routes_df, stops_df = plan_frames(data, result)
+        routes_df.to_csv(routes_path, index=False)
+        stops_df.to_csv(stops_path, index=False)
+
+def build_vrp(speed_kmh=30.0, distance_method="haversine", matrix_cache=".matrix_cache"):
+    with span("load_inputs"):
+        orders, vehicles = load_inputs()
+    with span("prepare_data"):
+        data = prepare_data(orders, vehicles, speed_kmh, distance_method, matrix_cache)
+    try:
+        result = solve(data, search_seconds=60)
+    except ValueError as e:
+        sys.exit(str(e))
+    if result is None:
+        sys.exit("No se encontró solución. Sugerencias: aumentar --speed_kmh, revisar ventanas/capacidades, o quitar refrigerado.")
+
+    # Export
+    export_plan(data, result)
     print("OK -> routes_plan_advanced.csv y stops_plan_advanced.csv generados.")
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--speed_kmh", type=float, default=30.0)
+    ap.add_argument("--distance_method", choices=["haversine", "ellipsoidal"], default="haversine")
+    ap.add_argument("--matrix_cache", type=str, default=".matrix_cache", help="directorio del caché de distancias ('' = desactivar)")
+    ap.add_argument("--profile", type=int, default=0, help="1 = trace JSON por etapa (o VRP_PROFILE=1)")
     args = ap.parse_args()
-    build_vrp(speed_kmh=args.speed_kmh)
+    profiling.setup(args.profile, "vrp_advanced_fixed")
+    build_vrp(speed_kmh=args.speed_kmh, distance_method=args.distance_method, matrix_cache=args.matrix_cache)
@@ -5,7 +5,7 @@ temprano o tarde, en lugar de fallar por restricciones duras.
 Incluye: Pickup&Delivery, capacidades kg/m3, refrigerado (opcional), penalizaciones por TW.
 
 Uso:
-  pip install ortools pandas geopy python-dateutil
+  pip install ortools pandas numpy python-dateutil
   python vrp_advanced_soft.py --speed_kmh 50 --late_penalty 6 --early_penalty 1 --ignore_refrigerated 0 --search_seconds 120
 
 Parámetros:
@@ -13,15 +13,60 @@ Parámetros:
   --early_penalty        penalización por minuto de espera antes del TW (p. ej. 1)
   --ignore_refrigerated  1 para ignorar requisito de frío (solo pruebas)
   --search_seconds       tiempo máximo de búsqueda
+  --distance_method      haversine (default) o ellipsoidal (aprox. WGS84)
+  --matrix_cache         directorio del caché persistente de distancias ('' = desactivar)
+  --warm_start           stops plan previo (p. ej. stops_plan_advanced.csv) como solución inicial:
+                         se descartan pedidos cancelados y se insertan los nuevos
+  --allow_unserved       1 = una sola búsqueda que puede dejar pedidos sin atender pagando
+                         --unserved_penalty x peso de la columna priority (normal 1, alta 3, criticidad 10)
+  --prune_arcs           1 = descartar antes de armar el modelo los arcos imposibles por ventana
+                         (con --prune_window_tol minutos de tolerancia), capacidad o precedencia
+  --profile              1 = trace JSON por etapa (tiempos, CPU, memoria) en traces/ (o VRP_PROFILE=1)
+  --sparse_k             > 0 = restringe el vecindario de búsqueda a los k vecinos más cercanos (+ depot y
+                         pareja P&D) cuando hay al menos --sparse_min_nodes nodos. No ahorra memoria (las
+                         matrices siguen siendo N x N) y el plan puede salir peor; desactivado por defecto (0)
+  --progress_stream      JSONL con (elapsed_s, objective, vehicles_used, lateness_min) por cada solución que
+                         mejora el objetivo; se escribe en vivo (tail -f)
+  --stop_window_s        > 0 = cortar la búsqueda si en esa ventana de segundos el objetivo no mejoró más de
+  --stop_improvement_pct (default 0.5 %); se devuelve la mejor solución encontrada
+  --solve_cache          caché de planes por contenido (pedidos + flota + parámetros + versión del solver):
+                         una corrida idéntica restaura los CSV sin resolver ('' = desactivar)
+  --bypass_cache         1 = resolver igual y refrescar la entrada del caché
+  --construct            1 = solución inicial con la heurística de inserción regret-2 (insertion_heuristic.py)
+                         en lugar de PATH_CHEAPEST_ARC; --warm_start tiene prioridad
+  --consolidate          1 = fusionar paradas co-ubicadas (mismo punto y tipo) con ventanas compatibles
+                         (solape >= --consolidate_overlap min) en nodos multi-pedido (stop_consolidation.py);
+                         stops_plan_advanced.csv se expande igual a una fila por pedido
+  --speed_profile        velocidades por franja horaria (speed_profiles.py) en lugar de --speed_kmh fijo:
+                         JSON configurado/guardado o routes_history.csv para aprenderlo; cada arco usa la
+                         franja de la salida estimada de su nodo
+  --eta_model            modelo ETA entrenado (eta_model.joblib de eta_baseline_skeleton_fixed.py): los minutos
+                         de viaje salen de la predicción por lotes (eta_inference.py, con caché en --eta_cache)
+                         para --eta_hour / --eta_dow (default: hora de la primera ventana y día de day0);
+                         tiene prioridad sobre --speed_kmh y --speed_profile
+  --td_rounds            rondas con --speed_profile (default 1): desde la 2da, las franjas salen de los horarios
+                         de la solución anterior y se re-resuelve desde esas rutas (el tiempo se reparte)
 Salida:
-  routes_plan_advanced.csv, stops_plan_advanced.csv
+  routes_plan_advanced.csv, stops_plan_advanced.csv (+ unserved_orders.csv con --allow_unserved 1)
 """
-import argparse, math, sys
+import argparse, os, sys, time
+import numpy as np
 import pandas as pd
-from geopy.distance import geodesic
 from dateutil import parser as dtparser
 from datetime import datetime
 from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+from matrix_cache import cached_matrices
+from profiling import span
+from solve_telemetry import watch_solutions
+import profiling
+
+# Peso de la penalización por pedido no atendido según la columna priority de orders.csv
+PRIORITY_WEIGHTS = {'normal': 1, 'alta': 3, 'criticidad': 10}
+PRIORITY_ALIASES = {'critico': 'criticidad', 'crítica': 'criticidad', 'critica': 'criticidad', 'urgente': 'criticidad'}
+
+def priority_weight(value):
+    p = str(value).strip().lower()
+    return PRIORITY_WEIGHTS.get(PRIORITY_ALIASES.get(p, p), 1)
 
 def iso_to_minutes_since_start(ts_str, day0=None):
     ts = dtparser.isoparse(str(ts_str))
@@ -30,25 +75,24 @@ def iso_to_minutes_since_start(ts_str, day0=None):
     delta = ts - day0
     return int(delta.total_seconds() // 60), day0
 
-def build_vrp(speed_kmh=50.0, late_penalty=6, early_penalty=1, ignore_refrig=False, search_seconds=120):
-    vehicles = pd.read_csv("vehicles.csv")
-    orders = pd.read_csv("orders.csv")
-
-    # Servicios cortos para mejorar factibilidad
-    pickup_service_min = 5
-    drop_service_min = 5
-
-    # Base temporal
-    day0 = None
+def load_inputs(orders_path="orders.csv", vehicles_path="vehicles.csv"):
+    return pd.read_csv(orders_path), pd.read_csv(vehicles_path)
 
+def build_nodes(orders, pickup_service_min=5, drop_service_min=5, depot=None, day0=None):
+    """Depot (centroide de pickups, o el (lat, lon) recibido) + un nodo pickup y uno drop por pedido.
+    day0 fija la base temporal (por defecto, medianoche del primer pedido)."""
     # Depot = centroide de pickups
-    depot_lat = orders['pickup_lat'].mean()
-    depot_lon = orders['pickup_lon'].mean()
+    if depot is None:
+        depot_lat = orders['pickup_lat'].mean()
+        depot_lon = orders['pickup_lon'].mean()
+    else:
+        depot_lat, depot_lon = depot
 
     # Nodos
     nodes = [{
         'node_id': 'DEPOT', 'type':'depot', 'order_id':'', 'lat': depot_lat, 'lon': depot_lon,
-        'tw_start': 0, 'tw_end': 72*60, 'service_min': 0, 'demand_kg': 0, 'demand_m3': 0, 'refrig_req': 0
+        'tw_start': 0, 'tw_end': 72*60, 'service_min': 0, 'demand_kg': 0, 'demand_m3': 0, 'refrig_req': 0,
+        'priority': ''
     }]
     pd_pairs = []
     for _, o in orders.iterrows():
@@ -65,7 +109,8 @@ def build_vrp(speed_kmh=50.0, late_penalty=6, early_penalty=1, ignore_refrig=Fal
             'service_min': pickup_service_min,
             'demand_kg': int(o['weight_kg']),
             'demand_m3': float(o.get('volume_m3', 0.0)),
-            'refrig_req': int(o.get('refrigerated_required', 0))
+            'refrig_req': int(o.get('refrigerated_required', 0)),
+            'priority': str(o.get('priority', 'normal'))
         })
 
         # Drop
@@ -78,18 +123,91 @@ def build_vrp(speed_kmh=50.0, late_penalty=6, early_penalty=1, ignore_refrig=Fal
             'service_min': drop_service_min,
             'demand_kg': -int(o['weight_kg']),
             'demand_m3': -float(o.get('volume_m3', 0.0)),
-            'refrig_req': int(o.get('refrigerated_required', 0))
+            'refrig_req': int(o.get('refrigerated_required', 0)),
+            'priority': str(o.get('priority', 'normal'))
         })
         pd_pairs.append((p_idx, d_idx))
+    return nodes, pd_pairs
 
-    N = len(nodes)
+def prepare_data(orders, vehicles, speed_kmh=50.0, ignore_refrig=False,
+                 distance_method="haversine", matrix_cache=".matrix_cache", depot=None, day0=None,
+                 sparse_k=0, sparse_min_nodes=1000, matrices=None, consolidate=False, consolidate_overlap=30,
+                 speed_profile=None, eta_model=None, eta_hour=None, eta_dow=None, eta_cache=".eta_cache"):
+    """Entradas del modelo (nodos, matrices, flota) en estructuras simples y serializables.
+    sparse_k > 0 y al menos sparse_min_nodes nodos: grafo kNN (sparse_arcs) que restringe el vecindario de búsqueda
+    (las matrices siguen densas).
+    matrices: (dist_km, travel_min) ya calculadas para estos nodos (se reutilizan tal cual).
+    consolidate: paradas co-ubicadas con ventanas compatibles en un solo nodo (stop_consolidation).
+    speed_profile (speed_profiles.SpeedProfile): minutos por franja horaria según la salida estimada de cada nodo.
+    eta_model: ruta del modelo ETA joblib; los minutos salen de eta_inference.eta_matrix."""
+    # Servicios cortos para mejorar factibilidad
+    with span("build_nodes", orders=len(orders)):
+        nodes, pd_pairs = build_nodes(orders, pickup_service_min=5, drop_service_min=5, depot=depot, day0=day0)
+    if consolidate:
+        from stop_consolidation import consolidate as consolidate_stops
+        with span("consolidate", nodes=len(nodes)):
+            nodes, pd_pairs, stats = consolidate_stops(nodes, pd_pairs, vehicles, ignore_refrig, consolidate_overlap)
+        print(f"[CONSOLIDATE] nodos {stats['nodes_before']} -> {stats['nodes_after']} "
+              f"({stats['merged_nodes']} multi-pedido, hasta {stats['max_orders_per_node']} pedidos por nodo)")
+    lat, lon = [n['lat'] for n in nodes], [n['lon'] for n in nodes]
 
     # Distancias y tiempos
-    def km(i, j):
-        if i == j: return 0.0
-        return geodesic((nodes[i]['lat'], nodes[i]['lon']), (nodes[j]['lat'], nodes[j]['lon'])).km
-    dist_km = [[km(i,j) for j in range(N)] for i in range(N)]
-    travel_min = [[int(math.ceil((dist_km[i][j] / max(1e-6, speed_kmh)) * 60)) for j in range(N)] for i in range(N)]
+    with span("matrix", nodes=len(nodes)):
+        if matrices is not None:
+            dist_km, travel_min = matrices
+        else:
+            dist_km, travel_min = cached_matrices(lat, lon, speed_kmh, method=distance_method, cache_dir=matrix_cache)
+    arcs = None
+    if sparse_k > 0 and len(nodes) >= sparse_min_nodes:
+        from sparse_arcs import build_sparse
+        partners = {}
+        for p, d in pd_pairs:
+            partners[p], partners[d] = d, p
+        with span("sparse_arcs", nodes=len(nodes)):
+            arcs = build_sparse(lat, lon, sparse_k, partners)
+    stack = departures = None
+    if eta_model:
+        from eta_inference import eta_matrix
+        if eta_hour is None:
+            eta_hour = min(n['tw_start'] for n in nodes if n['type'] == 'drop') // 60 % 24 if len(nodes) > 1 else 8
+        if eta_dow is None:
+            eta_dow = (day0 or iso_to_minutes_since_start(orders['window_start'].iloc[0])[1]).weekday()
+        with span("eta_matrix", nodes=len(nodes)):
+            travel_min = eta_matrix(lat, lon, eta_hour, eta_dow, eta_model, eta_cache)
+        if speed_profile is not None:
+            print("[WARN] --eta_model tiene prioridad: se ignora --speed_profile.")
+    elif speed_profile is not None:
+        from speed_profiles import TravelStack, expected_departures
+        with span("speed_profile", nodes=len(nodes)):
+            stack = TravelStack(dist_km, speed_profile)
+            departures = expected_departures(nodes, pd_pairs, travel_min)
+            travel_min = stack.gather(departures)
+    return {
+        'nodes': nodes,
+        'pd_pairs': pd_pairs,
+        'dist_km': dist_km,
+        'travel_min': travel_min,
+        'vehicles': vehicles.reset_index(drop=True),
+        'ignore_refrig': bool(ignore_refrig),
+        'arcs': arcs,
+        'travel_stack': stack,
+        'departures': departures,
+    }
+
+def node_members(node):
+    """Nodos originales (uno por pedido) detrás de un nodo, consolidado o no."""
+    return node.get('members') or [node]
+
+def unserved_penalty_for(node, unserved_penalty):
+    return sum(int(unserved_penalty * priority_weight(m['priority'])) for m in node_members(node))
+
+def build_model(data, late_penalty=6, early_penalty=1, unserved_penalty=0):
+    """Arma el RoutingModel. Devuelve (manager, routing, time_dim).
+    unserved_penalty > 0: cada par pickup/drop puede quedar sin atender pagando
+    unserved_penalty x peso de prioridad (siempre hay plan, sin reintentos)."""
+    nodes, pd_pairs, vehicles = data['nodes'], data['pd_pairs'], data['vehicles']
+    travel_min = data['travel_min']
+    N = len(nodes)
     service_min = [nodes[i]['service_min'] for i in range(N)]
 
     # Vehículos
@@ -101,11 +219,10 @@ def build_vrp(speed_kmh=50.0, late_penalty=6, early_penalty=1, ignore_refrig=Fal
     manager = pywrapcp.RoutingIndexManager(N, n_veh, 0)
     routing = pywrapcp.RoutingModel(manager)
 
-    # Tiempo de tránsito = viaje + servicio del nodo origen
-    def transit_time(from_i, to_i):
-        f = manager.IndexToNode(from_i); t = manager.IndexToNode(to_i)
-        return int(travel_min[f][t] + service_min[f])
-    time_cb = routing.RegisterTransitCallback(transit_time)
+    # Tiempo de tránsito = viaje + servicio del nodo origen.
+    # Matriz precalculada: OR-Tools la evalúa en C++ sin volver a Python.
+    transit = travel_min.astype(np.int64) + np.asarray(service_min, dtype=np.int64)[:, None]
+    time_cb = routing.RegisterTransitMatrix(transit.tolist())
     routing.SetArcCostEvaluatorOfAllVehicles(time_cb)
 
     # Dimensión de tiempo con gran slack (esperas)
@@ -130,28 +247,44 @@ def build_vrp(speed_kmh=50.0, late_penalty=6, early_penalty=1, ignore_refrig=Fal
         if late_penalty > 0:
             time_dim.SetCumulVarSoftUpperBound(index, twe, int(late_penalty))
 
-    # Capacidades
-    def demand_kg_cb(index):
-        node = manager.IndexToNode(index)
-        return int(nodes[node]['demand_kg'])
-    def demand_m3_cb(index):
-        node = manager.IndexToNode(index)
-        return int(round(nodes[node]['demand_m3'] * 100))
-
-    kg_idx = routing.RegisterUnaryTransitCallback(demand_kg_cb)
-    m3_idx = routing.RegisterUnaryTransitCallback(demand_m3_cb)
+    # Capacidades: demandas como vectores por nodo (m3 en centésimas)
+    demand_kg = [int(n['demand_kg']) for n in nodes]
+    demand_m3 = [int(round(n['demand_m3'] * 100)) for n in nodes]
+    kg_idx = routing.RegisterUnaryTransitVector(demand_kg)
+    m3_idx = routing.RegisterUnaryTransitVector(demand_m3)
     routing.AddDimensionWithVehicleCapacity(kg_idx, 0, caps_kg, True, "CapKG")
     routing.AddDimensionWithVehicleCapacity(m3_idx, 0, [int(c*100) for c in caps_m3], True, "CapM3")
 
-    # Pickup & Delivery
+    # Pickup & Delivery. Con nodos consolidados un nodo puede estar en varios pares: esos pares quedan
+    # solo con las restricciones explícitas (mismo vehículo, pickup antes que drop); OR-Tools no admite
+    # bien un nodo en varios AddPickupAndDelivery
+    uses = np.bincount(np.asarray(pd_pairs, dtype=np.int64).ravel(), minlength=N) if pd_pairs else np.zeros(N, int)
     for (p, d) in pd_pairs:
         p_i = manager.NodeToIndex(p); d_i = manager.NodeToIndex(d)
-        routing.AddPickupAndDelivery(p_i, d_i)
+        if uses[p] == 1 and uses[d] == 1:
+            routing.AddPickupAndDelivery(p_i, d_i)
         routing.solver().Add(routing.VehicleVar(p_i) == routing.VehicleVar(d_i))
         routing.solver().Add(time_dim.CumulVar(p_i) <= time_dim.CumulVar(d_i))
+        if unserved_penalty > 0:
+            # El par se atiende entero o no se atiende
+            routing.solver().Add(routing.ActiveVar(p_i) == routing.ActiveVar(d_i))
+    if unserved_penalty > 0:
+        # Una disyunción por nodo; la penalización se cobra una vez por pedido (en el pickup)
+        for p in dict.fromkeys(p for p, _ in pd_pairs):
+            routing.AddDisjunction([manager.NodeToIndex(p)], unserved_penalty_for(nodes[p], unserved_penalty))
+        for d in dict.fromkeys(d for _, d in pd_pairs):
+            routing.AddDisjunction([manager.NodeToIndex(d)], 0)
+
+    # Arcos podados por arc_pruning.prune (si se calcularon)
+    if data.get('allowed_arcs') is not None:
+        from arc_pruning import apply_mask
+        apply_mask(manager, routing, data['allowed_arcs'])
+    # Grafo kNN (sparse_arcs): NextVar de cada nodo solo hacia sus vecinos
+    if data.get('arcs') is not None:
+        data['arcs'].restrict(manager, routing)
 
     # Refrigerado (opcional)
-    if not ignore_refrig:
+    if not data['ignore_refrig']:
         for i in range(1, N):
             if nodes[i]['refrig_req'] == 1:
                 allowed = [v for v in range(n_veh) if refrig[v] == 1]
@@ -160,59 +293,108 @@ def build_vrp(speed_kmh=50.0, late_penalty=6, early_penalty=1, ignore_refrig=Fal
                 else:
                     print("[WARN] Hay pedidos refrigerados pero no hay vehículos refrigerados. Considerá --ignore_refrigerated 1 para pruebas.")
 
-    # Búsqueda
+    return manager, routing, time_dim
+
+def search_parameters(search_seconds=120, first_solution="PATH_CHEAPEST_ARC", metaheuristic="GUIDED_LOCAL_SEARCH"):
     search = pywrapcp.DefaultRoutingSearchParameters()
-    search.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-    search.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+    search.first_solution_strategy = getattr(routing_enums_pb2.FirstSolutionStrategy, first_solution)
+    search.local_search_metaheuristic = getattr(routing_enums_pb2.LocalSearchMetaheuristic, metaheuristic)
     search.time_limit.FromSeconds(int(search_seconds))
+    return search
+
+def extract_solution(data, manager, routing, time_dim, solution):
+    """Rutas como listas de nodos (con depot al inicio y al final) + llegadas, sin objetos de OR-Tools."""
+    routes, arrivals = [], []
+    for v in range(len(data['vehicles'])):
+        idx = routing.Start(v)
+        seq, arr = [], []
+        while True:
+            seq.append(manager.IndexToNode(idx))
+            arr.append(solution.Value(time_dim.CumulVar(idx)))
+            if routing.IsEnd(idx):
+                break
+            idx = solution.Value(routing.NextVar(idx))
+        routes.append(seq)
+        arrivals.append(arr)
+    return {'objective': int(solution.ObjectiveValue()), 'routes': routes, 'arrive_min': arrivals,
+            'unserved': unserved_orders(data, routes)}
+
+def unserved_orders(data, routes):
+    """Pickups que no aparecen en ninguna ruta -> índices de nodo (pickup) de pedidos sin atender."""
+    served = {i for r in routes for i in r}
+    return list(dict.fromkeys(p for p, _ in data['pd_pairs'] if p not in served))
 
-    solution = routing.SolveWithParameters(search)
+def solve(data, late_penalty=6, early_penalty=1, search_seconds=120,
+          first_solution="PATH_CHEAPEST_ARC", metaheuristic="GUIDED_LOCAL_SEARCH", initial_routes=None,
+          unserved_penalty=0, stats=None, monitor=None):
+    """Construye y resuelve el modelo. Devuelve el dict de extract_solution o None.
+    initial_routes: lista por vehículo de nodos (sin depot) para arrancar desde esa asignación.
+    stats (dict opcional): se completa con model_s, first_solution_s y solutions (benchmarks).
+    monitor (solve_telemetry.ConvergenceMonitor opcional): progreso por mejora y corte temprano."""
+    t0 = time.perf_counter()
+    with span("build_model", nodes=len(data['nodes'])):
+        manager, routing, time_dim = build_model(data, late_penalty, early_penalty, unserved_penalty)
+    if stats is not None:
+        watch_solutions(routing, stats, t0)
+    if monitor is not None:
+        monitor.attach(data, manager, routing, time_dim)
+    search = search_parameters(search_seconds, first_solution, metaheuristic)
+    if data.get('arcs') is not None:
+        # Los operadores de búsqueda local solo exploran el vecindario kNN
+        search.ls_operator_neighbors_ratio = min(1.0, data['arcs'].k / max(1, len(data['nodes'])))
+        search.ls_operator_min_neighbors = data['arcs'].k
+    solution = None
+    with span("search", seconds=int(search_seconds), first_solution=first_solution, metaheuristic=metaheuristic):
+        if initial_routes is not None:
+            routing.CloseModelWithParameters(search)
+            initial = routing.ReadAssignmentFromRoutes(initial_routes, True)
+            if initial is None:
+                print("[WARN] La asignación inicial no es válida para el modelo; se resuelve desde cero.")
+            else:
+                solution = routing.SolveFromAssignmentWithParameters(initial, search)
+        if solution is None:
+            solution = routing.SolveWithParameters(search)
+    if solution is None and data.get('arcs') is not None:
+        # Seguridad: con P&D el grafo kNN puede no admitir ninguna solución; se repite con todos los arcos
+        # (el monitor se vuelve a enganchar: su archivo de progreso sigue abierto y el resumen sale una vez)
+        print("[WARN] Sin solución con el grafo kNN (sparse); se resuelve sin restringir arcos.")
+        return solve(dict(data, arcs=None), late_penalty, early_penalty, search_seconds, first_solution,
+                     metaheuristic, initial_routes, unserved_penalty, stats, monitor)
+    if monitor is not None:
+        monitor.close()
+        print(monitor.summary())
     if solution is None:
-        sys.exit("No se encontró solución (soft). Revisa capacidades extremas o coordenadas.")
+        return None
+    with span("extract_solution"):
+        return extract_solution(data, manager, routing, time_dim, solution)
 
-    # Exportar
+def plan_frames(data, result):
+    """(routes_df, stops_df) con el esquema de routes_plan_advanced.csv / stops_plan_advanced.csv."""
+    nodes, vehicles, dist_km = data['nodes'], data['vehicles'], data['dist_km']
     rows_routes, rows_stops = [], []
-    for v in range(n_veh):
-        idx = routing.Start(v)
+    for v, (seq, arr) in enumerate(zip(result['routes'], result['arrive_min'])):
         seq_ids = []
         load_kg = 0
         total_km = 0.0
-        while not routing.IsEnd(idx):
-            node = manager.IndexToNode(idx)
-            seq_ids.append(nodes[node]['node_id'])
-            if node != 0:
-                load_kg += nodes[node]['demand_kg']
-            nxt = solution.Value(routing.NextVar(idx))
-            node_next = manager.IndexToNode(nxt)
-            total_km += dist_km[node][node_next]
-            tarr = solution.Value(time_dim.CumulVar(idx))
-            rows_stops.append({
-                'vehicle_id': vehicles.iloc[v]['vehicle_id'],
-                'stop_node': nodes[node]['node_id'],
-                'stop_type': nodes[node]['type'],
-                'order_id': nodes[node]['order_id'],
-                'arrive_min': tarr,
-                'tw_start': nodes[node]['tw_start'],
-                'tw_end': nodes[node]['tw_end'],
-                'lat': nodes[node]['lat'],
-                'lon': nodes[node]['lon']
-            })
-            idx = nxt
-        # fin depot
-        node = manager.IndexToNode(idx)
-        tarr = solution.Value(time_dim.CumulVar(idx))
-        rows_stops.append({
-            'vehicle_id': vehicles.iloc[v]['vehicle_id'],
-            'stop_node': nodes[node]['node_id'],
-            'stop_type': nodes[node]['type'],
-            'order_id': nodes[node]['order_id'],
-            'arrive_min': tarr,
-            'tw_start': nodes[node]['tw_start'],
-            'tw_end': nodes[node]['tw_end'],
-            'lat': nodes[node]['lat'],
-            'lon': nodes[node]['lon']
-        })
-        seq_ids.append(nodes[node]['node_id'])
+        for k, (node, tarr) in enumerate(zip(seq, arr)):
+            if k + 1 < len(seq):
+                if node != 0:
+                    load_kg += nodes[node]['demand_kg']
+                total_km += float(dist_km[node, seq[k+1]])
+            # Un nodo consolidado se expande a una fila por pedido (misma llegada)
+            for m in node_members(nodes[node]):
+                seq_ids.append(m['node_id'])
+                rows_stops.append({
+                    'vehicle_id': vehicles.iloc[v]['vehicle_id'],
+                    'stop_node': m['node_id'],
+                    'stop_type': m['type'],
+                    'order_id': m['order_id'],
+                    'arrive_min': tarr,
+                    'tw_start': m['tw_start'],
+                    'tw_end': m['tw_end'],
+                    'lat': m['lat'],
+                    'lon': m['lon']
+                })
         rows_routes.append({
             'vehicle_id': vehicles.iloc[v]['vehicle_id'],
             'vehicle_type': vehicles.iloc[v]['type'],
@@ -221,9 +403,138 @@ def build_vrp(speed_kmh=50.0, late_penalty=6, early_penalty=1, ignore_refrig=Fal
             'total_load_kg': int(max(0, load_kg))
         })
 
-    pd.DataFrame(rows_routes).to_csv("routes_plan_advanced.csv", index=False)
-    pd.DataFrame(rows_stops).to_csv("stops_plan_advanced.csv", index=False)
-    print("OK -> routes_plan_advanced.csv y stops_plan_advanced.csv generados (soft TW).")
+    return pd.DataFrame(rows_routes), pd.DataFrame(rows_stops)
+
+def unserved_frame(data, result, unserved_penalty=0):
+    """Pedidos sin atender (esquema de unserved_orders.csv)."""
+    nodes = data['nodes']
+    drop_of = {m['order_id']: m for _, d in data['pd_pairs'] for m in node_members(nodes[d])}
+    rows = []
+    for p in result.get('unserved', []):
+        for n in node_members(nodes[p]):
+            d = drop_of[n['order_id']]
+            rows.append({
+                'order_id': n['order_id'],
+                'priority': n['priority'],
+                'penalty': unserved_penalty_for(n, unserved_penalty),
+                'weight_kg': n['demand_kg'],
+                'volume_m3': n['demand_m3'],
+                'refrigerated_required': n['refrig_req'],
+                'tw_start': d['tw_start'],
+                'tw_end': d['tw_end'],
+            })
+    return pd.DataFrame(rows, columns=['order_id', 'priority', 'penalty', 'weight_kg', 'volume_m3',
+                                       'refrigerated_required', 'tw_start', 'tw_end'])
+
+def export_plan(data, result, routes_path="routes_plan_advanced.csv", stops_path="stops_plan_advanced.csv",
+                unserved_path=None, unserved_penalty=0):
+    with span("export"):
+        routes_df, stops_df = plan_frames(data, result)
+        routes_df.to_csv(routes_path, index=False)
+        stops_df.to_csv(stops_path, index=False)
+        if unserved_path:
+            unserved_frame(data, result, unserved_penalty).to_csv(unserved_path, index=False)
+
+def build_vrp(speed_kmh=50.0, late_penalty=6, early_penalty=1, ignore_refrig=False, search_seconds=120,
+              distance_method="haversine", matrix_cache=".matrix_cache", warm_start=None,
+              allow_unserved=False, unserved_penalty=100_000, prune_arcs=False, prune_window_tol=60,
+              sparse_k=0, sparse_min_nodes=1000, progress_stream=None, stop_improvement_pct=0.0,
+              stop_window_s=0.0, solve_cache=".solve_cache", bypass_cache=False, construct=False,
+              consolidate=False, consolidate_overlap=30, speed_profile="", td_rounds=1,
+              eta_model="", eta_hour=None, eta_dow=None, eta_cache=".eta_cache"):
+    with span("load_inputs"):
+        orders, vehicles = load_inputs()
+    outputs = ["routes_plan_advanced.csv", "stops_plan_advanced.csv"] + (["unserved_orders.csv"] if allow_unserved else [])
+    cache = key = None
+    if solve_cache:
+        from solve_cache import SolveCache, cache_key, file_digest, solver_version
+        params = dict(solver="vrp_advanced_soft", speed_kmh=speed_kmh, late_penalty=late_penalty,
+                      early_penalty=early_penalty, ignore_refrig=bool(ignore_refrig), search_seconds=search_seconds,
+                      distance_method=distance_method, warm_start=file_digest(warm_start),
+                      unserved_penalty=unserved_penalty if allow_unserved else None,
+                      prune_window_tol=prune_window_tol if prune_arcs else None,
+                      sparse_k=sparse_k, sparse_min_nodes=sparse_min_nodes if sparse_k else None,
+                      stop=(stop_improvement_pct, stop_window_s) if stop_window_s > 0 else None,
+                      construct=bool(construct) and not warm_start,
+                      consolidate=consolidate_overlap if consolidate and not (warm_start or construct) else None,
+                      speed_profile=(file_digest(speed_profile), td_rounds) if speed_profile else None,
+                      eta_model=(file_digest(eta_model), eta_hour, eta_dow) if eta_model else None)
+        # Solo el fuente de los módulos que usan los flags activos, por ruta (sin importarlos)
+        used = {'distance_matrix': True, 'matrix_cache': True, 'arc_pruning': prune_arcs,
+                'sparse_arcs': sparse_k > 0, 'warm_start': bool(warm_start), 'insertion_heuristic': params['construct'],
+                'stop_consolidation': params['consolidate'] is not None, 'speed_profiles': bool(speed_profile),
+                'eta_inference': bool(eta_model), 'solve_telemetry': stop_window_s > 0}
+        here = os.path.dirname(os.path.abspath(__file__))
+        cache = SolveCache(solve_cache)
+        key = cache_key(orders, vehicles, params,
+                        solver_version(__file__, *(os.path.join(here, f"{m}.py") for m, on in used.items() if on)))
+        meta = None if bypass_cache else cache.restore(key)
+        if meta is not None:
+            print(f"OK -> {', '.join(outputs)} restaurados del caché de planes ({solve_cache}/{key}, {meta['created']}).")
+            return
+    if consolidate and (warm_start or construct):
+        print("[WARN] --consolidate no se combina con --warm_start / --construct (esperan un nodo por pedido); se omite.")
+        consolidate = False
+    profile = None
+    if speed_profile:
+        from speed_profiles import load_profile
+        with span("load_speed_profile"):
+            profile = load_profile(speed_profile, speed_kmh)
+        print(f"[TD] Perfil de velocidad {speed_profile}: {profile}")
+    with span("prepare_data"):
+        data = prepare_data(orders, vehicles, speed_kmh, ignore_refrig, distance_method, matrix_cache,
+                            sparse_k=sparse_k, sparse_min_nodes=sparse_min_nodes,
+                            consolidate=consolidate, consolidate_overlap=consolidate_overlap, speed_profile=profile,
+                            eta_model=eta_model, eta_hour=eta_hour, eta_dow=eta_dow, eta_cache=eta_cache)
+    if prune_arcs:
+        from arc_pruning import prune
+        with span("prune_arcs"):
+            prune(data, prune_window_tol)
+    initial = None
+    if warm_start:
+        from warm_start import initial_routes_from_file
+        with span("warm_start"):
+            initial = initial_routes_from_file(data, warm_start)
+    elif construct:
+        from insertion_heuristic import construct_routes
+        with span("construct"):
+            initial, _ = construct_routes(data)
+    elif consolidate:
+        from stop_consolidation import initial_routes
+        with span("construct"):
+            initial = initial_routes(data, late_penalty)
+    monitor = None
+    if progress_stream or stop_window_s > 0:
+        from solve_telemetry import ConvergenceMonitor
+        monitor = ConvergenceMonitor(progress_stream, stop_improvement_pct, stop_window_s)
+    penalty = unserved_penalty if allow_unserved else 0
+    rounds = max(1, int(td_rounds)) if data['travel_stack'] is not None else 1
+    seconds = max(1, search_seconds // rounds)
+    result = solve(data, late_penalty, early_penalty, seconds, initial_routes=initial,
+                   unserved_penalty=penalty, monitor=monitor)
+    if result is None:
+        sys.exit("No se encontró solución (soft). Revisa capacidades extremas o coordenadas.")
+    for k in range(2, rounds + 1):
+        # Franjas según los horarios de la solución anterior; se re-resuelve desde esas rutas
+        from speed_profiles import solved_departures
+        data['departures'] = solved_departures(data, result, data['departures'])
+        data['travel_min'] = data['travel_stack'].gather(data['departures'])
+        again = solve(data, late_penalty, early_penalty, seconds, initial_routes=[r[1:-1] for r in result['routes']],
+                      unserved_penalty=penalty)
+        if again is not None:
+            result = again
+        print(f"[TD] Ronda {k}/{rounds}: objetivo {result['objective']}")
+
+    # Exportar
+    if allow_unserved:
+        export_plan(data, result, unserved_path="unserved_orders.csv", unserved_penalty=penalty)
+        print(f"OK -> routes_plan_advanced.csv, stops_plan_advanced.csv y unserved_orders.csv generados "
+              f"(soft TW, {len(result['unserved'])} pedidos sin atender).")
+    else:
+        export_plan(data, result)
+        print("OK -> routes_plan_advanced.csv y stops_plan_advanced.csv generados (soft TW).")
+    if cache is not None:
+        cache.store(key, outputs, {'label': "soft", 'objective': result['objective']})
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
@@ -232,6 +543,41 @@ if __name__ == "__main__":
     ap.add_argument("--early_penalty", type=float, default=1.0)
     ap.add_argument("--ignore_refrigerated", type=int, default=0)
     ap.add_argument("--search_seconds", type=int, default=120)
+    ap.add_argument("--distance_method", choices=["haversine", "ellipsoidal"], default="haversine")
+    ap.add_argument("--matrix_cache", type=str, default=".matrix_cache", help="directorio del caché de distancias ('' = desactivar)")
+    ap.add_argument("--warm_start", type=str, default="", help="stops plan previo para arrancar desde esa asignación")
+    ap.add_argument("--allow_unserved", type=int, default=0, help="1 = permitir pedidos sin atender (una sola búsqueda)")
+    ap.add_argument("--unserved_penalty", type=int, default=100_000, help="penalización base por pedido sin atender")
+    ap.add_argument("--prune_arcs", type=int, default=0, help="1 = podar arcos imposibles antes de armar el modelo")
+    ap.add_argument("--prune_window_tol", type=int, default=60, help="minutos de atraso tolerados al podar por ventana")
+    ap.add_argument("--sparse_k", type=int, default=0, help="k vecinos por nodo: solo restringe la búsqueda, no la memoria; puede dar planes peores (0 = todos los arcos)")
+    ap.add_argument("--sparse_min_nodes", type=int, default=1000, help="usar sparse solo desde esta cantidad de nodos")
+    ap.add_argument("--profile", type=int, default=0, help="1 = trace JSON por etapa (o VRP_PROFILE=1)")
+    ap.add_argument("--progress_stream", type=str, default="", help="JSONL con una línea por solución que mejora")
+    ap.add_argument("--stop_improvement_pct", type=float, default=0.5, help="mejora mínima (%%) en la ventana para seguir buscando")
+    ap.add_argument("--stop_window_s", type=float, default=0.0, help="segundos de la ventana de convergencia (0 = sin corte temprano)")
+    ap.add_argument("--solve_cache", type=str, default=".solve_cache", help="directorio del caché de planes ('' = desactivar)")
+    ap.add_argument("--bypass_cache", type=int, default=0, help="1 = resolver igual aunque el plan esté en caché (y refrescarlo)")
+    ap.add_argument("--construct", type=int, default=0, help="1 = arrancar desde la heurística de inserción (insertion_heuristic.py)")
+    ap.add_argument("--consolidate", type=int, default=0, help="1 = fusionar paradas co-ubicadas con ventanas compatibles")
+    ap.add_argument("--consolidate_overlap", type=int, default=30, help="minutos mínimos de solape de ventanas para fusionar")
+    ap.add_argument("--speed_profile", type=str, default="", help="perfil de velocidad por franja (.json) o histórico GPS para aprenderlo")
+    ap.add_argument("--td_rounds", type=int, default=1, help="rondas de re-estimación de franjas con --speed_profile")
+    ap.add_argument("--eta_model", type=str, default="", help="modelo ETA joblib para los minutos de viaje ('' = --speed_kmh)")
+    ap.add_argument("--eta_hour", type=int, default=None, help="hora de salida para el modelo ETA (default: primera ventana)")
+    ap.add_argument("--eta_dow", type=int, default=None, help="día de semana para el modelo ETA (0 = lunes; default: day0)")
+    ap.add_argument("--eta_cache", type=str, default=".eta_cache", help="directorio del caché de matrices ETA ('' = desactivar)")
     args = ap.parse_args()
+    profiling.setup(args.profile, "vrp_advanced_soft")
     build_vrp(speed_kmh=args.speed_kmh, late_penalty=args.late_penalty, early_penalty=args.early_penalty,
-              ignore_refrig=bool(args.ignore_refrigerated), search_seconds=args.search_seconds)
+              ignore_refrig=bool(args.ignore_refrigerated), search_seconds=args.search_seconds,
+              distance_method=args.distance_method, matrix_cache=args.matrix_cache,
+              warm_start=args.warm_start, allow_unserved=bool(args.allow_unserved),
+              unserved_penalty=args.unserved_penalty, prune_arcs=bool(args.prune_arcs),
+              prune_window_tol=args.prune_window_tol, sparse_k=args.sparse_k,
+              sparse_min_nodes=args.sparse_min_nodes, progress_stream=args.progress_stream,
+              stop_improvement_pct=args.stop_improvement_pct, stop_window_s=args.stop_window_s,
+              solve_cache=args.solve_cache, bypass_cache=bool(args.bypass_cache), construct=bool(args.construct),
+              consolidate=bool(args.consolidate), consolidate_overlap=args.consolidate_overlap,
+              speed_profile=args.speed_profile, td_rounds=args.td_rounds, eta_model=args.eta_model,
+              eta_hour=args.eta_hour, eta_dow=args.eta_dow, eta_cache=args.eta_cache)
@@ -0,0 +1,260 @@
+"""
+vrp_benchmark.py
+Benchmark de escalado de los solvers VRP con baseline versionado.
+- Genera instancias con semilla a partir de sucursales.csv (sucursales dentro de --radius_km del centro)
+  para cada tamaño (pedidos), ajuste de ventanas (loose/medium/tight) y proporción de refrigerados
+- La flota es vehicles.csv replicada (una copia cada 30 pedidos)
+- Corre vrp_or_tools_demo y vrp_advanced_soft (soft con pedidos descartables), cada corrida en un
+  proceso nuevo para medir el pico de RSS por separado
+- vrp_advanced_fixed queda fuera por defecto: con ventanas duras, todos los pedidos obligatorios y a lo
+  sumo 2h de espera desde el minuto 0 no encuentra solución en estas instancias (ventanas desde las 8:00).
+  Se puede correr con --solvers fixed, pero no tiene filas en el baseline
+- Registra: armado de nodos, matriz, modelo, tiempo hasta la primera solución, objetivo,
+  pedidos sin atender, pico de RSS -> benchmark_history.csv (acumulado) y benchmark_last.json
+- Compara contra benchmark_baseline.json: tiempos, pedidos sin atender y RSS que empeoran más que
+  --threshold (relativo) se reportan como regresión y el script sale con código 1. El objetivo sale de
+  una búsqueda con límite de tiempo (no determinista): se registra pero no se compara
+- Los casos sin fila en el baseline se reportan como [SIN BASELINE]
+
+Uso:
+  python vrp_benchmark.py --sizes 30,100 --search_seconds 5
+  python vrp_benchmark.py --sizes 30,100,300,1000,3000 --tightness loose,tight --refrig 0,0.15
+  python vrp_benchmark.py --sizes 30,100 --search_seconds 5 --update_baseline 1
+
+El baseline versionado cubre todos los casos por defecto (demo y soft, 30/100/300/1000/3000 pedidos,
+--search_seconds 30: con 10 s las instancias de 3000 pedidos quedan al límite de la primera solución);
+los casos se comparan solo con la misma clave (solver, pedidos, ventanas, refrigerados, segundos).
+"""
+import argparse, json, math, os, resource, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+
+SOLVERS = ("demo", "fixed", "soft")
+DEFAULT_SOLVERS = ("demo", "soft")
+TIGHTNESS_HOURS = {"loose": (4, 8), "medium": (2, 4), "tight": (1, 2)}
+BASE_DAY = datetime(2025, 10, 16)
+HISTORY_PATH = "benchmark_history.csv"
+LAST_PATH = "benchmark_last.json"
+BASELINE_PATH = "benchmark_baseline.json"
+# Métricas comparadas contra el baseline (más alto = peor); el objetivo no se compara (no determinista)
+COMPARED = ("matrix_s", "model_s", "first_solution_s", "unserved", "peak_rss_mb")
+# Por debajo de estos valores absolutos las diferencias son ruido
+NOISE_FLOOR = {"matrix_s": 0.05, "model_s": 0.05, "first_solution_s": 0.05, "unserved": 0, "peak_rss_mb": 20}
+
+def load_sucursales(path="sucursales.csv", center=(-34.6037, -58.3816), radius_km=60.0):
+    from spatial_index import SpatialIndex
+    suc = pd.read_csv(path)
+    idx = SpatialIndex(suc['lat'].to_numpy(float), suc['lon'].to_numpy(float), suc['sucursal'].tolist())
+    near = idx.within(center[0], center[1], radius_km)
+    if len(near) < 2:
+        sys.exit(f"Menos de 2 sucursales a {radius_km} km del centro {center}.")
+    return suc.iloc[near['idx'].to_numpy()].reset_index(drop=True)
+
+def make_instance(suc, n, tightness="loose", refrig_ratio=0.15, seed=0):
+    """Pedidos sintéticos reproducibles (mismo esquema que generate_orders_from_sucursales.py)."""
+    rng = np.random.default_rng(seed)
+    lo_h, hi_h = TIGHTNESS_HOURS[tightness]
+    a = rng.integers(0, len(suc), n)
+    b = (a + rng.integers(1, len(suc), n)) % len(suc)  # dropoff distinto del pickup
+    start_min = rng.integers(8 * 60, 14 * 60 + 1, n)
+    width_min = rng.integers(lo_h * 60, hi_h * 60 + 1, n)
+    ws = [BASE_DAY + timedelta(minutes=int(s)) for s in start_min]
+    we = [min(BASE_DAY + timedelta(hours=22), s + timedelta(minutes=int(w))) for s, w in zip(ws, width_min)]
+    return pd.DataFrame({
+        "order_id": [f"ORD-BENCH-{i:05d}" for i in range(n)],
+        "client_name": suc['sucursal'].to_numpy()[b],
+        "pickup_lat": suc['lat'].to_numpy(float)[a].round(6),
+        "pickup_lon": suc['lon'].to_numpy(float)[a].round(6),
+        "dropoff_lat": suc['lat'].to_numpy(float)[b].round(6),
+        "dropoff_lon": suc['lon'].to_numpy(float)[b].round(6),
+        "window_start": [t.isoformat() for t in ws],
+        "window_end": [t.isoformat() for t in we],
+        "weight_kg": np.maximum(20, rng.normal(450, 200, n)).astype(int),
+        "volume_m3": np.maximum(0.2, np.abs(rng.normal(2.0, 0.9, n))).round(2),
+        "refrigerated_required": (rng.random(n) < refrig_ratio).astype(int),
+        "priority": rng.choice(["normal", "alta", "criticidad"], n),
+        "notes": "",
+    })
+
+def make_fleet(vehicles, n_orders, per_copy=30):
+    copies = max(1, math.ceil(n_orders / per_copy))
+    fleet = pd.concat([vehicles] * copies, ignore_index=True)
+    fleet['vehicle_id'] = [f"{vid}-{k}" for k in range(copies) for vid in vehicles['vehicle_id']]
+    return fleet
+
+def _peak_rss_mb():
+    # Linux: ru_maxrss en KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+def run_case(case):
+    """Corre un solver sobre una instancia (dentro de un proceso nuevo). Devuelve la fila de métricas."""
+    solver, orders, vehicles, p = case
+    from distance_matrix import build_matrices, meters_matrix
+    row = {'solver': solver, 'orders': len(orders), 'vehicles': len(vehicles)}
+    stats = {}
+    t0 = time.perf_counter()
+    try:
+        if solver == "demo":
+            import vrp_or_tools_demo as demo
+            nodes = demo.build_nodes(orders)
+            row['nodes_s'] = round(time.perf_counter() - t0, 3)
+            t1 = time.perf_counter()
+            dm = meters_matrix([n['lat'] for n in nodes], [n['lon'] for n in nodes])
+            row['matrix_s'] = round(time.perf_counter() - t1, 3)
+            rows = demo.solve(demo.prepare_data(orders, vehicles, dist_matrix=dm), p['search_seconds'], stats=stats)
+            ok = rows is not None
+            row['unserved'] = 0 if ok else len(orders)
+        else:
+            mod = __import__("vrp_advanced_fixed" if solver == "fixed" else "vrp_advanced_soft")
+            nodes, _ = mod.build_nodes(orders)
+            row['nodes_s'] = round(time.perf_counter() - t0, 3)
+            t1 = time.perf_counter()
+            mats = build_matrices([n['lat'] for n in nodes], [n['lon'] for n in nodes], p['speed_kmh'])
+            if solver == "soft" and p['sparse_k']:
+                data = mod.prepare_data(orders, vehicles, p['speed_kmh'], matrices=mats, sparse_k=p['sparse_k'],
+                                        sparse_min_nodes=p['sparse_min_nodes'])
+            else:
+                data = mod.prepare_data(orders, vehicles, p['speed_kmh'], matrices=mats)
+            row['matrix_s'] = round(time.perf_counter() - t1, 3)
+            if solver == "fixed":
+                result = mod.solve(data, p['search_seconds'], stats=stats)
+            else:
+                result = mod.solve(data, search_seconds=p['search_seconds'],
+                                   unserved_penalty=p['unserved_penalty'], stats=stats)
+            ok = result is not None
+            if ok:
+                stats['objective'] = result['objective']
+            row['unserved'] = (len(result.get('unserved', [])) if ok else len(orders))
+        row['status'] = "ok" if ok else "sin_solucion"
+    except Exception as e:
+        row['status'] = f"error: {e}"
+    row.update({k: stats[k] for k in ('model_s', 'first_solution_s', 'solutions', 'objective') if k in stats})
+    row['total_s'] = round(time.perf_counter() - t0, 3)
+    row['peak_rss_mb'] = _peak_rss_mb()
+    return row
+
+def run_isolated(case):
+    # Un proceso por corrida: el pico de RSS no se mezcla entre solvers
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(run_case, case).result()
+
+def case_key(row):
+    return f"{row['solver']}|{row['orders']}|{row['tightness']}|{row['refrig_ratio']}|{row['search_seconds']}s"
+
+def compare(rows, baseline, threshold):
+    """Regresiones (clave, métrica, baseline, actual, variación relativa) y claves sin baseline."""
+    out, missing = [], []
+    for row in rows:
+        base = baseline.get(case_key(row))
+        if base is None:
+            missing.append(case_key(row))
+            continue
+        if base.get('status') == "ok" and row.get('status') != "ok":
+            out.append((case_key(row), 'status', base.get('status'), row.get('status'), None))
+            continue
+        for m in COMPARED:
+            b, c = base.get(m), row.get(m)
+            if b is None or c is None or (isinstance(b, float) and math.isnan(b)):
+                continue
+            if c - b <= NOISE_FLOOR[m]:
+                continue
+            rel = (c - b) / abs(b) if b else float("inf")
+            if rel > threshold:
+                out.append((case_key(row), m, b, c, rel))
+    return out, missing
+
+def append_history(rows, path=HISTORY_PATH):
+    df = pd.DataFrame(rows)
+    df.to_csv(path, mode="a", index=False, header=not os.path.exists(path))
+
+def main(args):
+    suc = load_sucursales(args.sucursales, (args.center_lat, args.center_lon), args.radius_km)
+    vehicles = pd.read_csv(args.vehicles)
+    sizes = [int(x) for x in args.sizes.split(",") if x]
+    tights = [t for t in args.tightness.split(",") if t]
+    refrigs = [float(x) for x in args.refrig.split(",") if x]
+    solvers = [s for s in args.solvers.split(",") if s]
+    if set(solvers) - set(SOLVERS):
+        sys.exit(f"Solvers desconocidos: {sorted(set(solvers) - set(SOLVERS))} (opciones: {','.join(SOLVERS)}).")
+    params = {'search_seconds': args.search_seconds, 'speed_kmh': args.speed_kmh,
+              'unserved_penalty': args.unserved_penalty, 'sparse_k': args.sparse_k,
+              'sparse_min_nodes': args.sparse_min_nodes}
+    run_id = datetime.now().isoformat(timespec="seconds")
+
+    rows = []
+    for n in sizes:
+        for tight in tights:
+            for rr in refrigs:
+                seed = args.seed + n
+                orders = make_instance(suc, n, tight, rr, seed)
+                fleet = make_fleet(vehicles, n)
+                for solver in solvers:
+                    row = run_isolated((solver, orders, fleet, params))
+                    row.update(run_id=run_id, tightness=tight, refrig_ratio=rr, seed=seed,
+                               search_seconds=args.search_seconds)
+                    rows.append(row)
+                    print(f"[BENCH] {case_key(row)}: {row['status']} matriz {row.get('matrix_s')}s, "
+                          f"modelo {row.get('model_s')}s, 1ra sol {row.get('first_solution_s')}s, "
+                          f"obj {row.get('objective')}, sin atender {row.get('unserved')}, "
+                          f"RSS {row['peak_rss_mb']} MB")
+
+    append_history(rows, args.history)
+    with open(LAST_PATH, "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2, ensure_ascii=False)
+    print(f"OK -> {args.history} (+{len(rows)} filas) y {LAST_PATH}")
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update({case_key(r): r for r in rows})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False, sort_keys=True)
+        print(f"OK -> baseline actualizado ({args.baseline}, {len(baseline)} casos)")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"[INFO] No existe {args.baseline}; usá --update_baseline 1 para crearlo.")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions, missing = compare(rows, baseline, args.threshold)
+    for key in missing:
+        print(f"[SIN BASELINE] {key}: no se compara (usá --update_baseline 1 para agregarlo)")
+    for key, m, b, c, rel in regressions:
+        extra = f" (+{rel:.0%})" if rel is not None else ""
+        print(f"[REGRESION] {key} {m}: {b} -> {c}{extra}")
+    if regressions:
+        return 1
+    print(f"[OK] Sin regresiones contra {args.baseline} (umbral {args.threshold:.0%}, "
+          f"{len(rows) - len(missing)}/{len(rows)} casos comparados).")
+    return 0
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=str, default="30,100,300,1000,3000", help="cantidades de pedidos")
+    ap.add_argument("--tightness", type=str, default="loose,tight", help="ajuste de ventanas: loose, medium, tight")
+    ap.add_argument("--refrig", type=str, default="0,0.15", help="proporciones de pedidos refrigerados")
+    ap.add_argument("--solvers", type=str, default=",".join(DEFAULT_SOLVERS),
+                    help=f"de {','.join(SOLVERS)} (fixed no tiene baseline)")
+    ap.add_argument("--search_seconds", type=int, default=30, help="tiempo de búsqueda por corrida")
+    ap.add_argument("--speed_kmh", type=float, default=30.0)
+    ap.add_argument("--unserved_penalty", type=int, default=100_000, help="penalización base por pedido sin atender (soft)")
+    ap.add_argument("--sparse_k", type=int, default=0, help="soft: k vecinos, solo restringe la búsqueda (0 = todos los arcos)")
+    ap.add_argument("--sparse_min_nodes", type=int, default=1000)
+    ap.add_argument("--seed", type=int, default=123)
+    ap.add_argument("--sucursales", type=str, default="sucursales.csv")
+    ap.add_argument("--vehicles", type=str, default="vehicles.csv")
+    ap.add_argument("--center_lat", type=float, default=-34.6037)
+    ap.add_argument("--center_lon", type=float, default=-58.3816)
+    ap.add_argument("--radius_km", type=float, default=60.0, help="solo sucursales a esta distancia del centro")
+    ap.add_argument("--history", type=str, default=HISTORY_PATH)
+    ap.add_argument("--baseline", type=str, default=BASELINE_PATH)
+    ap.add_argument("--threshold", type=float, default=0.25, help="empeoramiento relativo tolerado")
+    ap.add_argument("--update_baseline", type=int, default=0, help="1 = guardar esta corrida como baseline")
+    raise SystemExit(main(ap.parse_args()))
@@ -0,0 +1,239 @@
+"""
+vrp_decompose.py
+Descomposición "cluster-first, route-second" para carteras grandes de pedidos.
+1) Agrupa pedidos por geografía (pickup y drop) y centro de ventana horaria con k-means
+2) Reparte la flota entre clusters según demanda kg (los refrigerados van primero a clusters con frío);
+   pedidos con frío en clusters sin vehículo refrigerado pasan al cluster con frío más cercano
+3) Resuelve cada cluster con el modelo de vrp_advanced_soft.py en procesos paralelos
+4) Reparación: un cluster sin solución se fusiona con el vecino más cercano (pedidos + vehículos)
+   y se re-resuelve
+5) Pasada de bordes (--boundary_seconds > 0): los clusters se emparejan con su vecino más cercano
+   (centros de k-means) y las rutas de cada par se post-optimizan juntas con route_postopt
+   (relocate de pares P&D y 2-opt* entre rutas de los dos clusters, más 2-opt/or-opt). Si el costo
+   baja, el par queda como un solo grupo con las rutas mejoradas
+6) Une todo en routes_plan_advanced.csv / stops_plan_advanced.csv (mismo esquema) + decompose_summary.csv
+
+Todos los clusters comparten depot (centroide global de pickups) y base temporal,
+así los minutos de llegada son comparables entre clusters.
+
+Uso:
+  pip install scikit-learn
+  python vrp_decompose.py --orders_per_cluster 150 --workers 8 --search_seconds 120 --boundary_seconds 10
+"""
+import argparse, math, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+import vrp_advanced_soft as soft
+
+def order_features(orders, day0, time_weight_km=5.0):
+    """Pickup/drop en km aproximados + centro de ventana (1 hora = time_weight_km)."""
+    lat0 = float(orders['pickup_lat'].mean())
+    ky, kx = 110.57, 111.32 * math.cos(math.radians(lat0))
+    mid_h = []
+    for ws, we in zip(orders['window_start'], orders['window_end']):
+        s, _ = soft.iso_to_minutes_since_start(ws, day0)
+        e, _ = soft.iso_to_minutes_since_start(we, day0)
+        mid_h.append((s + e) / 120.0)
+    return np.column_stack([
+        orders['pickup_lat'].to_numpy(float) * ky, orders['pickup_lon'].to_numpy(float) * kx,
+        orders['dropoff_lat'].to_numpy(float) * ky, orders['dropoff_lon'].to_numpy(float) * kx,
+        np.asarray(mid_h) * time_weight_km,
+    ])
+
+def cluster_orders(orders, n_clusters, day0, time_weight_km=5.0, seed=42):
+    """(etiquetas, centros). A lo sumo un cluster por pedido: la cantidad efectiva es len(centros)."""
+    X = order_features(orders, day0, time_weight_km)
+    n_clusters = min(n_clusters, len(orders))
+    if n_clusters <= 1:
+        return np.zeros(len(orders), dtype=int), X.mean(axis=0, keepdims=True)
+    km = KMeans(n_clusters=n_clusters, n_init=10, random_state=seed).fit(X)
+    return km.labels_, km.cluster_centers_
+
+def assign_vehicles(orders, labels, vehicles, n_clusters):
+    """Vehículo -> cluster. Cada cluster recibe al menos uno; el resto va al de mayor déficit de kg."""
+    demand = np.array([orders.loc[labels == c, 'weight_kg'].sum() for c in range(n_clusters)], dtype=float)
+    refrig_need = np.array([orders.loc[labels == c, 'refrigerated_required'].sum()
+                            if 'refrigerated_required' in orders.columns else 0 for c in range(n_clusters)])
+    caps = vehicles['capacity_kg'].to_numpy(float)
+    is_ref = vehicles['refrigerated'].to_numpy(int) == 1
+    order_v = sorted(range(len(vehicles)), key=lambda v: (not is_ref[v], -caps[v]))
+    assigned_cap = np.zeros(n_clusters)
+    owner = {}
+    pending = list(order_v)
+
+    # 1) Refrigerados a clusters con pedidos de frío (más demanda primero)
+    for c in np.argsort(-refrig_need):
+        if refrig_need[c] == 0:
+            break
+        v = next((v for v in pending if is_ref[v]), None)
+        if v is None:
+            break
+        owner[v] = int(c); assigned_cap[c] += caps[v]; pending.remove(v)
+    # 2) Al menos un vehículo por cluster
+    for c in range(n_clusters):
+        if c not in owner.values() and pending:
+            v = pending.pop(0)
+            owner[v] = c; assigned_cap[c] += caps[v]
+    # 3) Resto: al cluster con mayor déficit relativo
+    for v in pending:
+        c = int(np.argmax((demand - assigned_cap) / np.maximum(demand, 1.0)))
+        owner[v] = c; assigned_cap[c] += caps[v]
+    return np.array([owner[v] for v in range(len(vehicles))])
+
+def move_refrigerated(orders, labels, centers, vehicles, veh_owner, day0):
+    """Pedidos con frío en clusters sin vehículo refrigerado pasan al cluster con frío más cercano."""
+    if 'refrigerated_required' not in orders.columns:
+        return labels
+    ref_clusters = sorted(set(veh_owner[vehicles['refrigerated'].to_numpy(int) == 1].tolist()))
+    if not ref_clusters:
+        return labels
+    labels = labels.copy()
+    X = order_features(orders, day0)[:, :4]
+    for i in np.flatnonzero(orders['refrigerated_required'].to_numpy(int) == 1):
+        if labels[i] not in ref_clusters:
+            labels[i] = min(ref_clusters, key=lambda c: np.linalg.norm(centers[c, :4] - X[i]))
+    return labels
+
+def _solve_cluster(task):
+    cid, data, params = task
+    result = soft.solve(data, params['late_penalty'], params['early_penalty'], params['search_seconds'])
+    return cid, result
+
+def solve_clusters(groups, params, workers):
+    """groups: {cid: data}. Devuelve {cid: resultado o None}."""
+    tasks = [(cid, data, params) for cid, data in groups.items()]
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(tasks)))) as pool:
+        return dict(pool.map(_solve_cluster, tasks))
+
+def repair_boundaries(groups, datas, results, centers, prepare, params, seconds):
+    """Post-optimiza las rutas de pares de clusters vecinos (cada cluster en a lo sumo un par).
+    Los pares que mejoran se fusionan en groups/datas/results. Devuelve la cantidad de pares fusionados."""
+    from insertion_heuristic import routes_result
+    from route_postopt import PdProblem, improve
+    from warm_start import routes_from_stops_plan
+    cids = sorted(groups)
+    pairs = sorted((float(np.linalg.norm(centers[a, :4] - centers[b, :4])), a, b)
+                   for i, a in enumerate(cids) for b in cids[i + 1:])
+    used, merged = set(), 0
+    for _, a, b in pairs:
+        if a in used or b in used:
+            continue
+        used.update((a, b))
+        members = np.concatenate([groups[a][0], groups[b][0]])
+        veh_ids = np.concatenate([groups[a][1], groups[b][1]])
+        data = prepare(members, veh_ids)
+        stops = pd.concat([soft.plan_frames(datas[c], results[c])[1] for c in (a, b)], ignore_index=True)
+        routes, _ = routes_from_stops_plan(data, stops)
+        pb = PdProblem(data, routes, params['late_penalty'], params['early_penalty'])
+        stats = improve(pb, seconds, verbose=False)
+        if stats['after'] >= stats['before']:
+            continue
+        moves = ", ".join(f"{m} {n}" for m, n in stats['moves'].items())
+        print(f"[DECOMP] Borde {a}-{b}: costo {stats['before']} -> {stats['after']} ({moves}); se unen")
+        result = routes_result(data, pb.routes, params['late_penalty'])
+        result['objective'] = stats['after']
+        groups[a], datas[a], results[a] = (members, veh_ids), data, result
+        del groups[b], datas[b], results[b]
+        merged += 1
+    return merged
+
+def main(args):
+    started = time.time()
+    orders, vehicles = soft.load_inputs()
+    _, day0 = soft.iso_to_minutes_since_start(orders['window_start'].iloc[0])
+    depot = (float(orders['pickup_lat'].mean()), float(orders['pickup_lon'].mean()))
+
+    k = args.clusters or math.ceil(len(orders) / max(1, args.orders_per_cluster))
+    k = max(1, min(k, len(vehicles), len(orders)))
+    labels, centers = cluster_orders(orders, k, day0, args.time_weight_km)
+    k = len(centers)
+    veh_owner = assign_vehicles(orders, labels, vehicles, k)
+    if not args.ignore_refrigerated:
+        labels = move_refrigerated(orders, labels, centers, vehicles, veh_owner, day0)
+    print(f"[DECOMP] {len(orders)} pedidos -> {k} clusters, {len(vehicles)} vehículos")
+
+    def prepare(members, veh_ids):
+        return soft.prepare_data(orders.loc[members].reset_index(drop=True),
+                                 vehicles.loc[veh_ids].reset_index(drop=True),
+                                 args.speed_kmh, bool(args.ignore_refrigerated), args.distance_method,
+                                 args.matrix_cache, depot=depot, day0=day0)
+
+    # Grupos vivos: cid -> (índices de pedidos, índices de vehículos)
+    groups = {c: (np.flatnonzero(labels == c), np.flatnonzero(veh_owner == c)) for c in range(k)}
+    params = {'late_penalty': args.late_penalty, 'early_penalty': args.early_penalty,
+              'search_seconds': args.search_seconds}
+    datas = {c: prepare(*groups[c]) for c in groups}
+    results = solve_clusters(datas, params, args.workers)
+
+    # Reparación: fusionar clusters fallidos con el vecino más cercano y re-resolver
+    for _ in range(k):
+        failed = [c for c in groups if results.get(c) is None]
+        if not failed or len(groups) == 1:
+            break
+        retry = {}
+        for c in failed:
+            if c not in groups:
+                continue
+            others = [o for o in groups if o != c and o not in retry]
+            if not others:
+                continue
+            near = min(others, key=lambda o: np.linalg.norm(centers[o, :4] - centers[c, :4]))
+            print(f"[DECOMP] Cluster {c} sin solución: se fusiona con {near} y se re-resuelve")
+            members = np.concatenate([groups[near][0], groups[c][0]])
+            veh_ids = np.concatenate([groups[near][1], groups[c][1]])
+            groups[near] = (members, veh_ids)
+            del groups[c]
+            results.pop(c, None)
+            retry[near] = prepare(members, veh_ids)
+            datas[near] = retry[near]
+        if not retry:
+            break
+        results.update(solve_clusters(retry, params, args.workers))
+
+    failed = [c for c in groups if results.get(c) is None]
+    if failed:
+        sys.exit(f"No se encontró solución para {len(failed)} cluster(s) (soft). Revisa capacidades o coordenadas.")
+
+    if args.boundary_seconds > 0 and len(groups) > 1:
+        merged = repair_boundaries(groups, datas, results, centers, prepare, params, args.boundary_seconds)
+        print(f"[DECOMP] Pasada de bordes: {merged} par(es) de clusters mejorados")
+
+    # Unión en el esquema original (vehículos en el orden de vehicles.csv)
+    routes_parts, stops_parts, summary = [], [], []
+    for c in sorted(groups):
+        r_df, s_df = soft.plan_frames(datas[c], results[c])
+        routes_parts.append(r_df); stops_parts.append(s_df)
+        summary.append({'cluster': c, 'orders': len(groups[c][0]), 'vehicles': len(groups[c][1]),
+                        'objective': results[c]['objective'],
+                        'total_km': round(float(r_df['total_distance_km'].sum()), 2)})
+    veh_rank = {vid: i for i, vid in enumerate(vehicles['vehicle_id'])}
+    routes_df = pd.concat(routes_parts, ignore_index=True)
+    routes_df = routes_df.sort_values('vehicle_id', key=lambda s: s.map(veh_rank), kind="stable")
+    stops_df = pd.concat(stops_parts, ignore_index=True)
+    stops_df = stops_df.sort_values('vehicle_id', key=lambda s: s.map(veh_rank), kind="stable")
+    routes_df.to_csv("routes_plan_advanced.csv", index=False)
+    stops_df.to_csv("stops_plan_advanced.csv", index=False)
+    pd.DataFrame(summary).to_csv("decompose_summary.csv", index=False)
+    total = sum(r['objective'] for r in summary)
+    print(pd.DataFrame(summary).to_string(index=False))
+    print(f"OK -> routes_plan_advanced.csv y stops_plan_advanced.csv generados ({len(groups)} clusters, "
+          f"objetivo total {total}, {time.time() - started:.1f}s)")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clusters", type=int, default=0, help="cantidad de clusters (0 = según --orders_per_cluster)")
+    ap.add_argument("--orders_per_cluster", type=int, default=150)
+    ap.add_argument("--time_weight_km", type=float, default=5.0, help="peso de 1 hora de ventana, en km")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--speed_kmh", type=float, default=50.0)
+    ap.add_argument("--late_penalty", type=float, default=6.0)
+    ap.add_argument("--early_penalty", type=float, default=1.0)
+    ap.add_argument("--ignore_refrigerated", type=int, default=0)
+    ap.add_argument("--search_seconds", type=int, default=120, help="tiempo de búsqueda por cluster")
+    ap.add_argument("--boundary_seconds", type=float, default=10.0,
+                    help="post-optimización por par de clusters vecinos (0 = sin pasada de bordes)")
+    ap.add_argument("--distance_method", choices=["haversine", "ellipsoidal"], default="haversine")
+    ap.add_argument("--matrix_cache", type=str, default=".matrix_cache", help="directorio del caché de distancias ('' = desactivar)")
+    main(ap.parse_args())
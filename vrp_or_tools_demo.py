@@ -1,110 +1,137 @@
-
 """
 VRP con OR-Tools (demo) usando los datos sintéticos.
 - Lee vehicles.csv y orders.csv
 - Construye un VRP simple (solo dropoffs) con capacidad por peso_kg
 - Devuelve rutas_plan.csv con la secuencia de visitas por vehículo
 Requisitos:
-    pip install ortools pandas geopy
+    pip install ortools pandas numpy
 Ejecutar:
     python vrp_or_tools_demo.py
+Desde Python (p. ej. vrp_pipeline.py):
+    data = prepare_data(orders, vehicles)      # o dist_matrix=... ya calculada
+    rows = solve(data)
 """
+import time
 import pandas as pd
-import math
-from geopy.distance import geodesic
 from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+from distance_matrix import meters_matrix
+from solve_telemetry import watch_solutions
 
 VEH_PATH = "vehicles.csv"
 ORD_PATH = "orders.csv"
 OUT_PATH = "routes_plan.csv"
-
-# 1) Cargar datos
-vehicles = pd.read_csv(VEH_PATH)
-orders = pd.read_csv(ORD_PATH)
-
-# Usamos SOLO los dropoffs para el VRP (MVP). Luego podés extender a Pickup&Delivery.
-stops = orders[['order_id', 'dropoff_lat', 'dropoff_lon', 'weight_kg']].copy()
-stops.rename(columns={'dropoff_lat':'lat', 'dropoff_lon':'lon', 'weight_kg':'demand'}, inplace=True)
-
-# Definimos un "depósito" como el centroide de los dropoffs (o una dirección propia)
-depot_lat = stops['lat'].mean()
-depot_lon = stops['lon'].mean()
-
-# Construimos lista de nodos: [depot] + stops
-nodes = [{'id': 'DEPOT', 'lat': depot_lat, 'lon': depot_lon, 'demand': 0}]
-for _, r in stops.iterrows():
-    nodes.append({'id': r['order_id'], 'lat': r['lat'], 'lon': r['lon'], 'demand': int(max(0, r['demand']))})
-
-N = len(nodes)
-
-# 2) Matriz de distancia (en metros) aprox con geodesic
-def dist_m(i, j):
-    if i == j: return 0
-    return int(geodesic((nodes[i]['lat'], nodes[i]['lon']), (nodes[j]['lat'], nodes[j]['lon'])).km * 1000)
-
-dist_matrix = [[dist_m(i, j) for j in range(N)] for i in range(N)]
-
-# 3) Capacidades por vehículo (en kg)
-caps = [int(c) for c in vehicles['capacity_kg'].tolist()]
-n_veh = len(caps)
-
-# 4) OR-Tools setup
-manager = pywrapcp.RoutingIndexManager(N, n_veh, 0)  # 0 es el índice del depósito
-routing = pywrapcp.RoutingModel(manager)
-
-# Distancia
-def transit_cb(from_i, to_i):
-    f = manager.IndexToNode(from_i)
-    t = manager.IndexToNode(to_i)
-    return dist_matrix[f][t]
-transit_idx = routing.RegisterTransitCallback(transit_cb)
-routing.SetArcCostEvaluatorOfAllVehicles(transit_idx)
-
-# Dimensión de distancia (opcional, si querés limitar km por vehículo)
-routing.AddDimension(
-    transit_idx, 0, 2_000_000, True, "Distance"
-)
-
-# Demandas/capacidad
-def demand_cb(index):
-    node = manager.IndexToNode(index)
-    return int(nodes[node]['demand'])
-demand_idx = routing.RegisterUnaryTransitCallback(demand_cb)
-routing.AddDimensionWithVehicleCapacity(demand_idx, 0, caps, True, "Capacity")
-
-# Búsqueda
-search_params = pywrapcp.DefaultRoutingSearchParameters()
-search_params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-search_params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
-search_params.time_limit.FromSeconds(20)
-
-solution = routing.SolveWithParameters(search_params)
-if solution is None:
-    raise SystemExit("No se encontró solución. Probá reducir demandas o aumentar capacidades.")
-
-# 5) Exportar rutas
-rows = []
-for v in range(n_veh):
-    idx = routing.Start(v)
-    seq = []
-    load = 0
-    dist = 0
-    while not routing.IsEnd(idx):
-        node = manager.IndexToNode(idx)
-        seq.append(nodes[node]['id'])
-        load += nodes[node]['demand']
-        nxt = solution.Value(routing.NextVar(idx))
-        dist += routing.GetArcCostForVehicle(idx, nxt, v)
-        idx = nxt
-    seq.append('DEPOT')
-    rows.append({
-        'vehicle_id': vehicles.iloc[v]['vehicle_id'],
-        'vehicle_type': vehicles.iloc[v]['type'],
-        'capacity_kg': vehicles.iloc[v]['capacity_kg'],
-        'route_sequence': " -> ".join(seq),
-        'total_distance_km': round(dist/1000, 2),
-        'total_load_kg': int(load)
-    })
-
-pd.DataFrame(rows).to_csv(OUT_PATH, index=False)
-print(f"OK. Rutas exportadas a {OUT_PATH}")
+DIST_METHOD = "haversine"  # o "ellipsoidal"
+
+def build_nodes(orders):
+    # Usamos SOLO los dropoffs para el VRP (MVP). Luego podés extender a Pickup&Delivery.
+    stops = orders[['order_id', 'dropoff_lat', 'dropoff_lon', 'weight_kg']].copy()
+    stops.rename(columns={'dropoff_lat':'lat', 'dropoff_lon':'lon', 'weight_kg':'demand'}, inplace=True)
+
+    # Definimos un "depósito" como el centroide de los dropoffs (o una dirección propia)
+    depot_lat = stops['lat'].mean()
+    depot_lon = stops['lon'].mean()
+
+    # Construimos lista de nodos: [depot] + stops
+    nodes = [{'id': 'DEPOT', 'lat': depot_lat, 'lon': depot_lon, 'demand': 0}]
+    for _, r in stops.iterrows():
+        nodes.append({'id': r['order_id'], 'lat': r['lat'], 'lon': r['lon'], 'demand': int(max(0, r['demand']))})
+    return nodes
+
+def prepare_data(orders, vehicles, dist_matrix=None):
+    """Nodos + matriz en metros (int) + flota. dist_matrix permite reutilizar una matriz ya armada."""
+    nodes = build_nodes(orders)
+    # Matriz de distancia (en metros), vectorizada
+    if dist_matrix is None:
+        dist_matrix = meters_matrix([n['lat'] for n in nodes], [n['lon'] for n in nodes], method=DIST_METHOD)
+    return {'nodes': nodes, 'dist_matrix': dist_matrix, 'vehicles': vehicles.reset_index(drop=True)}
+
+def solve(data, search_seconds=20, stats=None):
+    """Resuelve el VRP simple. Devuelve las filas de routes_plan.csv o None si no hay solución.
+    stats (dict opcional): se completa con model_s, first_solution_s, solutions y objective (benchmarks)."""
+    t0 = time.perf_counter()
+    nodes, dist_matrix, vehicles = data['nodes'], data['dist_matrix'], data['vehicles']
+    N = len(nodes)
+
+    # Capacidades por vehículo (en kg)
+    caps = [int(c) for c in vehicles['capacity_kg'].tolist()]
+    n_veh = len(caps)
+
+    # OR-Tools setup
+    manager = pywrapcp.RoutingIndexManager(N, n_veh, 0)  # 0 es el índice del depósito
+    routing = pywrapcp.RoutingModel(manager)
+
+    # Distancia
+    def transit_cb(from_i, to_i):
+        f = manager.IndexToNode(from_i)
+        t = manager.IndexToNode(to_i)
+        return int(dist_matrix[f, t])
+    transit_idx = routing.RegisterTransitCallback(transit_cb)
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_idx)
+
+    # Dimensión de distancia (opcional, si querés limitar km por vehículo)
+    routing.AddDimension(
+        transit_idx, 0, 2_000_000, True, "Distance"
+    )
+
+    # Demandas/capacidad
+    def demand_cb(index):
+        node = manager.IndexToNode(index)
+        return int(nodes[node]['demand'])
+    demand_idx = routing.RegisterUnaryTransitCallback(demand_cb)
+    routing.AddDimensionWithVehicleCapacity(demand_idx, 0, caps, True, "Capacity")
+
+    # Búsqueda
+    search_params = pywrapcp.DefaultRoutingSearchParameters()
+    search_params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+    search_params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+    search_params.time_limit.FromSeconds(int(search_seconds))
+
+    if stats is not None:
+        watch_solutions(routing, stats, t0)
+
+    solution = routing.SolveWithParameters(search_params)
+    if solution is None:
+        return None
+    if stats is not None:
+        stats['objective'] = int(solution.ObjectiveValue())
+
+    # Rutas
+    rows = []
+    for v in range(n_veh):
+        idx = routing.Start(v)
+        seq = []
+        load = 0
+        dist = 0
+        while not routing.IsEnd(idx):
+            node = manager.IndexToNode(idx)
+            seq.append(nodes[node]['id'])
+            load += nodes[node]['demand']
+            nxt = solution.Value(routing.NextVar(idx))
+            dist += routing.GetArcCostForVehicle(idx, nxt, v)
+            idx = nxt
+        seq.append('DEPOT')
+        rows.append({
+            'vehicle_id': vehicles.iloc[v]['vehicle_id'],
+            'vehicle_type': vehicles.iloc[v]['type'],
+            'capacity_kg': vehicles.iloc[v]['capacity_kg'],
+            'route_sequence': " -> ".join(seq),
+            'total_distance_km': round(dist/1000, 2),
+            'total_load_kg': int(load)
+        })
+    return rows
+
+def main():
+    # 1) Cargar datos
+    vehicles = pd.read_csv(VEH_PATH)
+    orders = pd.read_csv(ORD_PATH)
+
+    rows = solve(prepare_data(orders, vehicles))
+    if rows is None:
+        raise SystemExit("No se encontró solución. Probá reducir demandas o aumentar capacidades.")
+
+    # Exportar rutas
+    pd.DataFrame(rows).to_csv(OUT_PATH, index=False)
+    print(f"OK. Rutas exportadas a {OUT_PATH}")
+
+if __name__ == "__main__":
+    main()
@@ -6,39 +6,53 @@ Orden:
   2) Si falla: relaja pedidos (ventanas y requisitos) y reintenta
   3) Si aún falla: VRP simple (vrp_or_tools_demo.py)
 
+Todo corre en el mismo proceso: orders/vehicles se leen una vez y la matriz de distancias
+se arma una sola vez y se reutiliza en cada etapa (relajar ventanas no cambia coordenadas y
+el VRP simple usa la sub-matriz de drops). orders.csv nunca se modifica.
+
+Modo --single_solve 1: una sola búsqueda con vrp_advanced_soft.py donde cada pedido puede quedar
+sin atender pagando una penalización según priority; siempre deja plan + unserved_orders.csv.
+
+Los planes quedan en .solve_cache/ (solve_cache.py), direccionados por el contenido de orders/vehicles,
+los parámetros y la versión del solver: re-correr con las mismas entradas restaura los CSV al instante.
+--bypass_cache 1 fuerza una nueva búsqueda; --solve_cache '' lo desactiva.
+
 Uso:
   python vrp_pipeline.py --speed_kmh 32
+  python vrp_pipeline.py --speed_kmh 32 --single_solve 1 --unserved_penalty 100000
+  python vrp_pipeline.py --speed_kmh 32 --profile 1    # trace JSON por etapa en traces/
+Desde Python:
+  from vrp_pipeline import run_pipeline
+  result = run_pipeline(orders, vehicles, speed_kmh=32)
 Requisitos:
   vehicles.csv, costs.json y orders.csv (o sucursales -> generate_orders_from_sucursales.py)
 """
-import argparse, os, sys, shutil, subprocess
+import argparse, os, sys
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 from dateutil import parser as dtp
+import vrp_advanced_fixed as fixed
+import vrp_advanced_soft as soft
+import vrp_or_tools_demo as demo
+from distance_matrix import distance_km
+from profiling import span
+import profiling
 
-def run(cmd: list[str]) -> bool:
-    print(">>", " ".join(cmd))
-    proc = subprocess.run(cmd, text=True)
-    return proc.returncode == 0
-
-def exists_nonempty(path: str) -> bool:
-    return os.path.exists(path) and os.path.getsize(path) > 0
-
-def relax_orders(in_path="orders.csv", out_path="orders_relaxed.csv"):
-    """Relaja ventanas y requisitos básicos para hacer factible el VRP (no pisa tu orders.csv)."""
-    if not os.path.exists(in_path):
-        print(f"[RELAX] No existe {in_path}")
-        return False
-    df = pd.read_csv(in_path)
-    if "window_start" not in df.columns or "window_end" not in df.columns:
-        print("[RELAX] No encuentro window_start/window_end en orders.csv")
-        return False
-
+def relax_orders_df(df, vehicles=None):
+    """Relaja ventanas y requisitos básicos para hacer factible el VRP. Devuelve una copia."""
     # Ventana estándar 08:00–20:00 del mismo día de cada pedido
     def day0(ts):
         t = dtp.isoparse(str(ts))
         return datetime(t.year,t.month,t.day,0,0,tzinfo=t.tzinfo)
 
+    # Decidir una sola vez si hay algún vehículo refrigerado
+    try:
+        v = vehicles if vehicles is not None else pd.read_csv("vehicles.csv")
+        has_refrig = (v.get("refrigerated", pd.Series([0])).astype(int) == 1).any()
+    except Exception:
+        has_refrig = False
+
     out = df.copy()
     for i, r in out.iterrows():
         try:
@@ -59,56 +73,138 @@ def relax_orders(in_path="orders.csv", out_path="orders_relaxed.csv"):
 
         # Si hay refrigerated_required pero no hay vehículos refrigerados, lo apaga (solo para pruebas)
         if "refrigerated_required" in out.columns:
-            # Decidir si hay alguno refrigerado
-            try:
-                v = pd.read_csv("vehicles.csv")
-                has_refrig = (v.get("refrigerated", pd.Series([0])).astype(int) == 1).any()
-            except Exception:
-                has_refrig = False
             if int(r.get("refrigerated_required", 0)) == 1 and not has_refrig:
                 out.at[i,"refrigerated_required"] = 0
+    return out
 
+def relax_orders(in_path="orders.csv", out_path="orders_relaxed.csv"):
+    """Relaja ventanas y requisitos básicos para hacer factible el VRP (no pisa tu orders.csv)."""
+    if not os.path.exists(in_path):
+        print(f"[RELAX] No existe {in_path}")
+        return False
+    df = pd.read_csv(in_path)
+    if "window_start" not in df.columns or "window_end" not in df.columns:
+        print("[RELAX] No encuentro window_start/window_end en orders.csv")
+        return False
+    out = relax_orders_df(df)
     out.to_csv(out_path, index=False)
     print(f"[RELAX] Generado {out_path} ({len(out)} filas)")
     return True
 
-def main(speed_kmh: float) -> int:
+def drops_matrix_m(data):
+    """Matriz en metros del VRP simple (depot = centroide de drops + drops) a partir de la del P&D:
+    solo se calcula la fila del nuevo depot."""
+    nodes = data['nodes']
+    drops = [d for _, d in data['pd_pairs']]
+    lat = np.array([nodes[d]['lat'] for d in drops]); lon = np.array([nodes[d]['lon'] for d in drops])
+    n = len(drops) + 1
+    km = np.zeros((n, n), dtype=np.float32)
+    km[1:, 1:] = data['dist_km'][np.ix_(drops, drops)]
+    depot_row = distance_km([lat.mean()], [lon.mean()], lat, lon)[0] if len(drops) else []
+    km[0, 1:] = depot_row
+    km[1:, 0] = depot_row
+    return (km * 1000.0).astype(np.int32)
+
+def _try_advanced(data, label):
+    try:
+        result = fixed.solve(data)
+    except ValueError as e:
+        print(f"[WARN] {label}: {e}")
+        return None
+    if result is None:
+        print(f"[INFO] {label}: sin solución.")
+    return result
+
+def run_pipeline(orders, vehicles, speed_kmh=32.0):
+    """Corre las etapas en memoria. Devuelve ('advanced'|'relaxed'|'simple', archivos escritos) o None."""
+    # Matriz única para todas las etapas
+    with span("prepare_data"):
+        data = fixed.prepare_data(orders, vehicles, speed_kmh)
+
     # 1) Intento avanzado
-    ok = run([sys.executable, "vrp_advanced_fixed.py", "--speed_kmh", str(speed_kmh)])
-    if ok and exists_nonempty("stops_plan_advanced.csv"):
+    with span("advanced"):
+        result = _try_advanced(data, "VRP avanzado")
+    if result is not None:
+        fixed.export_plan(data, result)
         print("[OK] Plan avanzado generado (stops_plan_advanced.csv / routes_plan_advanced.csv).")
-        return 0
+        return "advanced", ["routes_plan_advanced.csv", "stops_plan_advanced.csv"]
 
-    # 2) Relajar y reintentar avanzado
-    print("[INFO] VRP avanzado falló o no generó archivos. Intentando relajar pedidos…")
-    if not relax_orders("orders.csv", "orders_relaxed.csv"):
+    # 2) Relajar y reintentar avanzado (mismas coordenadas -> mismas matrices)
+    print("[INFO] VRP avanzado falló. Intentando relajar pedidos…")
+    if "window_start" not in orders.columns or "window_end" not in orders.columns:
         print("[WARN] No se pudo relajar orders. Continuo al plan simple.")
     else:
-        # backup temporal
-        if os.path.exists("orders.csv"):
-            shutil.copyfile("orders.csv", "orders_backup.csv")
-        shutil.copyfile("orders_relaxed.csv", "orders.csv")
-        ok2 = run([sys.executable, "vrp_advanced_fixed.py", "--speed_kmh", str(speed_kmh)])
-        # restaurar
-        if os.path.exists("orders_backup.csv"):
-            shutil.copyfile("orders_backup.csv", "orders.csv")
-            os.remove("orders_backup.csv")
-        if ok2 and exists_nonempty("stops_plan_advanced.csv"):
+        with span("relax_orders"):
+            relaxed = relax_orders_df(orders, vehicles)
+            relaxed.to_csv("orders_relaxed.csv", index=False)
+        print(f"[RELAX] Generado orders_relaxed.csv ({len(relaxed)} filas)")
+        with span("advanced_relaxed"):
+            data_relaxed = fixed.prepare_data(relaxed, vehicles, speed_kmh,
+                                              matrices=(data['dist_km'], data['travel_min']))
+            result = _try_advanced(data_relaxed, "VRP avanzado (relajado)")
+        if result is not None:
+            fixed.export_plan(data_relaxed, result)
             print("[OK] Plan avanzado generado tras relajar pedidos.")
-            return 0
+            return "relaxed", ["routes_plan_advanced.csv", "stops_plan_advanced.csv"]
 
-    # 3) Fallback: plan simple
+    # 3) Fallback: plan simple sobre la sub-matriz de drops
     print("[INFO] Ejecutando VRP simple de respaldo…")
-    ok3 = run([sys.executable, "vrp_or_tools_demo.py"])
-    if ok3 and exists_nonempty("routes_plan.csv"):
-        print("[OK] Plan simple generado (routes_plan.csv).")
-        return 0
+    with span("simple"):
+        rows = demo.solve(demo.prepare_data(orders, vehicles, dist_matrix=drops_matrix_m(data)))
+    if rows is not None:
+        with span("export"):
+            pd.DataFrame(rows).to_csv(demo.OUT_PATH, index=False)
+        print(f"[OK] Plan simple generado ({demo.OUT_PATH}).")
+        return "simple", [demo.OUT_PATH]
+    return None
 
+def run_single(orders, vehicles, speed_kmh=32.0, unserved_penalty=100_000, search_seconds=60):
+    """Una sola búsqueda (soft + pedidos descartables). Devuelve ('single', archivos escritos) o None."""
+    data = soft.prepare_data(orders, vehicles, speed_kmh)
+    result = soft.solve(data, search_seconds=search_seconds, unserved_penalty=unserved_penalty)
+    if result is None:
+        return None
+    soft.export_plan(data, result, unserved_path="unserved_orders.csv", unserved_penalty=unserved_penalty)
+    print(f"[OK] Plan generado en una búsqueda ({len(result['unserved'])} pedidos sin atender -> unserved_orders.csv).")
+    return "single", ["routes_plan_advanced.csv", "stops_plan_advanced.csv", "unserved_orders.csv"]
+
+def main(speed_kmh: float, single_solve=False, unserved_penalty=100_000,
+         solve_cache=".solve_cache", bypass_cache=False) -> int:
+    with span("load_inputs"):
+        orders, vehicles = fixed.load_inputs()
+    cache = key = None
+    if solve_cache:
+        from solve_cache import SolveCache, cache_key, solver_version
+        import distance_matrix, matrix_cache
+        params = dict(solver="vrp_pipeline", single_solve=bool(single_solve), speed_kmh=speed_kmh,
+                      unserved_penalty=unserved_penalty if single_solve else None)
+        cache = SolveCache(solve_cache)
+        key = cache_key(orders, vehicles, params, solver_version(sys.modules[__name__], fixed, soft, demo,
+                                                                 distance_matrix, matrix_cache))
+        meta = None if bypass_cache else cache.restore(key)
+        if meta is not None:
+            print(f"[OK] Plan '{meta['label']}' restaurado del caché ({', '.join(meta['files'])}; {solve_cache}/{key}).")
+            return 0
+    if single_solve:
+        outcome = run_single(orders, vehicles, speed_kmh, unserved_penalty)
+    else:
+        outcome = run_pipeline(orders, vehicles, speed_kmh)
+    if outcome is not None:
+        if cache is not None:
+            cache.store(key, outcome[1], {'label': outcome[0]})
+        return 0
     print("[ERROR] No se pudo generar ningún plan. Revisa orders.csv y vehicles.csv.")
     return 1
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--speed_kmh", type=float, default=32.0)
+    ap.add_argument("--single_solve", type=int, default=0, help="1 = una búsqueda con pedidos descartables (sin cascada)")
+    ap.add_argument("--unserved_penalty", type=int, default=100_000, help="penalización base por pedido sin atender")
+    ap.add_argument("--profile", type=int, default=0, help="1 = trace JSON por etapa (o VRP_PROFILE=1)")
+    ap.add_argument("--solve_cache", type=str, default=".solve_cache", help="directorio del caché de planes ('' = desactivar)")
+    ap.add_argument("--bypass_cache", type=int, default=0, help="1 = resolver igual aunque el plan esté en caché (y refrescarlo)")
     args = ap.parse_args()
-    raise SystemExit(main(args.speed_kmh))
+    profiling.setup(args.profile, "vrp_pipeline")
+    raise SystemExit(main(args.speed_kmh, bool(args.single_solve), args.unserved_penalty,
+                          args.solve_cache, bool(args.bypass_cache)))
@@ -0,0 +1,123 @@
+"""
+vrp_portfolio.py
+Portfolio de búsquedas en paralelo sobre el mismo modelo de vrp_advanced_soft.py.
+- Los datos (nodos, matrices, flota) se preparan una sola vez y se envían una vez a cada worker
+- Cada worker prueba una combinación estrategia inicial + metaheurística
+- Todo corre bajo un único presupuesto de reloj (--search_seconds); si hay más combinaciones
+  que workers se ejecutan por tandas y el tiempo se reparte entre ellas
+- Se exporta el mejor plan (routes_plan_advanced.csv / stops_plan_advanced.csv)
+  y una tabla comparativa portfolio_comparison.csv
+
+Uso:
+  python vrp_portfolio.py --workers 8 --search_seconds 120 --speed_kmh 50
+  python vrp_portfolio.py --configs PATH_CHEAPEST_ARC:GUIDED_LOCAL_SEARCH,PARALLEL_CHEAPEST_INSERTION:TABU_SEARCH
+"""
+import argparse, math, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import vrp_advanced_soft as soft
+
+DEFAULT_CONFIGS = [
+    ("PATH_CHEAPEST_ARC", "GUIDED_LOCAL_SEARCH"),
+    ("PARALLEL_CHEAPEST_INSERTION", "GUIDED_LOCAL_SEARCH"),
+    ("LOCAL_CHEAPEST_INSERTION", "GUIDED_LOCAL_SEARCH"),
+    ("SEQUENTIAL_CHEAPEST_INSERTION", "GUIDED_LOCAL_SEARCH"),
+    ("GLOBAL_CHEAPEST_ARC", "GUIDED_LOCAL_SEARCH"),
+    ("PATH_CHEAPEST_ARC", "TABU_SEARCH"),
+    ("PARALLEL_CHEAPEST_INSERTION", "SIMULATED_ANNEALING"),
+    ("AUTOMATIC", "GENERIC_TABU_SEARCH"),
+]
+COLUMNS = ['first_solution', 'metaheuristic', 'search_seconds', 'status', 'wall_s', 'objective',
+           'vehicles_used', 'total_km', 'best']
+
+_DATA = None
+_PARAMS = None
+
+def _init_worker(data, params):
+    # Se recibe una vez por proceso (no por tarea)
+    global _DATA, _PARAMS
+    _DATA, _PARAMS = data, params
+
+def route_km(data, route):
+    return sum(float(data['dist_km'][a, b]) for a, b in zip(route[:-1], route[1:]))
+
+def _run_config(cfg):
+    first_solution, metaheuristic, seconds = cfg
+    t0 = time.time()
+    row = {'first_solution': first_solution, 'metaheuristic': metaheuristic, 'search_seconds': seconds}
+    try:
+        result = soft.solve(_DATA, _PARAMS['late_penalty'], _PARAMS['early_penalty'], seconds,
+                            first_solution=first_solution, metaheuristic=metaheuristic)
+    except Exception as e:
+        row.update(status=f"error: {e}", wall_s=round(time.time() - t0, 2))
+        return row, None
+    row['wall_s'] = round(time.time() - t0, 2)
+    if result is None:
+        row['status'] = "sin_solucion"
+        return row, None
+    row.update(status="ok", objective=result['objective'],
+               vehicles_used=sum(1 for r in result['routes'] if len(r) > 2),
+               total_km=round(sum(route_km(_DATA, r) for r in result['routes']), 2))
+    return row, result
+
+def parse_configs(text):
+    if not text:
+        return list(DEFAULT_CONFIGS)
+    out = []
+    for item in text.split(","):
+        fs, _, mh = item.strip().partition(":")
+        out.append((fs, mh or "GUIDED_LOCAL_SEARCH"))
+    return out
+
+def run_portfolio(data, configs, search_seconds, workers, late_penalty=6, early_penalty=1, started=None):
+    """Corre las combinaciones en un pool de procesos. Devuelve (tabla comparativa, mejor resultado)."""
+    started = time.time() if started is None else started
+    workers = max(1, min(workers, len(configs)))
+    waves = math.ceil(len(configs) / workers)
+    # Margen para arrancar procesos y exportar
+    remaining = max(1.0, search_seconds - (time.time() - started) - 2.0)
+    per_run = max(1, int(remaining // waves))
+    params = {'late_penalty': late_penalty, 'early_penalty': early_penalty}
+    tasks = [(fs, mh, per_run) for fs, mh in configs]
+    print(f"[PORTFOLIO] {len(configs)} combinaciones, {workers} workers, {waves} tanda(s) de {per_run}s")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data, params)) as pool:
+        outcomes = list(pool.map(_run_config, tasks))
+
+    rows = [row for row, _ in outcomes]
+    best_i = None
+    for i, (row, result) in enumerate(outcomes):
+        if result is not None and (best_i is None or result['objective'] < outcomes[best_i][1]['objective']):
+            best_i = i
+    for i, row in enumerate(rows):
+        row['best'] = int(i == best_i)
+    # Columnas explícitas: si ninguna combinación resuelve, igual existe 'objective' (todo NaN) para ordenar
+    table = pd.DataFrame(rows, columns=COLUMNS).sort_values('objective', na_position='last')
+    return table, (outcomes[best_i][1] if best_i is not None else None)
+
+def main(args):
+    started = time.time()
+    orders, vehicles = soft.load_inputs()
+    data = soft.prepare_data(orders, vehicles, args.speed_kmh, bool(args.ignore_refrigerated),
+                             args.distance_method, args.matrix_cache)
+    table, best = run_portfolio(data, parse_configs(args.configs), args.search_seconds, args.workers,
+                                args.late_penalty, args.early_penalty, started)
+    table.to_csv("portfolio_comparison.csv", index=False)
+    print(table.to_string(index=False))
+    if best is None:
+        sys.exit("Ninguna combinación encontró solución (soft). Revisa capacidades extremas o coordenadas.")
+    soft.export_plan(data, best)
+    print(f"OK -> routes_plan_advanced.csv, stops_plan_advanced.csv y portfolio_comparison.csv "
+          f"(mejor objetivo {best['objective']}, {time.time() - started:.1f}s)")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--configs", type=str, default="", help="lista ESTRATEGIA:METAHEURISTICA separada por comas")
+    ap.add_argument("--speed_kmh", type=float, default=50.0)
+    ap.add_argument("--late_penalty", type=float, default=6.0)
+    ap.add_argument("--early_penalty", type=float, default=1.0)
+    ap.add_argument("--ignore_refrigerated", type=int, default=0)
+    ap.add_argument("--search_seconds", type=int, default=120, help="presupuesto total de reloj")
+    ap.add_argument("--distance_method", choices=["haversine", "ellipsoidal"], default="haversine")
+    ap.add_argument("--matrix_cache", type=str, default=".matrix_cache", help="directorio del caché de distancias ('' = desactivar)")
+    main(ap.parse_args())
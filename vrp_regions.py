@@ -0,0 +1,246 @@
+"""
+vrp_regions.py
+Planificación multi-región (CABA, GBA Norte, GBA Sur, Rosario, ...) en procesos paralelos.
+- Cada pedido va a la región que contiene su pickup (cajas lat/lon, la primera que lo contiene gana);
+  los que no caen en ninguna van a la región de centro más cercano
+- Flota por región: columna 'region' de vehicles.csv si existe; si no, reparto por demanda kg
+  (vrp_decompose.assign_vehicles)
+- Los nodos se ordenan por región (depot de la región + pickup/drop de sus pedidos, igual que build_nodes),
+  así cada región es un bloque contiguo de la matriz completa
+- La matriz completa (km float32 + minutos int32) se calcula una sola vez, por bloques de filas, directo en
+  multiprocessing.shared_memory (leyendo/llenando .matrix_cache si está activo)
+- Los workers se adjuntan al segmento una vez por proceso y leen su sub-matriz [s:e, s:e] como vista
+  (sin copiar ni serializar la matriz); cada región se resuelve con el modelo de vrp_advanced_soft.py
+- Se une todo en routes_plan_advanced.csv / stops_plan_advanced.csv (mismo esquema) + regions_summary.csv
+
+Uso:
+  python vrp_regions.py --workers 4 --search_seconds 120
+  python vrp_regions.py --regions regiones.json --only CABA,Rosario
+regiones.json: {"CABA": [lat_min, lat_max, lon_min, lon_max], ...}
+"""
+import argparse, json, math, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import vrp_advanced_soft as soft
+from distance_matrix import BLOCK_ROWS, iter_distance_blocks, minutes_from_km
+
+# (lat_min, lat_max, lon_min, lon_max); el orden importa (CABA antes que los cordones del GBA)
+DEFAULT_REGIONS = {
+    "CABA": (-34.705, -34.527, -58.531, -58.335),
+    "GBA Norte": (-34.62, -34.20, -59.20, -58.20),
+    "GBA Sur": (-35.20, -34.62, -59.20, -57.80),
+    "Rosario": (-33.10, -32.80, -60.85, -60.55),
+}
+
+class SharedMatrices:
+    """dist_km (float32) y travel_min (int32) NxN en dos segmentos de multiprocessing.shared_memory."""
+    DTYPES = {'dist': np.float32, 'mins': np.int32}
+
+    def __init__(self, n, segments, owner):
+        self.n, self.segments, self.owner = n, segments, owner
+        self.arrays = {k: np.ndarray((n, n), dtype=self.DTYPES[k], buffer=seg.buf) for k, seg in segments.items()}
+
+    @classmethod
+    def create(cls, n):
+        segments = {k: shared_memory.SharedMemory(create=True, size=max(1, n * n * np.dtype(t).itemsize))
+                    for k, t in cls.DTYPES.items()}
+        return cls(n, segments, owner=True)
+
+    @classmethod
+    def attach(cls, spec):
+        segments = {k: shared_memory.SharedMemory(name=name) for k, name in spec['names'].items()}
+        return cls(spec['n'], segments, owner=False)
+
+    def spec(self):
+        """Lo mínimo para adjuntarse desde otro proceso (se serializa en lugar de la matriz)."""
+        return {'n': self.n, 'names': {k: seg.name for k, seg in self.segments.items()}}
+
+    def views(self, start, stop):
+        """Sub-matrices (dist_km, travel_min) del bloque [start:stop] sin copiar."""
+        return self.arrays['dist'][start:stop, start:stop], self.arrays['mins'][start:stop, start:stop]
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.arrays.values())
+
+    def close(self):
+        self.arrays = {}
+        for seg in self.segments.values():
+            seg.close()
+            if self.owner:
+                seg.unlink()
+
+def load_regions(path=""):
+    if not path:
+        return dict(DEFAULT_REGIONS)
+    with open(path, "r", encoding="utf-8") as f:
+        return {name: tuple(float(x) for x in box) for name, box in json.load(f).items()}
+
+def assign_regions(orders, regions):
+    """Nombre de región por pedido según su pickup."""
+    lat, lon = orders['pickup_lat'].to_numpy(float), orders['pickup_lon'].to_numpy(float)
+    names = list(regions)
+    boxes = np.array([regions[n] for n in names], dtype=float)
+    inside = ((lat[:, None] >= boxes[:, 0]) & (lat[:, None] <= boxes[:, 1]) &
+              (lon[:, None] >= boxes[:, 2]) & (lon[:, None] <= boxes[:, 3]))
+    c_lat, c_lon = boxes[:, :2].mean(axis=1), boxes[:, 2:].mean(axis=1)
+    nearest = np.argmin((lat[:, None] - c_lat) ** 2 + ((lon[:, None] - c_lon) * math.cos(math.radians(-34.0))) ** 2, axis=1)
+    outside = ~inside.any(axis=1)
+    if outside.any():
+        print(f"[WARN] {int(outside.sum())} pedidos fuera de toda región: se asignan a la de centro más cercano.")
+    return np.array(names, dtype=object)[np.where(outside, nearest, inside.argmax(axis=1))]
+
+def region_vehicles(orders, labels, vehicles, names):
+    """Nombre de región por vehículo."""
+    if 'region' in vehicles.columns:
+        return vehicles['region'].astype(str).str.strip().to_numpy(dtype=object)
+    from vrp_decompose import assign_vehicles
+    codes = np.array([names.index(x) for x in labels])
+    return np.array(names, dtype=object)[assign_vehicles(orders, codes, vehicles, len(names))]
+
+def layout(orders, labels, names, day0):
+    """Bloques contiguos por región: {región: (índices de pedidos, depot, inicio, fin)} + lat/lon de todos."""
+    blocks, lat, lon = {}, [], []
+    for name in names:
+        members = np.flatnonzero(labels == name)
+        sub = orders.iloc[members]
+        depot = (float(sub['pickup_lat'].mean()), float(sub['pickup_lon'].mean()))
+        nodes, _ = soft.build_nodes(sub, pickup_service_min=5, drop_service_min=5, depot=depot, day0=day0)
+        blocks[name] = (members, depot, len(lat), len(lat) + len(nodes))
+        lat += [n['lat'] for n in nodes]
+        lon += [n['lon'] for n in nodes]
+    return blocks, np.asarray(lat), np.asarray(lon)
+
+def fill_matrices(shared, lat, lon, speed_kmh, method="haversine", matrix_cache=".matrix_cache"):
+    """Escribe la matriz completa en memoria compartida por bloques de filas (sin una copia NxN extra)."""
+    dist, mins = shared.arrays['dist'], shared.arrays['mins']
+    if matrix_cache:
+        from matrix_cache import MatrixCache
+        cache = MatrixCache(matrix_cache, method=method)
+        idx = cache.indices(lat, lon)
+        for s in range(0, len(idx), BLOCK_ROWS):
+            e = min(len(idx), s + BLOCK_ROWS)
+            block = cache.block(idx[s:e], idx)
+            dist[s:e] = block
+            mins[s:e] = minutes_from_km(block, speed_kmh)
+        print(f"[CACHE] Matriz {len(idx)}x{len(idx)}: {cache.computed_rows} coordenadas nuevas calculadas ({matrix_cache}/{method}).")
+    else:
+        for s, e, block in iter_distance_blocks(lat, lon, method=method):
+            dist[s:e] = block
+            mins[s:e] = minutes_from_km(block, speed_kmh)
+
+# --- Lado worker ---
+_SHARED = None
+_ORDERS = _VEHICLES = _PARAMS = None
+
+def _init_worker(spec, orders, vehicles, params):
+    # Una vez por proceso: se adjunta al segmento y recibe pedidos/flota/parámetros
+    global _SHARED, _ORDERS, _VEHICLES, _PARAMS
+    _SHARED = SharedMatrices.attach(spec)
+    _ORDERS, _VEHICLES, _PARAMS = orders, vehicles, params
+
+def _solve_region(task):
+    name, members, veh_ids, depot, start, stop = task
+    p = _PARAMS
+    t0 = time.time()
+    data = soft.prepare_data(_ORDERS.iloc[members].reset_index(drop=True),
+                             _VEHICLES.iloc[veh_ids].reset_index(drop=True), p['speed_kmh'],
+                             p['ignore_refrig'], depot=depot, day0=p['day0'], matrices=_SHARED.views(start, stop))
+    result = soft.solve(data, p['late_penalty'], p['early_penalty'], p['search_seconds'],
+                        unserved_penalty=p['unserved_penalty'])
+    if result is None:
+        return name, None
+    routes_df, stops_df = soft.plan_frames(data, result)
+    return name, {'objective': result['objective'], 'routes': routes_df, 'stops': stops_df,
+                  'unserved': soft.unserved_frame(data, result, p['unserved_penalty']),
+                  'solve_s': round(time.time() - t0, 2)}
+
+def main(args):
+    started = time.time()
+    orders, vehicles = soft.load_inputs()
+    _, day0 = soft.iso_to_minutes_since_start(orders['window_start'].iloc[0])
+    regions = load_regions(args.regions)
+    labels = assign_regions(orders, regions)
+    names = [n for n in regions if (labels == n).any()]
+    if args.only:
+        wanted = [x.strip() for x in args.only.split(",") if x.strip()]
+        names = [n for n in names if n in wanted]
+    if not names:
+        sys.exit("Ninguna región con pedidos.")
+    keep = np.isin(labels, names)
+    orders, labels = orders[keep].reset_index(drop=True), labels[keep]
+    veh_region = region_vehicles(orders, labels, vehicles, names)
+    blocks, lat, lon = layout(orders, labels, names, day0)
+
+    tasks = []
+    for name in names:
+        members, depot, s, e = blocks[name]
+        veh_ids = np.flatnonzero(veh_region == name)
+        if len(veh_ids) == 0:
+            print(f"[WARN] Región {name} sin vehículos: se omiten sus {len(members)} pedidos.")
+            continue
+        tasks.append((name, members, veh_ids, depot, s, e))
+    if not tasks:
+        sys.exit("Ninguna región con vehículos: revisa la columna 'region' de vehicles.csv.")
+
+    shared = SharedMatrices.create(len(lat))
+    try:
+        t0 = time.time()
+        fill_matrices(shared, lat, lon, args.speed_kmh, args.distance_method, args.matrix_cache)
+        print(f"[REGIONS] Matriz {len(lat)}x{len(lat)} en memoria compartida ({shared.nbytes/1e6:.1f} MB, "
+              f"{time.time() - t0:.1f}s); {len(names)} regiones")
+
+        params = {'speed_kmh': args.speed_kmh, 'ignore_refrig': bool(args.ignore_refrigerated), 'day0': day0,
+                  'late_penalty': args.late_penalty, 'early_penalty': args.early_penalty,
+                  'search_seconds': args.search_seconds,
+                  'unserved_penalty': args.unserved_penalty if args.allow_unserved else 0}
+        workers = max(1, min(args.workers, len(tasks)))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shared.spec(), orders, vehicles, params)) as pool:
+            results = dict(pool.map(_solve_region, tasks))
+    finally:
+        shared.close()
+
+    failed = [name for name, r in results.items() if r is None]
+    if failed:
+        sys.exit(f"No se encontró solución para: {', '.join(failed)} (soft). Revisa capacidades o coordenadas.")
+
+    # Unión en el esquema original (vehículos en el orden de vehicles.csv)
+    summary = []
+    for name, members, veh_ids, _, s, e in tasks:
+        r = results[name]
+        summary.append({'region': name, 'orders': len(members), 'vehicles': len(veh_ids), 'nodes': e - s,
+                        'objective': r['objective'], 'unserved': len(r['unserved']),
+                        'total_km': round(float(r['routes']['total_distance_km'].sum()), 2), 'solve_s': r['solve_s']})
+    veh_rank = {vid: i for i, vid in enumerate(vehicles['vehicle_id'])}
+    routes_df = pd.concat([results[t[0]]['routes'] for t in tasks], ignore_index=True)
+    routes_df = routes_df.sort_values('vehicle_id', key=lambda s: s.map(veh_rank), kind="stable")
+    stops_df = pd.concat([results[t[0]]['stops'] for t in tasks], ignore_index=True)
+    stops_df = stops_df.sort_values('vehicle_id', key=lambda s: s.map(veh_rank), kind="stable")
+    routes_df.to_csv("routes_plan_advanced.csv", index=False)
+    stops_df.to_csv("stops_plan_advanced.csv", index=False)
+    if args.allow_unserved:
+        pd.concat([results[t[0]]['unserved'] for t in tasks], ignore_index=True).to_csv("unserved_orders.csv", index=False)
+    table = pd.DataFrame(summary)
+    table.to_csv("regions_summary.csv", index=False)
+    print(table.to_string(index=False))
+    print(f"OK -> routes_plan_advanced.csv, stops_plan_advanced.csv y regions_summary.csv generados "
+          f"({len(tasks)} regiones, objetivo total {int(table['objective'].sum())}, {time.time() - started:.1f}s)")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--regions", type=str, default="", help="JSON {región: [lat_min, lat_max, lon_min, lon_max]} ('' = CABA/GBA/Rosario)")
+    ap.add_argument("--only", type=str, default="", help="regiones a planificar, separadas por comas (default: todas)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--speed_kmh", type=float, default=50.0)
+    ap.add_argument("--late_penalty", type=float, default=6.0)
+    ap.add_argument("--early_penalty", type=float, default=1.0)
+    ap.add_argument("--ignore_refrigerated", type=int, default=0)
+    ap.add_argument("--search_seconds", type=int, default=120, help="tiempo de búsqueda por región")
+    ap.add_argument("--allow_unserved", type=int, default=0, help="1 = permitir pedidos sin atender")
+    ap.add_argument("--unserved_penalty", type=int, default=100_000)
+    ap.add_argument("--distance_method", choices=["haversine", "ellipsoidal"], default="haversine")
+    ap.add_argument("--matrix_cache", type=str, default=".matrix_cache", help="directorio del caché de distancias ('' = desactivar)")
+    main(ap.parse_args())
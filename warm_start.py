@@ -0,0 +1,96 @@
+"""
+warm_start.py
+Re-optimización incremental: usa el plan anterior (stops_plan_advanced.csv) como solución inicial.
+- Mapea cada parada del plan anterior (P_<order>/D_<order>) al nuevo conjunto de nodos
+- Descarta pedidos cancelados, pares partidos entre vehículos, drops antes del pickup,
+  vehículos que ya no existen o que no cumplen frío/capacidad
+- Los pedidos nuevos se agregan al final de la ruta donde cuestan menos (inserción barata),
+  así el modelo recibe una asignación completa y la búsqueda local parte de ahí
+
+Uso (desde vrp_advanced_soft.py):
+  python vrp_advanced_soft.py --warm_start stops_plan_advanced.csv --search_seconds 10
+"""
+import pandas as pd
+
+def routes_from_stops_plan(data, stops):
+    """Rutas por vehículo (índices de nodo, sin depot) a partir de un stops plan anterior."""
+    nodes, vehicles = data['nodes'], data['vehicles']
+    node_of = {n['node_id']: i for i, n in enumerate(nodes) if i > 0}
+    partner = {}
+    for p, d in data['pd_pairs']:
+        partner[p], partner[d] = d, p
+    veh_pos = {vid: v for v, vid in enumerate(vehicles['vehicle_id'])}
+    caps_kg = vehicles['capacity_kg'].to_numpy(float)
+    caps_m3 = vehicles['capacity_m3'].to_numpy(float)
+    refrig = vehicles['refrigerated'].to_numpy(int)
+
+    routes = [[] for _ in range(len(vehicles))]
+    stats = {'kept': 0, 'dropped': 0,
+             'cancelled': sum(1 for n in stops['stop_node'] if str(n).startswith('P_') and n not in node_of)}
+    for vid, g in stops.groupby('vehicle_id', sort=False):
+        v = veh_pos.get(vid)
+        seq = [node_of[n] for n in g['stop_node'] if n in node_of]
+        # Pedidos con algún nodo en la ruta (clave: índice del pickup); se cuentan por pedido
+        orders = {i if nodes[i]['type'] == 'pickup' else partner[i] for i in seq}
+        if v is None:
+            stats['dropped'] += len(orders)
+            continue
+        last_pos = {i: k for k, i in enumerate(seq)}
+        picked, delivered, load_kg, load_m3, route = set(), set(), 0.0, 0.0, []
+        for k, i in enumerate(seq):
+            n = nodes[i]
+            j = partner[i]
+            if n['type'] == 'pickup':
+                # El drop tiene que venir después en la misma ruta; si no, se descarta el par entero
+                ok = (last_pos.get(j, -1) > k and i not in picked
+                      and (data['ignore_refrig'] or not n['refrig_req'] or refrig[v] == 1 or not refrig.any())
+                      and load_kg + n['demand_kg'] <= caps_kg[v] and load_m3 + n['demand_m3'] <= caps_m3[v] + 1e-9)
+                if ok:
+                    picked.add(i)
+                    load_kg += n['demand_kg']; load_m3 += n['demand_m3']
+                    route.append(i)
+            elif j in picked and i not in delivered:
+                delivered.add(i)
+                load_kg += n['demand_kg']; load_m3 += n['demand_m3']
+                route.append(i)
+        stats['kept'] += len(picked)
+        stats['dropped'] += len(orders) - len(picked)
+        routes[v] = route
+    return routes, stats
+
+def complete_routes(data, routes):
+    """Agrega al final de alguna ruta cada par pickup/drop que no esté en la asignación."""
+    nodes, vehicles, dist = data['nodes'], data['vehicles'], data['travel_min']
+    caps_kg = vehicles['capacity_kg'].to_numpy(float)
+    caps_m3 = vehicles['capacity_m3'].to_numpy(float)
+    refrig = vehicles['refrigerated'].to_numpy(int)
+    assigned = {i for r in routes for i in r}
+    added = 0
+    for p, d in data['pd_pairs']:
+        if p in assigned:
+            continue
+        n = nodes[p]
+        best, best_cost = None, None
+        for v, r in enumerate(routes):
+            if n['refrig_req'] and not data['ignore_refrig'] and refrig[v] != 1 and refrig.any():
+                continue
+            # Al final de la ruta todos los pedidos anteriores ya se entregaron: solo cuenta este
+            if n['demand_kg'] > caps_kg[v] or n['demand_m3'] > caps_m3[v] + 1e-9:
+                continue
+            last = r[-1] if r else 0
+            cost = int(dist[last, p]) + int(dist[p, d]) + int(dist[d, 0]) - int(dist[last, 0])
+            if best_cost is None or cost < best_cost:
+                best, best_cost = v, cost
+        if best is not None:
+            routes[best] = routes[best] + [p, d]
+            added += 1
+    return routes, added
+
+def initial_routes_from_file(data, stops_path):
+    """Lee el plan anterior y devuelve rutas completas para el nuevo conjunto de nodos."""
+    stops = pd.read_csv(stops_path)
+    routes, stats = routes_from_stops_plan(data, stops)
+    routes, added = complete_routes(data, routes)
+    print(f"[WARM] Plan previo: {stats['kept']} pedidos reutilizados, {stats['cancelled']} cancelados, "
+          f"{stats['dropped']} descartados, {added} nuevos insertados.")
+    return routes